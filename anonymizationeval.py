@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import itertools
+import numpy
+import streamstore
+from arffgenerator import getNominalValues
+
+# instances whose records are linked together: an anonymized record is only
+#  compared with the original records of its window (the privacy filters
+#  only mix records within their buffers). 0 links against the whole stream
+windowSize = 10000
+
+# elements of the blocks of the distance matrix computed at once
+blockElements = 1 << 22
+
+# relative tolerance of the distances, for ties
+tolerance = 1e-9
+
+def getWindows(chunks, size):
+	'''
+	Regroups the chunks (one array per attribute) of a stream into windows of
+	`size` instances (all of them when `size` is 0); the last one may be shorter.
+	'''
+	pending = []
+	rows = 0
+	for columns in chunks:
+		pending.append(columns)
+		rows += len(columns[0])
+		while size > 0 and rows >= size:
+			window = [numpy.concatenate(c) for c in zip(*pending)]
+			yield [c[:size] for c in window]
+			pending = [[c[size:] for c in window]]
+			rows -= size
+	if rows > 0:
+		yield [numpy.concatenate(c) for c in zip(*pending)]
+
+def encodeWindow(attributes, columns, reference):
+	'''
+	Encodes a window as a matrix whose euclidean distances are the ones used
+	to link the records: the numeric attributes standardized with the mean
+	and deviation of the `reference` (original) window, and the nominal ones
+	one-hot encoded, so that two different values are at distance 1.
+	Missing values are imputed with the mean (numeric) or match nothing.
+	'''
+	encoded = []
+	for (name, kind), column, original in zip(attributes, columns, reference):
+		if kind.startswith('{'):
+			values = len(getNominalValues(kind))
+			oneHot = numpy.zeros((len(column), values))
+			present = column >= 0
+			oneHot[numpy.nonzero(present)[0], column[present]] = numpy.sqrt(0.5)
+			encoded.append(oneHot)
+		else:
+			mean = numpy.nanmean(original)
+			deviation = numpy.nanstd(original)
+			standard = (column - mean) / (deviation if deviation > 0 else 1.0)
+			encoded.append(numpy.nan_to_num(standard).reshape(-1, 1))
+	return numpy.hstack(encoded)
+
+def getLinkedRecords(original, anonymized):
+	'''
+	Distance-based record linkage: counts the anonymized records (rows) whose
+	nearest original record is the one they come from (the same row). Ties
+	count as linked. The distances are computed in blocks of rows, so that
+	the memory does not grow with the square of the window.
+	'''
+	originalNorms = (original ** 2).sum(axis=1)
+	ownDistances = ((original - anonymized) ** 2).sum(axis=1)
+	blockRows = max(1, blockElements // len(original))
+	linked = 0
+	for start in xrange(0, len(anonymized), blockRows):
+		block = anonymized[start:start+blockRows]
+		distances = (block ** 2).sum(axis=1)[:, None] + originalNorms[None, :] - 2 * numpy.dot(block, original.T)
+		nearest = distances.min(axis=1)
+		own = ownDistances[start:start+blockRows]
+		linked += numpy.count_nonzero(own <= nearest + tolerance * (1 + numpy.abs(nearest)))
+	return linked
+
+def getInformationLoss(attributes, original, anonymized, normalize):
+	'''
+	Sum of squared errors between the original and anonymized records: the
+	squared differences of the numeric attributes (standardized with the
+	original window, if `normalize`) plus 1 for each changed nominal value.
+	'''
+	loss = 0.0
+	for (name, kind), o, a in zip(attributes, original, anonymized):
+		if kind.startswith('{'):
+			loss += numpy.count_nonzero(o != a)
+		else:
+			errors = o - a
+			if normalize:
+				deviation = numpy.nanstd(o)
+				errors = errors / (deviation if deviation > 0 else 1.0)
+			loss += numpy.nansum(errors ** 2)
+	return loss
+
+def checkAttributes(originalPath, originalAttributes, anonymizedPath, anonymizedAttributes):
+	if [kind for name, kind in originalAttributes] != [kind for name, kind in anonymizedAttributes]:
+		raise ValueError('%s does not have the attributes of %s' % (anonymizedPath, originalPath))
+
+def evaluate(originalPath, anonymizedPath, normalize=False):
+	'''
+	Streams an original stream and its anonymized version (in any format of
+	streamstore.py, with the records in the same order) window by window.
+	Returns their disclosure risk (the fraction of linked records) and
+	information loss (the SSE), and the number of instances compared.
+	'''
+	header, attributes, originalChunks = streamstore.iterateStream(originalPath)
+	header, anonymizedAttributes, anonymizedChunks = streamstore.iterateStream(anonymizedPath)
+	checkAttributes(originalPath, attributes, anonymizedPath, anonymizedAttributes)
+	linked = 0
+	loss = 0.0
+	instances = 0
+	# the anonymized stream may hold less instances (e.g. with -m)
+	windows = itertools.izip(getWindows(originalChunks, windowSize), getWindows(anonymizedChunks, windowSize))
+	for original, anonymized in windows:
+		rows = min(len(original[0]), len(anonymized[0]))
+		original = [c[:rows] for c in original]
+		anonymized = [c[:rows] for c in anonymized]
+		linked += getLinkedRecords(encodeWindow(attributes, original, original),
+									encodeWindow(attributes, anonymized, original))
+		loss += getInformationLoss(attributes, original, anonymized, normalize)
+		instances += rows
+	if instances == 0:
+		raise ValueError('%s has no instances to evaluate' % anonymizedPath)
+	return linked / float(instances), loss, instances
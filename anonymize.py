@@ -1,29 +1,60 @@
 #!/usr/bin/env python
 
 import argparse
-from filtermappings import getFilterCode
+import costmodel
+import experimentindex
+from filtermappings import getCodedFilterSpec
 import itertools
 import json
+import memorymodel
+import moatask
+from moatask import MoaTask, JvmOptions
+import multiprocessing
 import os
+import progress
 import re
-from subprocess import call
+import resourceprofiler
+import runledger
+import streamstore
 import sys
+from taskrunner import Task, runTasks, runAndMeasure, printSummary, formatCmd
 from termcolor import colored
 import textwrap
+import time
+import workqueue
 
 # global flags
 dryRun = False
 parallel = False
+jobs = multiprocessing.cpu_count()
 logsDir = 'logs'
+memoryBudget = None
+memoryModelFile = 'memory-model.json'
+ledgerFile = 'ledger.db'
+indexFile = 'index.db'
+force = False
+profile = False
+queueFile = None
+# the command that executes the MOA tasks, with the options of moa.sh (e.g. the
+#  client of moa-worker.py), or None to launch their JVMs directly
+moaCommand = None
+
+# the extensions of the formats of the anonymized streams (see streamstore.py)
+anonymizationExtensions = {
+	'arff': 'arff',
+	'gz': 'arff.gz',
+	'zst': 'arff.zst',
+	'cols': 'cols'
+}
 
 # global variables
 parallelTasks = []
-
-def getCodedFilterSpec(filterSpec):
-	filterComponents = filterSpec.split(' ')
-	filterName = filterComponents[0]
-	filterParams = ''.join(filterComponents[1:len(filterComponents)])
-	return getFilterCode(filterName) + filterParams
+parallelSpecs = {}
+memoryModel = None
+ledger = None
+index = None
+costModel = None
+tracker = None
 
 def getBaseFilename(stream, filterSpec, instances):
 	streamName = stream.split('.')[1]
@@ -33,80 +64,165 @@ def getBaseFilename(stream, filterSpec, instances):
 def getFile(outDir, baseFilename, extension):
 	return outDir + '/' + baseFilename + '.' + extension
 
-def getTaskOptions(options, filterSpec, stream, instances):
-	optionsSpec = ''
-	baseFilename = getBaseFilename(stream,filterSpec, instances)
+def getAnonymizationFile(anonOptions, baseFilename):
+	# the anonymized stream may be stored compressed or in columns (see streamstore.py)
+	extension = anonymizationExtensions[anonOptions.get('anonymizationFormat', 'arff')]
+	return getFile(anonOptions['anonymizationDirectory'], baseFilename, extension)
 
+def getTaskParams(options, instances):
+	'''
+	Returns the (option, value) pairs of a task, other than its outputs.
+	'''
 	# instances to anonymize
-	optionsSpec += '-m ' + instances + ' '
+	params = [('-m', instances)]
 
 	# task report
-	reportOptions = options['report']
-	if reportOptions['summarizeReport']:
-		optionsSpec += '-z '
-	if reportOptions['writeTaskReport']:
-		file = getFile(reportOptions['taskReportDirectory'], baseFilename, 'txt')
-		optionsSpec += '-r ' + file + ' '
+	if options['report']['summarizeReport']:
+		params.append(('-z', None))
 
 	# anonymization
 	anonOptions = options['anonymization']
-	if anonOptions['writeAnonymization']:
-		file = getFile(anonOptions['anonymizationDirectory'], baseFilename, 'arff')
-		optionsSpec += '-a ' + file + ' '
-		if anonOptions['suppressAnonymizationHeader']:
-			optionsSpec += '-h '
+	if anonOptions['writeAnonymization'] and anonOptions['suppressAnonymizationHeader']:
+		params.append(('-h', None))
 
 	# evaluation
 	evalOptions = options['evaluation']
 	if evalOptions['writeEvaluation']:
-		file = getFile(evalOptions['evaluationDirectory'], baseFilename, 'csv')
-		optionsSpec += '-e ' + file + ' '
-		optionsSpec += '-u ' + str(evalOptions['evaluationUpdateRate']) + ' '
+		params.append(('-u', str(evalOptions['evaluationUpdateRate'])))
 
 	# throughput
 	throughputOptions = options['throughput']
 	if throughputOptions['writeThroughput']:
-		file = getFile(throughputOptions['throughputDirectory'], baseFilename, 'csv')
-		optionsSpec += '-t ' + file + ' '
-		optionsSpec += '-U ' + str(throughputOptions['throughputUpdateRate']) + ' '
+		params.append(('-U', str(throughputOptions['throughputUpdateRate'])))
+
+	return params
+
+def getTaskOutputs(options, filterSpec, stream, instances):
+	'''
+	Returns the (kind, file) pairs of the outputs of a task.
+	'''
+	outputs = []
+	baseFilename = getBaseFilename(stream, filterSpec, instances)
+	if options['report']['writeTaskReport']:
+		outputs.append(('report', getFile(options['report']['taskReportDirectory'], baseFilename, 'txt')))
+	if options['anonymization']['writeAnonymization']:
+		outputs.append(('anonymization', getAnonymizationFile(options['anonymization'], baseFilename)))
+	if options['evaluation']['writeEvaluation']:
+		outputs.append(('evaluation', getFile(options['evaluation']['evaluationDirectory'], baseFilename, 'csv')))
+	if options['throughput']['writeThroughput']:
+		outputs.append(('throughput', getFile(options['throughput']['throughputDirectory'], baseFilename, 'csv')))
+	return outputs
 
-	return optionsSpec
+def buildMoaTask(options, filterSpec, stream, moaStream, instances):
+	'''
+	Builds the MOA task that anonymizes a stream, reading `moaStream` (the
+	stream, or the FIFOs its encoded files are decoded into).
+	'''
+	baseFilename = getBaseFilename(stream, filterSpec, instances)
+	outputs = []
+	for kind, file in getTaskOutputs(options, filterSpec, stream, instances):
+		if kind == 'anonymization' and streamstore.isEncoded(file):
+			# MOA writes into a FIFO, which is encoded into the file
+			file = streamstore.getFifo(baseFilename + '.out')
+		outputs.append((kind, file))
+	return MoaTask(task='Anonymize', stream=moaStream, filterSpec=filterSpec,
+				params=getTaskParams(options, instances), outputs=outputs)
 
 def anonymizeStream(stream, privacyFilter, instances, options):
-	# build the command line call
-	cmdFormat = {
-		'par': '-e -o' if parallel else '',
-		'str': '(%s)' % stream,
-		'fltr': '(%s)' % privacyFilter,
-		'tsk': getTaskOptions(options, privacyFilter, stream, instances)
-	}
-	cmd = './moa.sh %(par)s "Anonymize -s %(str)s -f %(fltr)s %(tsk)s"' % cmdFormat
-
-	# add the necessary redirection for parallel execution
-	# if parallel:
-	# 	cmd += ' &> %s' % getFile(logsDir, getBaseFilename(stream, privacyFilter, instances), 'log')
+	baseFilename = getBaseFilename(stream, privacyFilter, instances)
+
+	# index the metadata of the outputs, so that other tools do not parse file names
+	taskOutputs = getTaskOutputs(options, privacyFilter, stream, instances)
+	if not dryRun:
+		for kind, file in taskOutputs:
+			experimentindex.registerOutput(index, file, kind, privacyFilter, stream, instances)
+	outputs = [file for kind, file in taskOutputs]
+
+	# skip the runs that were already completed and whose outputs are valid
+	runKey = runledger.getRunKey('anonymize', stream, privacyFilter, instances)
+	if not force and runledger.isCompleted(ledger, runKey):
+		print colored('[SKIPPED]', 'yellow'), 'Already completed:', baseFilename
+		return
+
+	# estimate the memory footprint of the task, to size the JVM heap accordingly
+	footprint = None
+	if memoryBudget != None:
+		footprint = memorymodel.estimateFootprint(memoryModel, privacyFilter, instances)
+
+	# sample the resource usage of the task, next to its log, if requested
+	profileFile = None
+	if profile:
+		profileFile = getFile(os.path.join(logsDir, 'profiles'), baseFilename, 'csv')
+
+	# decode the compressed (or columnar) streams that MOA reads, and encode the
+	#  anonymized one, through FIFOs
+	moaStream, feeds = streamstore.getStreamFeeds(stream, baseFilename)
+	sinks = []
+	if options['anonymization']['writeAnonymization']:
+		file = getAnonymizationFile(options['anonymization'], baseFilename)
+		if file.endswith('.cols') and options['anonymization']['suppressAnonymizationHeader']:
+			print 'ERROR: the columnar anonymized streams need their header (suppressAnonymizationHeader)'
+			sys.exit(1)
+		if streamstore.isEncoded(file):
+			sinks.append((streamstore.getFifo(baseFilename + '.out'), file))
+
+	# build the command, executed without a shell
+	jvm = JvmOptions(heap=memorymodel.getHeapSize(footprint) if footprint != None else None,
+					gcLog=resourceprofiler.getGcLogFile(profileFile) if profileFile != None else None)
+	task = buildMoaTask(options, privacyFilter, stream, moaStream, instances)
+	cmd = streamstore.getPipedArgv(moatask.getArgv(task, jvm, moaCommand), feeds, sinks)
 
 	# build wrapper to print nice, short lines in the CLI
 	wrapper = textwrap.TextWrapper(initial_indent='    ', width=120, subsequent_indent='    ')
 
 	if parallel:
-		# generate Makefile
-		with open('Makefile', 'a') as makefile:
-			if len(parallelTasks) == 0:
-				parallelTasks.append(1)
-			else:
-				parallelTasks.append(parallelTasks[len(parallelTasks) - 1] + 1)
-			makefile.write('%s:\n' % parallelTasks[len(parallelTasks) -1])
-			makefile.write('\t%s\n' % cmd)
+		# queue the task for the worker pool, logging its output (stdout and stderr)
+		parallelTasks.append(Task(name=baseFilename, cmd=cmd,
+								logFile=getFile(logsDir, baseFilename, 'log'), memory=footprint,
+								profileFile=profileFile))
+		parallelSpecs[baseFilename] = (stream, privacyFilter, instances, runKey, outputs)
 	else:
 		# check whether or not to actually execute the tasks
 		if not dryRun:
 			print colored('[RUNNING]', 'green'), 'Executing:'
-			print wrapper.fill(colored(cmd, 'cyan'))
-			call(cmd, shell=True)
+			print wrapper.fill(colored(formatCmd(cmd), 'cyan'))
+			runledger.markStarted(ledger, runKey, stream, privacyFilter, instances, 0, outputs)
+			progress.markRunning(tracker, baseFilename)
+			started = time.time()
+			returncode, maxrss, peaks = runAndMeasure(cmd, profileFile=profileFile,
+													onPoll=lambda: progress.writeProgress(tracker))
+			runledger.markFinished(ledger, runKey, returncode)
+			progress.markFinished(tracker, baseFilename, returncode, time.time() - started)
+			recordFootprint(privacyFilter, instances, returncode, maxrss)
 		else:
 			print colored('[DRY RUN]', 'red'), 'Would be calling:'
-			print wrapper.fill(colored(cmd, 'cyan'))
+			print wrapper.fill(colored(formatCmd(cmd), 'cyan'))
+
+def recordFootprint(filterSpec, instances, returncode, maxrss):
+	'''
+	Refines the memory model with the peak memory observed for a successful
+	task. The tasks executed on the worker daemon (-w) are not observed: the
+	measured process is its client, not the JVM.
+	'''
+	if returncode == 0 and maxrss != None and moaCommand == None:
+		memorymodel.recordObservation(memoryModel, filterSpec, instances, maxrss)
+
+def trackRun(stream, privacyFilter, instances, options):
+	'''
+	Adds a run to the progress of the sweep (unless the ledger records it as
+	completed), with its runtime estimated from the history of the ledger and
+	its throughput file, if MOA writes it.
+	'''
+	runKey = runledger.getRunKey('anonymize', stream, privacyFilter, instances)
+	if tracker == None or (not force and runledger.isCompleted(ledger, runKey)):
+		return
+	baseFilename = getBaseFilename(stream, privacyFilter, instances)
+	throughputOptions = options['throughput']
+	throughputFile = None
+	if throughputOptions['writeThroughput']:
+		throughputFile = getFile(throughputOptions['throughputDirectory'], baseFilename, 'csv')
+	progress.addTask(tracker, baseFilename, costmodel.estimateRuntime(costModel, privacyFilter, instances),
+					instances, throughputFile, throughputOptions['throughputUpdateRate'])
 
 def buildFilterParams(paramsPermutation, paramsNames):
 	params = ''
@@ -120,6 +236,8 @@ def anonymizeWithConfig(configuration):
 	streams = configuration['streams']
 	options = configuration['options']
 
+	runs = []
+
 	# for each filter in the configuration
 	for privacyFilter in filters:
 		filterName = privacyFilter['filter']
@@ -141,14 +259,61 @@ def anonymizeWithConfig(configuration):
 			for stream in streams:
 				# for each number of instances
 				for instances in options['maximumInstances']:
-					anonymizeStream(stream, builtFilter, str(instances), options)
+					runs.append((stream, builtFilter, str(instances)))
+
+	# know every run of the sweep before the first one starts, for its ETA
+	for stream, builtFilter, instances in runs:
+		trackRun(stream, builtFilter, instances, options)
+	for stream, builtFilter, instances in runs:
+		anonymizeStream(stream, builtFilter, instances, options)
+	if not dryRun:
+		index.commit()
 
 	if parallel:
-		with open('Makefile', 'a') as makefile:
-			tasks = ' '.join(str(x) for x in parallelTasks)
-			makefile.write('all: ')
-			makefile.write(tasks)
-			makefile.write('\n')
+		executeParallelTasks()
+	elif not dryRun:
+		memorymodel.saveModel(memoryModel, memoryModelFile)
+	progress.finishTracking(tracker)
+
+def recordParallelResult(result):
+	stream, filterSpec, instances, runKey, outputs = parallelSpecs[result.task.name]
+	# keep track of the run in the ledger, so that an interrupted sweep resumes here
+	runledger.markStarted(ledger, runKey, stream, filterSpec, instances, 0, outputs,
+						started=time.time() - result.elapsed)
+	runledger.markFinished(ledger, runKey, result.returncode)
+	progress.markFinished(tracker, result.task.name, result.returncode, result.elapsed)
+	recordFootprint(filterSpec, instances, result.returncode, result.maxrss)
+
+def executeParallelTasks():
+	if dryRun:
+		wrapper = textwrap.TextWrapper(initial_indent='    ', width=120, subsequent_indent='    ')
+		for task in parallelTasks:
+			print colored('[DRY RUN]', 'red'), 'Would be queueing:', task.name
+			print wrapper.fill(colored(formatCmd(task.cmd), 'cyan'))
+		return
+
+	if queueFile != None:
+		# hand the tasks to the workers of the queue (queue-worker.py) and collect their results
+		queue = workqueue.openQueue(queueFile)
+		workqueue.enqueue(queue, parallelTasks)
+		print colored('[QUEUE]', 'green'), 'Queued %d task(s) in %s, waiting for the workers' \
+				% (len(parallelTasks), queueFile)
+		results = workqueue.waitForTasks(queue, parallelTasks, onFinish=recordParallelResult,
+										onPoll=lambda leases: progress.syncLeases(tracker, leases))
+	else:
+		print colored('[POOL]', 'green'), 'Executing %d task(s) with %d worker(s), logging to %s/' \
+				% (len(parallelTasks), jobs, logsDir)
+		if memoryBudget != None:
+			print colored('[POOL]', 'green'), 'Memory budget: %dMB' % memoryBudget
+		results = runTasks(parallelTasks, jobs, memoryBudget, onFinish=recordParallelResult,
+						onStart=lambda running: progress.markRunning(tracker, running.task.name),
+						onPoll=lambda: progress.writeProgress(tracker))
+	printSummary(results)
+	memorymodel.saveModel(memoryModel, memoryModelFile)
+
+	if any(r.returncode != 0 for r in results):
+		progress.finishTracking(tracker)
+		sys.exit(1)
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Anonymize stream files using MOA privacy filters.')
@@ -157,24 +322,73 @@ if __name__ == '__main__':
 	parser.add_argument('-d', '--dry-run', action='store_true',
 						help='do not execute, just print the commands that WOULD be executed')
 	parser.add_argument('-p', '--parallel', action='store_true',
-						help='writes the commands to execute into a Makefile to be executed in parallel using GNU Make. This option superseeds --dry-run')
+						help='execute the tasks concurrently, using a bounded pool of worker processes (see --jobs)')
+	parser.add_argument('-j', '--jobs', type=int, default=jobs,
+						help='the maximum number of concurrent MOA executions (JVMs) when running in parallel. Defaults to the number of CPUs')
+	parser.add_argument('-l', '--logs-dir', default=logsDir,
+						help='the directory where the output of each parallel task is logged')
+	parser.add_argument('-M', '--memory-budget', type=int, default=None,
+						help='the total memory (MB) that concurrent tasks may use. Tasks are admitted according to '+
+								'their estimated footprint and each JVM heap (-Xmx) is sized after it')
+	parser.add_argument('--memory-model', default=memoryModelFile,
+						help='the file where the peak memory observed for each task is kept to refine the estimates')
+	parser.add_argument('-w', '--worker', default=None,
+						help='execute the MOA tasks on the warm JVMs of the moa-worker.py daemon listening on this Unix socket, instead of launching a JVM per task')
+	parser.add_argument('-q', '--queue', default=None,
+						help='act as a coordinator: queue the tasks in this work queue (SQLite database, on storage '+
+								'shared by the hosts) and wait for queue-worker.py workers to execute them. Implies -p')
+	parser.add_argument('-P', '--profile', action='store_true',
+						help='sample the CPU, resident memory and threads of every task (and log its GC pauses) into '+
+								'a time series under <logs-dir>/profiles/. Not with -w')
+	parser.add_argument('--profile-interval', type=float, default=resourceprofiler.sampleInterval,
+						help='the seconds between two samples of a profiled task')
+	parser.add_argument('--index', default=indexFile,
+						help='the experiment index (SQLite database) where the metadata of every output file is recorded')
+	parser.add_argument('--ledger', default=ledgerFile,
+						help='the run ledger (SQLite database) used to skip the runs that were already completed')
+	parser.add_argument('-f', '--force', action='store_true',
+						help='execute every run, even if the ledger records it as completed')
+	parser.add_argument('--progress', default=None,
+						help='write the progress of the sweep (the tasks in each state, the running ones with their '+
+								'throughput, and the ETA) to this JSON file, to follow it with sweep-monitor.py')
 	args = parser.parse_args()
 
 	# check if a dried run was requested
 	dryRun = args.dry_run
 
-	# check if a Makefile generation was requested
-	parallel = args.parallel
-
-	if parallel:
-		response = raw_input('Delete the previous Makefile and generate a new one? (y/n): ')
-		if response != 'y':
-			print colored('ABORTING', 'red')
+	# check if a parallel execution was requested
+	queueFile = args.queue
+	parallel = args.parallel or queueFile != None
+	jobs = args.jobs
+	logsDir = args.logs_dir
+	memoryBudget = args.memory_budget
+	memoryModelFile = args.memory_model
+	memoryModel = memorymodel.loadModel(memoryModelFile)
+	force = args.force
+	profile = args.profile
+	if profile and args.worker != None:
+		print 'ERROR: the tasks of the worker daemon (-w) cannot be profiled (-P): the profiled process would be its '+\
+				'client, not the JVM'
+		sys.exit(1)
+	resourceprofiler.sampleInterval = args.profile_interval
+	if args.worker != None:
+		moaCommand = './moa-worker.py run -s %s' % args.worker
+	elif not dryRun:
+		try:
+			moatask.checkLibraries()
+		except ValueError as e:
+			print 'ERROR: %s' % e
 			sys.exit(1)
-		else:
-			if os.path.isfile('Makefile'):
-				os.remove('Makefile')
-			print colored('Generating Makefile...', 'green')
+	# a dry run reads the ledger, to report the runs it would skip, but never creates it
+	ledger = runledger.openLedger(args.ledger if not dryRun or os.path.isfile(args.ledger) else ':memory:')
+	if not dryRun:
+		index = experimentindex.openIndex(args.index)
+	if args.progress != None and not dryRun:
+		costModel = costmodel.fitModel(costmodel.loadHistory(ledger))
+		workers = jobs if parallel else 1
+		if queueFile != None:
+			workers = None # the workers of a queue are not known in advance
+		tracker = progress.startTracking(args.progress, 'anonymize.py ' + args.config_file, workers)
 
 	# execute with the config file given!
 	with open(args.config_file, 'rb') as configFile:
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+import csv
+import numpy
+import re
+
+# instances generated (and written) at once. The data only depends on the
+#  seeds and this size, so that it must stay fixed for the files to be
+#  reproducible
+chunkSize = 1 << 16
+
+# the numeric attributes are written like Weka does: rounded to 6 decimals,
+#  without trailing zeros (e.g. "0.5", "3"). Missing values (NaN) are written
+#  as "?"
+decimals = 6
+
+# the shapes of the Waveform generator (Breiman et al.)
+waveformFunctions = numpy.array([
+	[0, 1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+	[0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1, 0],
+	[0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0]
+], dtype=float)
+
+def parseOptions(spec, defaults):
+	'''
+	Parses the options of a MOA generator specification (e.g.
+	"generators.AgrawalGenerator -p 0.0 -f 2") over their default values.
+	'''
+	options = dict(defaults)
+	components = spec.split()
+	i = 1
+	while i < len(components):
+		name = components[i].lstrip('-')
+		if name not in defaults:
+			raise NameError('Unsupported option of %s: -%s' % (components[0], name))
+		if isinstance(defaults[name], bool): # a flag
+			options[name] = True
+			i += 1
+		else:
+			options[name] = type(defaults[name])(components[i+1])
+			i += 2
+	return options
+
+def numericAttributes(names):
+	return [(name, 'numeric') for name in names]
+
+def nominalAttribute(name, values):
+	return (name, '{%s}' % ','.join(values))
+
+class WaveformGenerator(object):
+	'''
+	Waveform generator: 21 attributes (plus 19 of pure noise with -n), which
+	are a random convex combination of two of three shapes plus gaussian noise.
+	'''
+	defaults = {'i': 1, 'n': False}
+
+	def __init__(self, options):
+		self.noise = options['n']
+		self.random = numpy.random.RandomState(options['i'])
+		atts = 40 if self.noise else 21
+		self.attributes = numericAttributes(['att%d' % (i + 1) for i in range(atts)]) + \
+				[nominalAttribute('class', ['class1', 'class2', 'class3'])]
+
+	def generate(self, n):
+		waveform = self.random.randint(3, size=n)
+		choiceA = numpy.where(waveform == 2, 1, 0)
+		choiceB = numpy.where(waveform == 0, 1, 2)
+		multiplierA = self.random.random_sample(n)[:, None]
+		values = multiplierA * waveformFunctions[choiceA] + (1.0 - multiplierA) * waveformFunctions[choiceB] \
+				+ self.random.standard_normal((n, 21))
+		if self.noise:
+			values = numpy.hstack([values, self.random.standard_normal((n, 19))])
+		return [values], [waveform]
+
+class RandomRBFGenerator(object):
+	'''
+	Random radial basis function generator: instances are drawn around random
+	(weighted) centroids, each of them with its class and standard deviation.
+	'''
+	defaults = {'r': 1, 'i': 1, 'c': 2, 'a': 10, 'n': 50}
+
+	def __init__(self, options):
+		self.random = numpy.random.RandomState(options['i'])
+		model = numpy.random.RandomState(options['r'])
+		atts = options['a']
+		self.centres = model.random_sample((options['n'], atts))
+		self.classes = model.randint(options['c'], size=options['n'])
+		self.stdDevs = model.random_sample(options['n'])
+		weights = model.random_sample(options['n'])
+		self.cumulativeWeights = numpy.cumsum(weights) / weights.sum()
+		self.attributes = numericAttributes(['att%d' % (i + 1) for i in range(atts)]) + \
+				[nominalAttribute('class', ['class%d' % (i + 1) for i in range(options['c'])])]
+
+	def generate(self, n):
+		centroids = numpy.searchsorted(self.cumulativeWeights, self.random.random_sample(n), side='right')
+		centroids = numpy.minimum(centroids, len(self.centres) - 1)
+		directions = self.random.random_sample((n, self.centres.shape[1])) * 2.0 - 1.0
+		magnitudes = numpy.sqrt((directions ** 2).sum(axis=1))
+		desired = self.random.standard_normal(n) * self.stdDevs[centroids]
+		values = self.centres[centroids] + directions * (desired / magnitudes)[:, None]
+		return [values], [self.classes[centroids]]
+
+class AgrawalGenerator(object):
+	'''
+	Agrawal generator: loan applications (salary, commission, age, education
+	level, car, zip code, house value, years owned and loan), classified by one
+	of ten functions (-f) and optionally perturbed (-p).
+	'''
+	defaults = {'f': 1, 'i': 1, 'p': 0.05}
+
+	def __init__(self, options):
+		if not 1 <= options['f'] <= 10:
+			raise ValueError('The Agrawal classification function must be between 1 and 10')
+		self.function = options['f']
+		self.perturbation = options['p']
+		self.random = numpy.random.RandomState(options['i'])
+		self.attributes = numericAttributes(['salary', 'commission', 'age']) + [
+				nominalAttribute('elevel', ['level%d' % i for i in range(5)]),
+				nominalAttribute('car', ['car%d' % (i + 1) for i in range(20)]),
+				nominalAttribute('zipcode', ['zipcode%d' % (i + 1) for i in range(9)])] + \
+				numericAttributes(['hvalue', 'hyears', 'loan']) + \
+				[nominalAttribute('class', ['groupA', 'groupB'])]
+
+	def classify(self, salary, commission, age, elevel, hvalue, hyears, loan):
+		'''
+		Returns whether each instance belongs to group A, by the selected function.
+		'''
+		young = age < 40
+		middle = (40 <= age) & (age < 60)
+		old = age >= 60
+		between = lambda values, low, high: (low <= values) & (values <= high)
+		f = self.function
+		if f == 1:
+			return young | old
+		if f == 2:
+			return (young & between(salary, 50000, 100000)) | (middle & between(salary, 75000, 125000)) \
+					| (old & between(salary, 25000, 75000))
+		if f == 3:
+			return (young & (elevel <= 1)) | (middle & between(elevel, 1, 3)) | (old & (elevel >= 2))
+		if f == 4:
+			return (young & numpy.where(elevel <= 1, between(salary, 25000, 75000), between(salary, 50000, 100000))) \
+					| (middle & numpy.where(between(elevel, 1, 3), between(salary, 50000, 100000),
+											between(salary, 75000, 125000))) \
+					| (old & numpy.where(elevel >= 2, between(salary, 50000, 100000), between(salary, 25000, 75000)))
+		if f == 5:
+			return (young & numpy.where(between(salary, 50000, 100000), between(loan, 100000, 300000),
+										between(loan, 200000, 400000))) \
+					| (middle & numpy.where(between(salary, 75000, 125000), between(loan, 200000, 400000),
+											between(loan, 300000, 500000))) \
+					| (old & numpy.where(between(salary, 25000, 75000), between(loan, 300000, 500000),
+										between(loan, 100000, 300000)))
+		total = salary + commission
+		if f == 6:
+			return (young & between(total, 50000, 100000)) | (middle & between(total, 75000, 125000)) \
+					| (old & between(total, 25000, 75000))
+		if f == 7:
+			return 2.0 * total / 3.0 - loan / 5.0 - 20000.0 > 0
+		if f == 8:
+			return 2.0 * total / 3.0 - 5000.0 * elevel - 20000.0 > 0
+		if f == 9:
+			return 2.0 * total / 3.0 - 5000.0 * elevel - loan / 5.0 - 10000.0 > 0
+		equity = numpy.where(hyears >= 20, hvalue * (hyears - 20) / 10.0, 0.0)
+		return 2.0 * total / 3.0 - 5000.0 * elevel + equity / 5.0 - 10000.0 > 0
+
+	def perturb(self, values, low, high):
+		values = values + (high - low) * (2.0 * (self.random.random_sample(len(values)) - 0.5)) * self.perturbation
+		return numpy.clip(values, low, high)
+
+	def generate(self, n):
+		r = self.random
+		salary = 20000.0 + 130000.0 * r.random_sample(n)
+		commission = numpy.where(salary >= 75000.0, 0.0, 10000.0 + 65000.0 * r.random_sample(n))
+		age = r.randint(20, 81, size=n).astype(float)
+		elevel = r.randint(5, size=n)
+		car = r.randint(20, size=n)
+		zipcode = r.randint(9, size=n)
+		hvalue = (9.0 - zipcode) * 100000.0 * (0.5 + r.random_sample(n))
+		hyears = r.randint(1, 31, size=n).astype(float)
+		loan = r.random_sample(n) * 500000.0
+		groupB = ~self.classify(salary, commission, age, elevel, hvalue, hyears, loan)
+		if self.perturbation > 0:
+			salary = self.perturb(salary, 20000.0, 150000.0)
+			commission = numpy.where(commission > 0, self.perturb(commission, 10000.0, 75000.0), 0.0)
+			age = numpy.round(self.perturb(age, 20.0, 80.0))
+			hvalue = self.perturb(hvalue, (9.0 - zipcode) * 50000.0, (9.0 - zipcode) * 150000.0)
+			hyears = numpy.round(self.perturb(hyears, 1.0, 30.0))
+			loan = self.perturb(loan, 0.0, 500000.0)
+		return [numpy.column_stack([salary, commission, age]), elevel, car, zipcode,
+				numpy.column_stack([hvalue, hyears, loan])], [groupB.astype(int)]
+
+generatorClasses = {
+	'generators.WaveformGenerator': WaveformGenerator,
+	'generators.RandomRBFGenerator': RandomRBFGenerator,
+	'generators.AgrawalGenerator': AgrawalGenerator
+}
+
+def createGenerator(spec):
+	name = spec.split()[0]
+	if name not in generatorClasses:
+		raise NameError('There is no native implementation of ' + name)
+	generatorClass = generatorClasses[name]
+	return generatorClass(parseOptions(spec, generatorClass.defaults))
+
+def quote(name):
+	# Weka quotes the names with spaces or special characters
+	if re.search(r'[\s,{}\'"%?]', name):
+		return "'%s'" % name.replace("'", "\\'")
+	return name
+
+def getHeader(spec, generator):
+	'''
+	Returns the ARFF header that MOA writes for a stream (its relation is named
+	after the generator specification).
+	'''
+	header = '@relation %s\n\n' % quote(' '.join(spec.split()))
+	for name, kind in generator.attributes:
+		header += '@attribute %s %s\n' % (name, kind)
+	return header + '\n@data\n\n'
+
+def getNominalValues(kind):
+	'''
+	Returns the (unquoted) values of a nominal attribute type, e.g. "{a,'b c'}".
+	'''
+	return [v.strip() for v in next(csv.reader([kind.strip()[1:-1]], quotechar="'",
+												escapechar='\\', skipinitialspace=True))]
+
+def formatNumbers(column):
+	'''
+	Formats a numeric column as a matrix of characters (one row per value,
+	NUL-padded), the way "%.6f" does once trailing zeros are stripped. Values
+	whose rounding can't be told apart from their scaled float (or too large
+	for it) fall back to "%.6f" itself.
+	'''
+	missing = numpy.isnan(column)
+	finite = numpy.isfinite(column)
+	scaled = numpy.abs(numpy.where(finite, column, 0)) * 10 ** decimals
+	exact = finite & (scaled < 2 ** 52) \
+		& (numpy.abs(scaled - numpy.floor(scaled) - 0.5) > numpy.spacing(scaled))
+	scaled = numpy.where(exact, numpy.rint(scaled), 0).astype(numpy.int64)
+	whole, fraction = numpy.divmod(scaled, 10 ** decimals)
+	wholeDigits = whole[:, None] // 10 ** numpy.arange(len(str(whole.max())) - 1, -1, -1) % 10
+	fractionDigits = fraction[:, None] // 10 ** numpy.arange(decimals - 1, -1, -1) % 10
+	# sign, integer part without its leading zeros, dot and decimals without their trailing zeros
+	leading = numpy.logical_and.accumulate(wholeDigits == 0, axis=1)
+	leading[:, -1] = False
+	trailing = numpy.logical_and.accumulate(fractionDigits[:, ::-1] == 0, axis=1)[:, ::-1]
+	chars = numpy.hstack([numpy.where(numpy.signbit(column), ord('-'), 0)[:, None],
+		numpy.where(leading, 0, ord('0') + wholeDigits),
+		numpy.where(fraction == 0, 0, ord('.'))[:, None],
+		numpy.where(trailing, 0, ord('0') + fractionDigits)]).astype(numpy.uint8)
+	chars[missing] = 0
+	chars[missing, 0] = ord('?')
+	for i in numpy.flatnonzero(~exact & ~missing):
+		text = ('%.6f' % column[i]).rstrip('0').rstrip('.')
+		if len(text) > chars.shape[1]:
+			chars = numpy.hstack([chars, numpy.zeros((len(chars), len(text) - chars.shape[1]), dtype=numpy.uint8)])
+		chars[i] = 0
+		chars[i, :len(text)] = numpy.frombuffer(text, dtype=numpy.uint8)
+	return chars
+
+def formatChunk(attributes, blocks):
+	'''
+	Formats a chunk of instances as ARFF data lines. The blocks are numeric
+	matrices and vectors of nominal value indices, in attribute order. Missing
+	values (NaN, or a nominal index of -1) are written as "?". Each column is
+	formatted on its own as a matrix of characters; the NUL padding is dropped
+	once they are laid side by side.
+	'''
+	columns = []
+	attribute = 0
+	for block in blocks:
+		if block.ndim == 2:
+			columns.extend(formatNumbers(column) for column in block.T)
+			attribute += block.shape[1]
+		else:
+			values = numpy.array([quote(v) for v in getNominalValues(attributes[attribute][1])] + ['?'])
+			columns.append(values[block].view(numpy.uint8).reshape(len(block), -1))
+			attribute += 1
+	separator = numpy.full((len(columns[0]), 1), ord(','), dtype=numpy.uint8)
+	chars = numpy.hstack(sum([[column, separator] for column in columns], [])[:-1]
+		+ [numpy.full_like(separator, ord('\n'))]).ravel()
+	return chars[chars != 0].tostring()
+
+def writeArff(spec, fileName, instances, prefixes=[]):
+	'''
+	Generates a stream into an ARFF file, in chunks. Returns the size (bytes)
+	of the prefix of the file that holds the first N instances, for every N of
+	`prefixes`, so that the smaller files can be copied from it.
+	'''
+	generator = createGenerator(spec)
+	offsets = {}
+	written = 0
+	with open(fileName, 'wb') as f:
+		f.write(getHeader(spec, generator))
+		while written < instances:
+			n = min(chunkSize, instances - written)
+			values, classes = generator.generate(chunkSize)
+			# the whole chunk is always generated, so that the data does not depend on the size
+			blocks = [block[:n] for block in values + classes]
+			lines = formatChunk(generator.attributes, blocks).splitlines(True)
+			for prefix in prefixes:
+				if written < prefix <= written + n:
+					offsets[prefix] = f.tell() + sum(len(line) for line in lines[:prefix - written])
+			f.write(''.join(lines))
+			written += n
+	return offsets
+
+def copyPrefix(sourceName, fileName, size):
+	'''
+	Copies the first `size` bytes of a file.
+	'''
+	with open(sourceName, 'rb') as source:
+		with open(fileName, 'wb') as f:
+			while size > 0:
+				block = source.read(min(size, 1 << 24))
+				if not block:
+					break
+				f.write(block)
+				size -= len(block)
+
+def validateArff(spec, fileName):
+	'''
+	Checks that an ARFF file has the header that MOA writes for the given
+	generator and that every data line has a valid value for each attribute.
+	Returns the number of instances, or raises a ValueError.
+	'''
+	generator = createGenerator(spec)
+	header = getHeader(spec, generator)
+	nominals = []
+	for name, kind in generator.attributes:
+		nominals.append(set(kind[1:-1].split(',')) if kind.startswith('{') else None)
+	instances = 0
+	with open(fileName, 'rb') as f:
+		if f.read(len(header)).rstrip() != header.rstrip():
+			raise ValueError('%s does not have the header of %s' % (fileName, spec))
+		for number, line in enumerate(f, header.count('\n') + 1):
+			line = line.strip()
+			if not line:
+				continue
+			values = line.split(',')
+			if len(values) != len(nominals):
+				raise ValueError('%s:%d: %d values instead of %d' % (fileName, number, len(values), len(nominals)))
+			for value, nominal in zip(values, nominals):
+				if (nominal != None and value not in nominal) or (nominal == None and value != '?' \
+						and not re.match(r'^-?\d+(\.\d+)?(E-?\d+)?$', value)):
+					raise ValueError('%s:%d: invalid value %s' % (fileName, number, value))
+			instances += 1
+	return instances
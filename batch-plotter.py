@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import argparse
+import experimentindex
+import glob
+import hashlib
+import json
+import matplotlib
+matplotlib.use('Agg') # batch rendering never shows the figures
+import multiprocessing
+import os
+import plotter
+import sys
+from termcolor import colored
+
+# default options of every figure (the same as the plotter.py arguments)
+figureDefaults = {
+    'title': None,
+    'x_label': 'X',
+    'y_label': 'infer',
+    'parameters': None,
+    'column': None,
+    'black_white': False,
+    'downsample': None,
+    'points': None,
+    'store': None,
+    'index': None,
+    'kind': 'evaluation',
+    'where': None
+}
+
+# columns already loaded by this process, by (file, column, modification time)
+columnsCache = {}
+
+def getFigureArgs(figure, defaults):
+    options = dict(figureDefaults)
+    options.update(defaults)
+    options.update(figure)
+    selectsFiles = 'in_files' in options or (options['index'] != None and options['where'] != None)
+    if options['column'] == None or 'out_file' not in options or not selectsFiles:
+        raise NameError('Every figure needs a column, an out_file and either in_files or an index and a '+
+                        'where predicate: ' + json.dumps(figure))
+    if 'in_files' in options:
+        # expand the glob patterns of the input files
+        inFiles = []
+        for pattern in options['in_files']:
+            inFiles.extend(sorted(glob.glob(pattern)))
+    else:
+        # select the input files from the experiment index
+        index = experimentindex.openIndex(options['index'])
+        outputs = experimentindex.selectOutputs(index, options['kind'], options['where'])
+        inFiles = [output['file'] for output in outputs if os.path.isfile(output['file'])]
+    options['in_files'] = inFiles
+    return argparse.Namespace(**options)
+
+def getSignature(args):
+    '''
+    Identifies the contents of a figure: its options and the current version of
+    each of its input files.
+    '''
+    inputs = [(f, os.path.getmtime(f), os.path.getsize(f)) for f in args.in_files]
+    return hashlib.sha1(json.dumps([sorted(vars(args).items()), inputs])).hexdigest()
+
+def loadColumn(fileName, column):
+    key = (fileName, column, os.path.getmtime(fileName))
+    if key not in columnsCache:
+        with open(fileName, 'rb') as f:
+            columnsCache[key] = plotter.loadColumn(f, column)
+    return columnsCache[key]
+
+def selectData(fileName, args):
+    params = plotter.getParamsForFile(fileName, args)
+    yValues = loadColumn(fileName, args.column)
+    data = plotter.Data(x=plotter.numpy.arange(1, len(yValues) + 1), y=yValues,
+                        legend=plotter.getLegendLabel(params, args))
+    return plotter.downsample(data, args)
+
+def renderFigure(args):
+    try:
+        return args.out_file, doRenderFigure(args)
+    except Exception as e:
+        return args.out_file, '%s: %s' % (type(e).__name__, e)
+
+def doRenderFigure(args):
+    if not args.in_files:
+        return 'no input files'
+    if args.y_label == 'infer':
+        args.y_label = plotter.inferYLabel(args.in_files[0], args.column)
+    selection = [selectData(f, args) for f in args.in_files]
+    figure = plotter.renderFigure(selection, args, args.out_file)
+    plotter.plotter.close(figure)
+    return None
+
+def loadState(stateFile):
+    if os.path.isfile(stateFile):
+        with open(stateFile, 'rb') as f:
+            return json.load(f)
+    return {}
+
+def saveState(state, stateFile):
+    with open(stateFile, 'wb') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+def plotWithManifest(args):
+    with open(args.manifest, 'rb') as f:
+        manifest = json.load(f)
+    figures = [getFigureArgs(figure, manifest.get('defaults', {})) for figure in manifest['figures']]
+
+    # skip the figures whose options and inputs have not changed since the last render
+    stateFile = args.state if args.state != None else args.manifest + '.state'
+    state = loadState(stateFile)
+    signatures = {}
+    pending = []
+    for figure in figures:
+        signatures[figure.out_file] = getSignature(figure)
+        if not args.force and os.path.isfile(figure.out_file) \
+                and state.get(figure.out_file) == signatures[figure.out_file]:
+            print colored('[UP TO DATE]', 'yellow'), figure.out_file
+        else:
+            pending.append(figure)
+
+    # create the output directories up front, not in the processes that render
+    #  the figures, which would race to create a shared one
+    for outDir in sorted(set(os.path.dirname(figure.out_file) for figure in pending)):
+        if outDir and not os.path.isdir(outDir):
+            os.makedirs(outDir)
+
+    # render the figures, in parallel if requested (consecutive figures go to
+    #  the same process, so that they share the data that was already loaded)
+    if args.jobs > 1 and len(pending) > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        chunksize = max(1, len(pending) // (args.jobs * 4))
+        results = pool.imap_unordered(renderFigure, pending, chunksize)
+    else:
+        results = (renderFigure(figure) for figure in pending)
+
+    failed = 0
+    for outFile, error in results:
+        if error == None:
+            print colored('[RENDERED]', 'green'), outFile
+            state[outFile] = signatures[outFile]
+        else:
+            print colored('[FAILED]', 'red'), outFile + ':', error
+            failed += 1
+    saveState(state, stateFile)
+    print colored('[SUMMARY]', 'green'), '%d figure(s): %d rendered, %d up to date, %d failed' \
+            % (len(figures), len(pending) - failed, len(figures) - len(pending), failed)
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                        description='Renders a batch of plots, described in a JSON manifest, in a single execution. '+
+                                    'The manifest has a "figures" list, whose items take the same options as '+
+                                    'plotter.py (e.g. "out_file", "in_files" glob patterns, "column", "parameters", '+
+                                    '"title"), and optional "defaults" shared by all the figures. Instead of '+
+                                    '"in_files", a figure can select its input files from an experiment "index" '+
+                                    'with a "where" SQL predicate (e.g. "code = \'ma\'") over its "kind" of outputs.')
+    parser.add_argument('manifest', help='the JSON plot manifest')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='the number of processes that render the figures in parallel')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='render every figure, even if its inputs have not changed since the last render')
+    parser.add_argument('--state', default=None,
+                        help='the file where the inputs of the rendered figures are tracked. '+
+                                'Defaults to the manifest file name with a .state suffix')
+    args = parser.parse_args()
+
+    # main procedure
+    plotWithManifest(args)
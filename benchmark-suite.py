@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+import argparse
+from filtermappings import getCodedFilterSpec, getFullyQualifiedFilterName
+import json
+import measurestats
+import moatask
+from moatask import MoaTask, JvmOptions
+import os
+import runledger
+import sqlite3
+from subprocess import Popen, STDOUT
+import sys
+import taskrunner
+from termcolor import colored
+import time
+
+# the pinned matrix of the suite: the parameters of the tasks of each filter,
+#  small enough to be run on every build of the libraries
+suite = {
+	'na': ['-a 0.2 -c 0.0'],
+	'ma': ['-k 10 -b 1000', '-k 10 -b 10000'],
+	'dp': ['-k 10 -e 0.1 -b 1000', '-k 10 -e 0.1 -b 10000'],
+	'rs': ['-p 25 -b 1000', '-p 25 -b 10000']
+}
+
+# the stream of every task (generated in the JVM, not to measure the disk)
+suiteStream = 'generators.RandomRBFGenerator'
+
+# global flags
+databaseFile = 'benchmarks.db'
+logsDir = 'benchmark-logs'
+instances = 100000
+warmups = 2
+repetitions = 7
+# the command that executes the MOA tasks, with the options of moa.sh (e.g. the
+#  client of moa-worker.py, or a fake moa.sh), or None to launch their JVMs directly
+moaCommand = None
+cpus = None
+
+# a regression: the median throughput drops more than this fraction...
+threshold = 0.05
+# ...and the drop is significant (one-sided Mann-Whitney test)
+alpha = 0.05
+
+def openDatabase(path):
+	'''
+	Opens (or creates) the database of the benchmark baselines: the settings
+	of each named baseline, and the throughput of each of its repetitions.
+	'''
+	database = sqlite3.connect(path)
+	database.execute('''CREATE TABLE IF NOT EXISTS baselines (
+							name TEXT PRIMARY KEY,
+							created REAL,
+							instances INTEGER,
+							jars TEXT)''')
+	database.execute('''CREATE TABLE IF NOT EXISTS measurements (
+							baseline TEXT,
+							filter TEXT,
+							spec TEXT,
+							repetition INTEGER,
+							elapsed REAL,
+							throughput REAL)''')
+	database.execute('CREATE INDEX IF NOT EXISTS measurements_baseline ON measurements (baseline)')
+	return database
+
+def getSuiteSpecs(filterCodes):
+	'''
+	Returns the (filter code, filter specification) pairs of the matrix.
+	'''
+	return [(code, getFullyQualifiedFilterName(code) + ' ' + params)
+			for code in filterCodes for params in suite[code]]
+
+def getLogFile(filterSpec):
+	return os.path.join(logsDir, getCodedFilterSpec(filterSpec) + '.log')
+
+def measureTask(filterSpec):
+	'''
+	Executes a task of the suite, returning its elapsed (wall-clock) seconds,
+	or None if it failed (its output is kept in its log).
+	'''
+	task = MoaTask(task='Anonymize', stream=suiteStream, filterSpec=filterSpec, params=[('-m', str(instances))])
+	cmd = moatask.getArgv(task, JvmOptions(silenceError=True), moaCommand)
+	if cpus != None:
+		cmd = taskrunner.pinCmd(cmd, cpus)
+	logFile = getLogFile(filterSpec)
+	taskrunner.ensureDir(logsDir)
+	with open(logFile, 'w') as log:
+		start = time.time()
+		process = Popen(cmd, stdout=log, stderr=STDOUT)
+		returncode = process.wait()
+		elapsed = time.time() - start
+	return elapsed if returncode == 0 else None
+
+def runSuite(specs):
+	'''
+	Executes the warm-up and measured repetitions of every task of the
+	matrix, one at a time. Returns the (filter code, spec, repetition,
+	elapsed, throughput) of the measured ones, or None if a task failed.
+	'''
+	measurements = []
+	for code, filterSpec in specs:
+		for repetition in range(-warmups, repetitions):
+			elapsed = measureTask(filterSpec)
+			if elapsed == None:
+				print colored('[FAILED]', 'red'), '%s (log: %s)' % (filterSpec, getLogFile(filterSpec))
+				return None
+			if repetition < 0:
+				continue
+			measurements.append((code, filterSpec, repetition, elapsed, instances / elapsed))
+		throughputs = [m[4] for m in measurements if m[1] == filterSpec]
+		print colored('[MEASURED]', 'green'), '%s: %.0f instances/s (MAD %.0f, %d repetition(s), %d warm-up(s))' \
+				% (filterSpec, measurestats.median(throughputs), measurestats.mad(throughputs), repetitions, warmups)
+	return measurements
+
+def saveBaseline(database, name, measurements):
+	with database:
+		database.execute('DELETE FROM measurements WHERE baseline = ?', (name,))
+		database.execute('INSERT OR REPLACE INTO baselines (name, created, instances, jars) VALUES (?, ?, ?, ?)',
+						(name, time.time(), instances, json.dumps(runledger.getJarChecksums())))
+		database.executemany('INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?)',
+							[(name,) + m for m in measurements])
+	print colored('[SAVED]', 'green'), 'baseline %s (%d measurement(s)) in %s' % (name, len(measurements), databaseFile)
+
+def loadBaseline(database, name):
+	'''
+	Returns the settings of a baseline and its throughputs by (filter code,
+	spec), or None if there is no such baseline.
+	'''
+	settings = database.execute('SELECT instances, jars FROM baselines WHERE name = ?', (name,)).fetchone()
+	if settings == None:
+		return None
+	throughputs = {}
+	rows = database.execute('SELECT filter, spec, throughput FROM measurements WHERE baseline = ? ORDER BY rowid',
+							(name,))
+	for code, filterSpec, throughput in rows:
+		throughputs.setdefault((code, filterSpec), []).append(throughput)
+	return settings, throughputs
+
+def getThroughputs(measurements):
+	throughputs = {}
+	for code, filterSpec, repetition, elapsed, throughput in measurements:
+		throughputs.setdefault((code, filterSpec), []).append(throughput)
+	return throughputs
+
+def compareSpec(baseline, current):
+	'''
+	Compares the throughputs of a task in a baseline and in a later run.
+	Returns the relative change of their medians, the p-value of the current
+	throughput being lower, and whether it is a regression.
+	'''
+	baselineMedian = measurestats.median(baseline)
+	change = (measurestats.median(current) - baselineMedian) / baselineMedian
+	u, p = measurestats.mannWhitney(current, baseline)
+	return change, p, change < -threshold and p < alpha
+
+def compare(baseline, current):
+	'''
+	Prints the report of a comparison, per filter, and returns the codes of
+	the filters that regressed (in any of their tasks).
+	'''
+	regressed = []
+	codes = sorted(set(code for code, filterSpec in current))
+	for code in codes:
+		filterRegressed = False
+		print colored('[FILTER]', 'green'), '%s (%s)' % (code, getFullyQualifiedFilterName(code))
+		for key in sorted(k for k in current if k[0] == code):
+			if key not in baseline:
+				print '    %s: %.0f instances/s, not in the baseline' % (key[1], measurestats.median(current[key]))
+				continue
+			change, p, isRegression = compareSpec(baseline[key], current[key])
+			filterRegressed = filterRegressed or isRegression
+			if isRegression:
+				verdict = colored('REGRESSED', 'red')
+			elif change > threshold and measurestats.mannWhitney(baseline[key], current[key])[1] < alpha:
+				verdict = colored('IMPROVED', 'green')
+			else:
+				verdict = 'unchanged'
+			print '    %s: %.0f -> %.0f instances/s (MAD %.0f -> %.0f), %+.1f%%, p = %.3f: %s' \
+					% (key[1], measurestats.median(baseline[key]), measurestats.median(current[key]),
+						measurestats.mad(baseline[key]), measurestats.mad(current[key]), 100 * change, p, verdict)
+		if filterRegressed:
+			regressed.append(code)
+	return regressed
+
+def checkSettings(name, settings):
+	baselineInstances, jars = settings
+	if baselineInstances != instances:
+		print colored('[WARNING]', 'yellow'), 'baseline %s was measured with %d instances per task, not %d' \
+				% (name, baselineInstances, instances)
+	same = json.loads(jars) == runledger.getJarChecksums()
+	print colored('[BASELINE]', 'green'), '%s, measured with %s libraries' % (name, 'the same' if same else 'other')
+
+def getRepetitionsError(current, baseline):
+	'''
+	Returns why a regression can't be found between samples of these sizes,
+	if the Mann-Whitney test can't reach the significance level with them, or
+	None.
+	'''
+	p = measurestats.getMinimumPValue(current, baseline)
+	if p < alpha:
+		return None
+	return '%d repetitions against %d can\'t be significant at p < %.2f (the smallest p-value is %.3f)' \
+			% (current, baseline, alpha, p)
+
+def getRepetitions(throughputs):
+	return min(len(t) for t in throughputs.values())
+
+def printVerdict(regressed):
+	if regressed:
+		print colored('[REGRESSION]', 'red'), 'throughput of %s dropped more than %.0f%% (p < %.2f)' \
+				% (', '.join(regressed), 100 * threshold, alpha)
+	else:
+		print colored('[PASSED]', 'green'), 'no throughput regression beyond %.0f%%' % (100 * threshold)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Benchmarks the throughput of the privacy filters on a pinned matrix of small '+
+									'tasks (with warm-up and repeated runs), stores it as a named baseline, and compares '+
+									'later runs against a baseline (medians, MADs and a Mann-Whitney test), exiting '+
+									'with an error when a filter regresses.')
+	parser.add_argument('--db', default=databaseFile,
+						help='the database (SQLite) where the baselines are stored')
+	subparsers = parser.add_subparsers(dest='command')
+
+	runParser = subparsers.add_parser('run', help='run the suite, then save and/or compare its results')
+	runParser.add_argument('-s', '--save', default=None, metavar='NAME',
+						help='save the results as this baseline (replacing a previous one with the same name)')
+	runParser.add_argument('-b', '--baseline', default=None, metavar='NAME',
+						help='compare the results against this baseline')
+	runParser.add_argument('-F', '--filters', nargs='+', choices=sorted(suite.keys()), default=sorted(suite.keys()),
+						help='the filters to benchmark')
+	runParser.add_argument('-m', '--instances', type=int, default=instances,
+						help='the instances anonymized by each task')
+	runParser.add_argument('-W', '--warmups', type=int, default=warmups,
+						help='the runs of each task before the measured ones, not recorded')
+	runParser.add_argument('-n', '--repetitions', type=int, default=repetitions,
+						help='the measured runs of each task, enough for the Mann-Whitney test to reach the '+
+								'significance level (at least 4 for 0.05)')
+	runParser.add_argument('--cpus', default=None,
+						help='pin the tasks to this set of CPUs (with taskset), e.g. 0-3')
+	runParser.add_argument('-w', '--worker', default=None,
+						help='execute the MOA tasks on the warm JVMs of the moa-worker.py daemon listening on this '+
+								'Unix socket (the warm-up runs then warm the JIT up), instead of launching a JVM per run')
+	runParser.add_argument('-c', '--moa-cmd', default=None,
+						help='the command (with the options of moa.sh) that executes the MOA tasks, e.g. ./moa.sh or '+
+								'a fake one for testing, instead of launching a JVM per run')
+	runParser.add_argument('--logs-dir', default=logsDir,
+						help='the directory where the output of the last run of each task is logged')
+
+	compareParser = subparsers.add_parser('compare', help='compare two stored baselines')
+	compareParser.add_argument('baseline', help='the reference baseline')
+	compareParser.add_argument('current', help='the baseline compared against the reference')
+
+	subparsers.add_parser('list', help='list the stored baselines')
+
+	for subparser in (runParser, compareParser):
+		subparser.add_argument('-t', '--threshold', type=float, default=threshold,
+						help='the drop of the median throughput (e.g. 0.05 for 5%%) beyond which a significant '+
+								'change is a regression')
+		subparser.add_argument('-a', '--alpha', type=float, default=alpha,
+						help='the significance level of the Mann-Whitney test')
+	args = parser.parse_args()
+
+	databaseFile = args.db
+	database = openDatabase(databaseFile)
+	if args.command == 'list':
+		for name, created, baselineInstances in database.execute(
+				'SELECT name, created, instances FROM baselines ORDER BY created'):
+			count = database.execute('SELECT COUNT(*) FROM measurements WHERE baseline = ?', (name,)).fetchone()[0]
+			print '%s: %s, %d instances per task, %d measurement(s)' \
+					% (name, time.strftime('%Y-%m-%d %H:%M', time.localtime(created)), baselineInstances, count)
+		sys.exit(0)
+
+	threshold = args.threshold
+	alpha = args.alpha
+	if args.command == 'compare':
+		reference = loadBaseline(database, args.baseline)
+		current = loadBaseline(database, args.current)
+		for name, loaded in ((args.baseline, reference), (args.current, current)):
+			if loaded == None:
+				print 'ERROR: there is no baseline %s in %s' % (name, databaseFile)
+				sys.exit(1)
+		error = getRepetitionsError(getRepetitions(current[1]), getRepetitions(reference[1]))
+		if error != None:
+			print colored('[WARNING]', 'yellow'), error
+		regressed = compare(reference[1], current[1])
+		printVerdict(regressed)
+		sys.exit(1 if regressed else 0)
+
+	instances = args.instances
+	warmups = args.warmups
+	repetitions = args.repetitions
+	cpus = args.cpus
+	logsDir = args.logs_dir
+	if args.repetitions < 2:
+		print 'ERROR: at least 2 repetitions are needed to compare the throughputs'
+		sys.exit(1)
+	reference = None
+	if args.baseline != None:
+		reference = loadBaseline(database, args.baseline)
+		if reference == None:
+			print 'ERROR: there is no baseline %s in %s' % (args.baseline, databaseFile)
+			sys.exit(1)
+	# a baseline being saved is compared later against as many repetitions
+	error = getRepetitionsError(repetitions, getRepetitions(reference[1]) if reference != None else repetitions)
+	if error != None:
+		print 'ERROR: %s' % error
+		sys.exit(1)
+	if args.worker != None:
+		moaCommand = './moa-worker.py run -s %s' % args.worker
+	elif args.moa_cmd != None:
+		moaCommand = args.moa_cmd
+	else:
+		try:
+			moatask.checkLibraries()
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
+
+	measurements = runSuite(getSuiteSpecs(args.filters))
+	if measurements == None:
+		sys.exit(1)
+	if args.save != None:
+		saveBaseline(database, args.save, measurements)
+	if reference != None:
+		checkSettings(args.baseline, reference[0])
+		regressed = compare(reference[1], getThroughputs(measurements))
+		printVerdict(regressed)
+		if regressed:
+			sys.exit(1)
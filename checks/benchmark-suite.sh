@@ -0,0 +1,16 @@
+#! /bin/bash
+
+# Checks that benchmark-suite.py saves a baseline, fails a run whose tasks
+#  got slower than it and passes an unchanged one, with the fake moa.sh
+
+cd "$(dirname "$0")/.."
+. checks/common.sh
+
+suite="./benchmark-suite.py run -F na -m 1000 -W 1 -n 5 -c ./checks/fake-moa.sh"
+
+FAKE_MOA_SLEEP=0.2 expect 0 $suite -s base
+FAKE_MOA_SLEEP=0.4 expect 1 $suite -b base
+expectOutput REGRESSION
+FAKE_MOA_SLEEP=0.2 expect 0 $suite -b base
+expectOutput PASSED
+finish
@@ -0,0 +1,84 @@
+# helpers of the checks, sourced from the root of the repository. The checks
+#  run in a scratch directory where the scripts are linked, so that their
+#  outputs (logs, ledgers, reports...) don't land in the repository. Each
+#  expectation runs a command and compares its exit code
+
+failures=0
+background=""
+work=$(mktemp -d)
+log=$work/expect.log
+trap 'kill $background 2> /dev/null; wait; rm -rf $work' EXIT
+ln -s "$(pwd)"/*.py "$(pwd)"/moa.sh "$(pwd)"/checks "$(pwd)"/config "$(pwd)"/worker $work
+cd $work
+
+function fail {
+  echo "[FAILED] $1"
+  failures=$((failures + 1))
+}
+
+function expect {
+  local expected=$1
+  shift
+  "$@" > $log 2>&1
+  local actual=$?
+  if [[ $actual -eq $expected ]]; then
+    echo "[PASSED] $*"
+  else
+    fail "$* exited with $actual, not $expected:"
+    cat $log
+  fi
+}
+
+function expectOutput {
+  # checks the output of the last expectation
+  if grep -q -- "$1" $log; then
+    echo "[PASSED] output has \"$1\""
+  else
+    fail "output lacks \"$1\":"
+    cat $log
+  fi
+}
+
+function expectCount {
+  # checks the lines of the output of the last expectation that match
+  local count=$(grep -c -- "$1" $log)
+  if [[ $count -eq $2 ]]; then
+    echo "[PASSED] output has $2 line(s) with \"$1\""
+  else
+    fail "output has $count line(s) with \"$1\", not $2"
+  fi
+}
+
+function expectFiles {
+  local count=$(ls $1 2> /dev/null | wc -l)
+  if [[ $count -eq $2 ]]; then
+    echo "[PASSED] $2 file(s) at $1"
+  else
+    fail "$count file(s) at $1, not $2"
+  fi
+}
+
+function start {
+  # runs a command in the background (killed at exit), logging to $1
+  local output=$1
+  shift
+  "$@" > $output 2>&1 &
+  background="$background $!"
+}
+
+function waitFor {
+  # waits up to 10 seconds for a file (e.g. a socket) to exist
+  for i in $(seq 100); do
+    [[ -e "$1" ]] && return 0
+    sleep 0.1
+  done
+  return 1
+}
+
+function finish {
+  if [[ $failures -gt 0 ]]; then
+    echo "$failures expectation(s) failed"
+    exit 1
+  fi
+  exit 0
+}
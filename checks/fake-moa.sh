@@ -0,0 +1,20 @@
+#! /bin/bash
+
+# A stand-in for moa.sh that takes the same options and echoes the task
+#  instead of executing it, after sleeping FAKE_MOA_SLEEP seconds (0.1 by
+#  default), so that the throughput of the tasks can be controlled
+
+silenceOutput=false
+while [[ "$1" == -* ]]; do
+  case "$1" in
+    -e|--silence-error) shift ;;
+    -o|--silence-output) silenceOutput=true; shift ;;
+    -x|--max-heap|-g|--gc-log) shift 2 ;;
+    *) echo "Unknown option: $1" >&2; exit 1 ;;
+  esac
+done
+
+sleep ${FAKE_MOA_SLEEP:-0.1}
+if [[ $silenceOutput == false ]]; then
+  echo "fake: $*"
+fi
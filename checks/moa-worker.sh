@@ -0,0 +1,27 @@
+#! /bin/bash
+
+# Checks the warm worker daemon of moa-worker.py with stub workers: a task
+#  submitted with its client, a sweep of anonymize.py on it, and its shutdown
+
+cd "$(dirname "$0")/.."
+. checks/common.sh
+
+start serve.log ./moa-worker.py serve -s moa.sock -n 2 -c "./moa-worker.py stub"
+daemon=$!
+expect 0 waitFor moa.sock
+expect 0 ./moa-worker.py run -s moa.sock -e "Anonymize -m 1000"
+expectOutput "stub: Anonymize -m 1000"
+# the task reaches the worker verbatim, but a tab would split the request
+expect 0 ./moa-worker.py run -s moa.sock "Anonymize -m 1000 -r 'two  spaces.txt'"
+expectOutput "stub: Anonymize -m 1000 -r 'two  spaces.txt'"
+expect 1 ./moa-worker.py run -s moa.sock "$(printf 'Anonymize\t-m 1000')"
+expect 0 ./anonymize.py config/test-anonymize.json -w moa.sock
+expectCount "^stub: Anonymize .*NoiseAdditionFilter" 5
+expect 1 ./anonymize.py config/test-anonymize.json -w moa.sock -P
+expect 1 ./scalability.py config/test-scalability.json -w moa.sock -P
+expect 0 kill $daemon
+expect 0 wait $daemon
+expect 1 test -e moa.sock
+expect 0 cat serve.log
+expectCount "Started worker" 2
+finish
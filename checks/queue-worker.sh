@@ -0,0 +1,26 @@
+#! /bin/bash
+
+# Checks a distributed sweep: anonymize.py queues its tasks as a coordinator
+#  and two queue-worker.py workers execute them, on the stub workers of the
+#  moa-worker.py daemon
+
+cd "$(dirname "$0")/.."
+. checks/common.sh
+
+start serve.log ./moa-worker.py serve -s moa.sock -n 2 -c "./moa-worker.py stub"
+expect 0 waitFor moa.sock
+start worker1.log ./queue-worker.py -i one queue.db
+first=$!
+start worker2.log ./queue-worker.py -i two queue.db
+second=$!
+expect 0 ./anonymize.py config/test-anonymize.json -q queue.db -w moa.sock
+expectCount "\[DONE\]" 5
+expect 0 ./queue-worker.py --drain queue.db
+expect 0 kill $first $second
+expect 0 wait $first
+expect 0 wait $second
+expect 0 grep "\[DONE\]" worker1.log
+expect 0 grep "\[DONE\]" worker2.log
+expect 0 cat worker1.log worker2.log
+expectCount "\[DONE\]" 5
+finish
@@ -0,0 +1,28 @@
+#! /bin/bash
+
+# Checks the batch mode of report-dumper.py on two stub workers: every report
+#  dumped to its own file, then only the ones newer than their dump
+
+cd "$(dirname "$0")/.."
+. checks/common.sh
+
+mkdir report dumps
+for a in 0.1 0.2 0.3 0.4 0.5; do
+  echo "report" > report/na-c0.0-a${a}.txt
+done
+dumper=(./report-dumper.py -b -j 2 -c "./moa-worker.py stub" -o dumps -r report/*.txt)
+
+expect 0 "${dumper[@]}"
+expectCount "\[DUMPED\]" 5
+expectFiles "dumps/*.txt" 5
+expect 0 cat dumps/na-c0.0-a0.3.txt
+expectOutput "stub: ReadAnonymizationReport -r report/na-c0.0-a0.3.txt"
+expectFiles "dumps/*.tmp dumps/*.err" 0
+
+# only the report written after its dump is dumped again
+sleep 1
+touch report/na-c0.0-a0.2.txt
+expect 0 "${dumper[@]}"
+expectCount "\[DUMPED\]" 1
+expectOutput "4 skipped"
+finish
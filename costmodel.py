@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import math
+import memorymodel
+
+# seconds that every task pays to start the JVM and load MOA, before any history
+startupTime = 5.0
+
+# the cost of a distance computation and of a comparison between two buffered
+#  instances, relative to the cost of processing an instance
+distanceCost = 0.01
+comparisonCost = 0.01
+
+# per-filter seconds per work unit (see getWorkUnits), before any history
+defaultRates = {
+	'na': 2e-5,
+	'ma': 1e-5,
+	'dp': 1e-5,
+	'rs': 2e-5
+}
+
+def getWorkUnits(filterSpec, instances):
+	'''
+	The work of an anonymization task, in instances processed. The filters
+	that partition each buffer of b instances in groups of k (MDAV-like) also
+	compute about b/k distances per instance; the other buffered filters sort
+	their buffer (e.g. rank swapping), about log2(b) comparisons per instance.
+	'''
+	code, params = memorymodel.parseFilterSpec(filterSpec)
+	buffered = params.get('b', 0.0)
+	if memorymodel.coefficients[code]['cluster'] > 0:
+		k = max(params.get('k', 1.0), 1.0)
+		return float(instances) * (1 + distanceCost * buffered / k)
+	return float(instances) * (1 + comparisonCost * math.log(1 + buffered, 2))
+
+def loadHistory(ledger):
+	'''
+	Returns the (work units, elapsed seconds) of the completed runs of the
+	ledger, by filter code.
+	'''
+	history = {}
+	rows = ledger.execute('SELECT filter, instances, finished - started FROM runs WHERE status = ?', ('done',))
+	for filterSpec, instances, elapsed in rows:
+		try:
+			code = memorymodel.parseFilterSpec(filterSpec)[0]
+			units = getWorkUnits(filterSpec, instances)
+		except (KeyError, ValueError, IndexError):
+			continue
+		history.setdefault(code, []).append((units, elapsed))
+	return history
+
+def fitModel(history):
+	'''
+	Fits the runtime of the tasks of each filter as a fixed cost plus a cost
+	per work unit (least squares), over its history. With a single run, or
+	runs of a single size, only the cost per unit is fitted.
+	'''
+	model = {}
+	for code, runs in history.items():
+		n = float(len(runs))
+		meanUnits = sum(u for u, e in runs) / n
+		meanElapsed = sum(e for u, e in runs) / n
+		variance = sum((u - meanUnits) ** 2 for u, e in runs)
+		if variance > 0:
+			rate = sum((u - meanUnits) * (e - meanElapsed) for u, e in runs) / variance
+			base = meanElapsed - rate * meanUnits
+			if rate > 0 and base >= 0:
+				model[code] = (base, rate)
+				continue
+		base = min(startupTime, meanElapsed)
+		model[code] = (base, (meanElapsed - base) / meanUnits if meanUnits > 0 else 0.0)
+	return model
+
+def estimateRuntime(model, filterSpec, instances):
+	'''
+	Estimates the seconds that an anonymization task takes, from the model
+	fitted over the history of its filter or, without history, the defaults.
+	'''
+	code = memorymodel.parseFilterSpec(filterSpec)[0]
+	base, rate = model.get(code, (startupTime, defaultRates.get(code, max(defaultRates.values()))))
+	return base + rate * getWorkUnits(filterSpec, instances)
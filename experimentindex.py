@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+from filtermappings import getFilterCode
+import os
+import sqlite3
+
+def decodeValue(value):
+	'''
+	Converts a textual parameter value to an int or a float.
+	'''
+	try:
+		return int(value)
+	except ValueError:
+		return float(value)
+
+def parseFilterSpec(filterSpec):
+	'''
+	Splits a filter specification ("microaggregation.MicroAggregationFilter -k 3 -e 0.1")
+	into its filter name and the ordered list of its (name, typed value) parameters.
+	'''
+	components = filterSpec.split()
+	params = []
+	for i in range(1, len(components) - 1, 2):
+		params.append((components[i].lstrip('-'), decodeValue(components[i+1])))
+	return components[0], params
+
+def getStem(path):
+	return os.path.splitext(os.path.basename(path))[0]
+
+def openIndex(path):
+	index = sqlite3.connect(path)
+	index.execute('''CREATE TABLE IF NOT EXISTS outputs (
+						file TEXT PRIMARY KEY,
+						stem TEXT,
+						kind TEXT,
+						filter TEXT,
+						code TEXT,
+						stream TEXT,
+						instances INTEGER,
+						replica INTEGER)''')
+	index.execute('CREATE INDEX IF NOT EXISTS outputs_stem ON outputs (stem)')
+	index.execute('CREATE INDEX IF NOT EXISTS outputs_selection ON outputs (kind, code, stream)')
+	index.execute('''CREATE TABLE IF NOT EXISTS params (
+						file TEXT,
+						position INTEGER,
+						name TEXT,
+						value NUMERIC)''')
+	index.execute('CREATE INDEX IF NOT EXISTS params_file ON params (file)')
+	index.commit()
+	return index
+
+def registerOutput(index, path, kind, filterSpec, stream, instances, replica=None):
+	'''
+	Records the experiment metadata of an output file. The changes are not
+	committed, so that a whole grid can be registered in a single transaction.
+	'''
+	path = os.path.normpath(path)
+	filterName, params = parseFilterSpec(filterSpec)
+	index.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				(path, getStem(path), kind, filterName, getFilterCode(filterName),
+				stream.split('.')[1], int(instances) if instances != None else None, replica))
+	index.execute('DELETE FROM params WHERE file = ?', (path,))
+	index.executemany('INSERT INTO params VALUES (?, ?, ?, ?)',
+				[(path, i, name, value) for i, (name, value) in enumerate(params)])
+
+def getMetadata(index, row):
+	names = ['file', 'stem', 'kind', 'filter', 'code', 'stream', 'instances', 'replica']
+	metadata = dict(zip(names, row))
+	metadata['params'] = index.execute('SELECT name, value FROM params WHERE file = ? ORDER BY position',
+				(metadata['file'],)).fetchall()
+	return metadata
+
+def lookup(index, path):
+	'''
+	Returns the metadata of a file (a dictionary with its filter, code, stream,
+	instances, replica and ordered (name, value) params), or None if it is not
+	indexed. Files that are not found by their path are looked up by their name
+	(e.g. dumped reports, written to another directory with the same name).
+	'''
+	row = index.execute('SELECT * FROM outputs WHERE file = ?', (os.path.normpath(path),)).fetchone()
+	if row == None:
+		rows = index.execute('SELECT * FROM outputs WHERE stem = ?', (getStem(path),)).fetchall()
+		if len(set((r[3], r[5], r[6]) for r in rows)) != 1:
+			return None # unknown or ambiguous
+		row = rows[0]
+	return getMetadata(index, row)
+
+def selectOutputs(index, kind, where=None):
+	'''
+	Selects the metadata of the outputs of a kind, optionally filtered by an SQL
+	predicate over the outputs columns (e.g. "code = 'ma' AND instances = 1000").
+	'''
+	sql = 'SELECT * FROM outputs WHERE kind = ?'
+	if where != None:
+		sql += ' AND (%s)' % where
+	rows = index.execute(sql + ' ORDER BY file', (kind,)).fetchall()
+	return [getMetadata(index, row) for row in rows]
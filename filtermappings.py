@@ -12,6 +12,12 @@ filtersInverseMap = {v: k for k, v in filtersMap.items()}
 def getFilterCode(filterName):
 	return filtersMap[filterName]
 
+def getCodedFilterSpec(filterSpec):
+	filterComponents = filterSpec.split(' ')
+	filterName = filterComponents[0]
+	filterParams = ''.join(filterComponents[1:len(filterComponents)])
+	return getFilterCode(filterName) + filterParams
+
 def getFilterName(filterCode):
 	return filtersInverseMap[filterCode].split('.')[1]
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import matplotlib
+matplotlib.use('Agg') # the plots are only written to files
+import matplotlib.pyplot as pyplot
+import measurestats
+import numpy
+import os
+import plotter
+import scalingmodel
+import sys
+from termcolor import colored
+
+# global flags
+confidence = 0.95
+
+def readSeries(fileName, column):
+	'''
+	Reads the sizes (the discriminant parameter, first column) and the values
+	of a column of a scalability CSV file, skipping the replicas without a
+	value. Returns the name of the discriminant parameter and the two arrays,
+	or None if the file has no such column.
+	'''
+	with open(fileName, 'rb') as f:
+		reader = csv.reader(f)
+		header = next(reader)
+		if column not in header:
+			return None
+		index = header.index(column)
+		x = []
+		y = []
+		for row in reader:
+			try:
+				x.append(float(row[0]))
+				y.append(float(row[index]))
+			except (ValueError, IndexError):
+				continue
+	return header[0], numpy.array(x), numpy.array(y)
+
+def formatPrediction(value, low, high, unit):
+	return '%.4g%s [%.4g, %.4g]' % (value, unit, low, high)
+
+def reportFit(label, x, y, fits, sizes, unit, allModels):
+	'''
+	Prints the best fit of a measure (and the others, if requested) and its
+	predictions at the given sizes, with their confidence bands.
+	'''
+	if not fits:
+		print '    %s: no growing model fits (or not enough points)' % label
+		return
+	for i, fit in enumerate(fits if allModels else fits[:1]):
+		print '    %s: %s%s (%s, R^2 = %.4f, %d points)' \
+				% (label, colored(fit.model, 'cyan') if i == 0 else fit.model, ' (best)' if i == 0 else '',
+					scalingmodel.describe(fit), fit.r2, len(x))
+	values, lows, highs = scalingmodel.predict(fits[0], sizes, confidence)
+	for size, value, low, high in zip(sizes, values, lows, highs):
+		extrapolation = size / x.max()
+		print '        at %g: %s%s%s' % (size, formatPrediction(value, low, high, unit),
+				' (%.0fx beyond the largest size tested)' % extrapolation if extrapolation > 1 else '',
+				colored(' (unreliable: the band reaches %.4g)' % low, 'red') if low <= 0 else '')
+
+def plotFits(ax, series, sizes, options):
+	'''
+	Plots the measurements of a file (markers), the best fitted curve up to
+	the largest predicted size and its confidence band, with the styling of
+	plotter.py.
+	'''
+	label, x, y, fit = series
+	ax.plot(x, y, label='_nolegend_', color=options['color'], marker=options['marker'] or 'o',
+			linestyle='None', markersize=4.0)
+	if fit == None:
+		return
+	curveX = numpy.linspace(x.min(), max([x.max()] + list(sizes)), 200)
+	curve, low, high = scalingmodel.predict(fit, curveX, confidence)
+	plotter.plotDataSeries(ax, plotter.Data(x=curveX, y=curve, legend='%s (%s)' % (label, fit.model)), options)
+	ax.fill_between(curveX, low, high, color=options['color'], alpha=0.15, linewidth=0)
+
+def renderFits(allSeries, sizes, args, xLabel, yLabel, outFile):
+	lineOptions = plotter.getPlotOptions(args)
+	figure = pyplot.figure()
+	ax = figure.add_subplot(111)
+	for i, series in enumerate(allSeries):
+		if i >= len(lineOptions):
+			raise NameError('You are trying to plot too many data series. No more line style combinations are possible.')
+		plotFits(ax, series, sizes, lineOptions[i])
+	if args.log:
+		ax.set_xscale('log')
+		ax.set_yscale('log')
+	ax.set_xlabel(xLabel)
+	ax.set_ylabel(yLabel)
+	if args.title != None:
+		ax.set_title(args.title)
+	plotter.formatAxes(ax)
+	legend = plotter.makeLegend(ax)
+	plotter.exportTo(figure, outFile, legend)
+
+def fitFiles(args):
+	runtimeSeries = []
+	memorySeries = []
+	xLabel = None
+	for fileName in args.files:
+		label = os.path.splitext(os.path.basename(fileName))[0]
+		runtime = readSeries(fileName, args.measure)
+		if runtime == None:
+			print 'ERROR: %s has no %s column' % (fileName, args.measure)
+			sys.exit(1)
+		xLabel, x, y = runtime
+		if len(x) == 0:
+			print colored('[WARNING]', 'yellow'), '%s has no %s measurements' % (fileName, args.measure)
+			continue
+		print colored('[FIT]', 'green'), '%s (%s from %g to %g)' % (fileName, xLabel, x.min(), x.max())
+		fits = scalingmodel.fitModels(x, y, args.predict)
+		reportFit(args.measure, x, y, fits, args.predict, 's' if args.measure == 'elapsed' else '', args.all_models)
+		runtimeSeries.append((label, x, y, fits[0] if fits else None))
+
+		memory = readSeries(fileName, args.memory)
+		if memory == None:
+			continue
+		xLabel, x, y = memory
+		if len(x) == 0:
+			continue
+		fits = scalingmodel.fitModels(x, y, args.predict)
+		reportFit(args.memory, x, y, fits, args.predict, 'MB' if args.memory == 'peakRss' else '', args.all_models)
+		memorySeries.append((label, x, y, fits[0] if fits else None))
+
+	if args.out_file != None:
+		renderFits(runtimeSeries, args.predict, args, xLabel, args.measure, args.out_file)
+		print colored('[PLOTTED]', 'green'), args.out_file
+	if args.memory_out_file != None:
+		if not memorySeries:
+			print colored('[WARNING]', 'yellow'), 'no file has a %s column: %s not plotted' \
+					% (args.memory, args.memory_out_file)
+		else:
+			renderFits(memorySeries, args.predict, args, xLabel, args.memory, args.memory_out_file)
+			print colored('[PLOTTED]', 'green'), args.memory_out_file
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Fits complexity models (linear, n log n, quadratic and power law) to the '+
+									'scalability CSV files of scalability.py, one per configuration (filter and its '+
+									'other parameters), reports the best fit with its confidence band, predicts the '+
+									'runtime and memory at untested sizes, and plots the fitted curves.')
+	parser.add_argument('files', nargs='+', help='the scalability CSV files')
+	parser.add_argument('-m', '--measure', default='elapsed',
+						help='the column of the runtime: "elapsed" (the wall-clock seconds of each run) or another '+
+								'column of the files')
+	parser.add_argument('--memory', default='peakRss',
+						help='the column of the memory (peakRss, the peak resident MB of the runs profiled with '+
+								'scalability.py -P); files without it are only fitted for the runtime')
+	parser.add_argument('-P', '--predict', nargs='+', type=float, default=[1000000],
+						help='the sizes (values of the discriminant parameter) to predict the runtime and memory at')
+	parser.add_argument('--confidence', type=float, default=confidence, choices=measurestats.confidenceLevels,
+						help='the confidence level of the bands')
+	parser.add_argument('-a', '--all-models', action='store_true',
+						help='report every model that could be fitted, not only the best one')
+	parser.add_argument('-o', '--out-file', default=None,
+						help='plot the runtime measurements and fitted curves (with their bands) to this file')
+	parser.add_argument('--memory-out-file', default=None,
+						help='plot the memory measurements and fitted curves to this file')
+	parser.add_argument('-l', '--log', action='store_true',
+						help='plot with logarithmic axes')
+	parser.add_argument('-w', '--black-white', action='store_true',
+						help='build the plots using a black and white scheme (use ticks, instead of color)')
+	parser.add_argument('-t', '--title', default=None,
+						help='the title for the plots')
+	args = parser.parse_args()
+
+	confidence = args.confidence
+	fitFiles(args)
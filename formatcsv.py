@@ -2,42 +2,113 @@
 
 from __future__ import print_function
 import argparse
+import multiprocessing
 import os
+import shutil
+import sys
 
-def writeToFile(out, string):
-	print(string, file=out)
-
-def reformatRow(numbers):
-	s = ''
-	s += numbers[0] + '.' + numbers[1]
-	s += ','
-	s += numbers[2] + '.' + numbers[3]
-	s += ','
-	s += numbers[4] + '.' + numbers[5]
-	return s
-
-def reformatFile(file, outDir, suffix):
-	o = outDir + '/' + os.path.basename(file.name) + '.' + suffix
-	with open(o, 'wb') as outFile:
-		lines = file.readlines()
-		for i, row in enumerate(lines, 0):
-			if i == 0:
-				writeToFile(outFile, row.strip())
-			else:
-				numbers = row.strip().split(',')
-				writeToFile(outFile, reformatRow(numbers))
-
-def reformatFiles(files, outDir, suffix):
-	for f in files:
-		with open(f, 'rb') as file:
-			reformatFile(file, outDir, suffix)
+# bytes of lines read (and repaired) at once, bounding the memory used per file
+chunkSize = 1 << 23
+
+def reformatRow(fields, columns):
+	'''
+	Repairs a row whose decimal numbers were written with a decimal comma: a
+	row of N columns was split into 2N fields, which are joined in pairs.
+	Rows that already have N fields are kept as they are. Returns None if
+	the row has any other number of fields (it cannot be told apart).
+	'''
+	if len(fields) == columns:
+		return ','.join(fields)
+	if len(fields) == 2 * columns:
+		return ','.join([a + '.' + b for a, b in zip(fields[0::2], fields[1::2])])
+	return None
+
+def reformatLines(lines, columns, fileName, firstLine):
+	rows = []
+	for number, line in enumerate(lines, firstLine):
+		line = line.rstrip('\r\n')
+		if not line:
+			continue
+		row = reformatRow(line.split(','), columns)
+		if row == None:
+			raise ValueError('%s:%d: %d fields, neither %d nor %d (the %d columns of the header)' \
+					% (fileName, number, line.count(',') + 1, columns, 2 * columns, columns))
+		rows.append(row)
+	return rows
+
+def reformatFile(fileName, outFile):
+	'''
+	Repairs a CSV file into another one, chunk by chunk. The number of columns
+	is given by the header, which is kept as it is.
+	'''
+	with open(fileName, 'rb') as f:
+		header = f.readline().rstrip('\r\n')
+		columns = header.count(',') + 1
+		outFile.write(header + '\n')
+		lineNumber = 2
+		while True:
+			lines = f.readlines(chunkSize)
+			if not lines:
+				break
+			rows = reformatLines(lines, columns, fileName, lineNumber)
+			if rows:
+				outFile.write('\n'.join(rows) + '\n')
+			lineNumber += len(lines)
+
+def getOutputFile(fileName, outDir, suffix):
+	if outDir == None: # in place
+		return fileName
+	return outDir + '/' + os.path.basename(fileName) + '.' + suffix
+
+def reformatFileAtomically(job):
+	'''
+	Repairs a file into a temporary file next to its output, which replaces
+	the output once complete (so that a file repaired in place is never left
+	half-written). Returns the output file.
+	'''
+	fileName, outDir, suffix = job
+	output = getOutputFile(fileName, outDir, suffix)
+	tmp = os.path.join(os.path.dirname(output), '.%s.tmp' % os.path.basename(output))
+	try:
+		with open(tmp, 'wb') as outFile:
+			reformatFile(fileName, outFile)
+		shutil.copymode(fileName, tmp)
+		os.rename(tmp, output)
+	finally:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+	return fileName, output
+
+def reformatFiles(files, outDir, suffix, jobs=1):
+	work = [(f, outDir, suffix) for f in files]
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		results = pool.imap_unordered(reformatFileAtomically, work)
+	else:
+		results = (reformatFileAtomically(job) for job in work)
+	for fileName, output in results:
+		print('[REFORMATTED]', fileName, '->', output)
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Reformats the moa-ppsm CSV evaluation files that were corrupted by Windows and its crappy locale settings.')
 	parser.add_argument('-s', '--suffix', default='refmt',
 						help='append this prefix to the output files')
-	parser.add_argument('out_dir', help='the directory where the reformatted files will be output')
-	parser.add_argument('files', nargs='+', help='the files to be reformatted')
+	parser.add_argument('-i', '--in-place', action='store_true',
+						help='replace the files with their reformatted version (atomically), instead of writing '+
+								'them to an output directory')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+						help='the number of files that are reformatted in parallel')
+	parser.add_argument('paths', nargs='+', metavar='out_dir files',
+						help='the directory where the reformatted files will be output, followed by the files to be '+
+								'reformatted (only the files, with --in-place)')
 	args = parser.parse_args()
 
-	reformatFiles(args.files, args.out_dir, args.suffix)
+	outDir = None if args.in_place else args.paths[0]
+	files = args.paths if args.in_place else args.paths[1:]
+	if not files:
+		parser.error('no files to be reformatted')
+	try:
+		reformatFiles(files, outDir, args.suffix, args.jobs)
+	except ValueError as e:
+		print('ERROR: %s' % e)
+		sys.exit(1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import math
+
+# two-sided critical values of Student's t distribution, for 1 to 30 degrees
+#  of freedom, and of the normal distribution (the limit), by confidence level
+tTable = {
+	0.90: ([6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+			1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+			1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697], 1.645),
+	0.95: ([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+			2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+			2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042], 1.960),
+	0.99: ([63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+			3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+			2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750], 2.576)
+}
+
+# the confidence levels that can be requested
+confidenceLevels = sorted(tTable.keys())
+
+def mean(values):
+	return sum(values) / float(len(values))
+
+def stdev(values):
+	'''
+	Sample standard deviation (n - 1 degrees of freedom).
+	'''
+	m = mean(values)
+	return math.sqrt(sum((v - m) ** 2 for v in values) / (len(values) - 1))
+
+def getTValue(degrees, confidence):
+	table, z = tTable[confidence]
+	if degrees <= len(table):
+		return table[degrees - 1]
+	# beyond the table, t approaches z as 1/degrees
+	return z + (table[-1] - z) * len(table) / float(degrees)
+
+def getConfidenceInterval(values, confidence):
+	'''
+	Returns the mean of a sample and the half-width of its confidence interval.
+	'''
+	m = mean(values)
+	halfWidth = getTValue(len(values) - 1, confidence) * stdev(values) / math.sqrt(len(values))
+	return m, halfWidth
+
+def getRelativeWidth(values, confidence):
+	'''
+	Returns the half-width of the confidence interval of the mean of a sample,
+	relative to the mean (e.g. 0.05 for a mean known within +-5%), or None if
+	there are less than two values.
+	'''
+	if len(values) < 2:
+		return None
+	m, halfWidth = getConfidenceInterval(values, confidence)
+	if m == 0:
+		return 0.0 if halfWidth == 0 else float('inf')
+	return halfWidth / abs(m)
+
+def median(values):
+	ordered = sorted(values)
+	middle = len(ordered) // 2
+	if len(ordered) % 2 == 1:
+		return float(ordered[middle])
+	return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+def mad(values):
+	'''
+	Median absolute deviation from the median, a spread that (unlike the
+	standard deviation) a few outliers do not inflate.
+	'''
+	m = median(values)
+	return median([abs(v - m) for v in values])
+
+def getRanks(values):
+	'''
+	Ranks of the values (1-based), ties getting the mean of their ranks.
+	'''
+	order = sorted(range(len(values)), key=lambda i: values[i])
+	ranks = [0.0] * len(values)
+	i = 0
+	while i < len(order):
+		j = i
+		while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+			j += 1
+		for k in range(i, j + 1):
+			ranks[order[k]] = (i + j) / 2.0 + 1
+		i = j + 1
+	return ranks
+
+def getExactUDistribution(n1, n2):
+	'''
+	Counts of each value of the Mann-Whitney U statistic over all the
+	orderings of two samples of n1 and n2 values without ties.
+	'''
+	# counts[i][j][u]: orderings of i + j values with statistic u
+	counts = [[None] * (n2 + 1) for i in range(n1 + 1)]
+	for i in range(n1 + 1):
+		for j in range(n2 + 1):
+			if i == 0 or j == 0:
+				counts[i][j] = [1]
+				continue
+			# the largest value belongs to the first sample (it beats the j
+			#  values of the second one) or to the second one
+			first = [0] * j + counts[i - 1][j]
+			second = counts[i][j - 1]
+			size = max(len(first), len(second))
+			counts[i][j] = [(first[u] if u < len(first) else 0) + (second[u] if u < len(second) else 0)
+							for u in range(size)]
+	return counts[n1][n2]
+
+def getMinimumPValue(n1, n2):
+	'''
+	The smallest p-value of the exact one-sided Mann-Whitney test for samples
+	of n1 and n2 values: that of the one ordering where all the values of the
+	first sample are below those of the second one (e.g. 1/6 for 2 and 2,
+	1/20 for 3 and 3).
+	'''
+	return math.factorial(n1) * math.factorial(n2) / float(math.factorial(n1 + n2))
+
+def mannWhitney(first, second):
+	'''
+	One-sided Mann-Whitney U test of whether the values of the first sample
+	tend to be smaller than those of the second one. Returns the U statistic
+	of the first sample and the p-value: exact for small samples without
+	ties, from the normal approximation (with tie correction) otherwise.
+	'''
+	n1 = len(first)
+	n2 = len(second)
+	ranks = getRanks(list(first) + list(second))
+	u = sum(ranks[:n1]) - n1 * (n1 + 1) / 2.0
+	if len(set(ranks)) == len(ranks) and n1 * n2 <= 400:
+		distribution = getExactUDistribution(n1, n2)
+		return u, sum(distribution[:int(u) + 1]) / float(sum(distribution))
+	n = n1 + n2
+	ties = {}
+	for r in ranks:
+		ties[r] = ties.get(r, 0) + 1
+	correction = sum(t ** 3 - t for t in ties.values()) / float(n * (n - 1))
+	variance = n1 * n2 / 12.0 * (n + 1 - correction)
+	if variance == 0:
+		return u, 1.0
+	# continuity correction, towards the mean
+	z = (u + 0.5 - n1 * n2 / 2.0) / math.sqrt(variance)
+	return u, 0.5 * math.erfc(-z / math.sqrt(2))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+from filtermappings import getFilterCode
+import json
+import os
+
+# per-filter coefficients of the memory model, in MB:
+#  base: JVM, MOA and stream generator overhead
+#  buffer: per buffered instance (-b), the original and the anonymized copies
+#  cluster: per group of k buffered instances (-b / -k), centroids and partitions
+#  instance: per processed instance (-m), evaluation bookkeeping
+coefficients = {
+	'na': {'base': 192.0, 'buffer': 0.0, 'cluster': 0.0, 'instance': 0.00001},
+	'ma': {'base': 192.0, 'buffer': 0.002, 'cluster': 0.004, 'instance': 0.00001},
+	'dp': {'base': 192.0, 'buffer': 0.002, 'cluster': 0.004, 'instance': 0.00001},
+	'rs': {'base': 192.0, 'buffer': 0.003, 'cluster': 0.0, 'instance': 0.00001}
+}
+
+# the estimates are inflated by this margin on top of the observed corrections
+safetyMargin = 1.1
+
+# number of (most recent) observations per filter used to correct the model
+observationsWindow = 20
+
+# the fraction of the estimated footprint (RSS) that is given to the Java heap
+heapFraction = 0.8
+minimumHeap = 128
+
+def parseFilterSpec(filterSpec):
+	'''
+	Splits a filter specification ("microaggregation.MicroAggregationFilter -k 3 -b 100")
+	into its filter code and a dictionary of its (numeric) parameters.
+	'''
+	components = filterSpec.split()
+	params = {}
+	for i in range(1, len(components) - 1, 2):
+		params[components[i].lstrip('-')] = float(components[i+1])
+	return getFilterCode(components[0]), params
+
+def loadModel(modelFile):
+	if modelFile != None and os.path.isfile(modelFile):
+		with open(modelFile, 'rb') as f:
+			return json.load(f)
+	return {'observations': {}}
+
+def saveModel(model, modelFile):
+	tmpFile = modelFile + '.tmp'
+	with open(tmpFile, 'wb') as f:
+		json.dump(model, f, indent=2, sort_keys=True)
+	os.rename(tmpFile, modelFile)
+
+def predictFootprint(filterSpec, instances):
+	'''
+	Predicts the peak memory (MB) of an anonymization task, before any correction.
+	'''
+	code, params = parseFilterSpec(filterSpec)
+	c = coefficients[code]
+	buffered = params.get('b', 0.0)
+	k = max(params.get('k', 1.0), 1.0)
+	return c['base'] + c['buffer'] * buffered + c['cluster'] * buffered / k \
+			+ c['instance'] * float(instances)
+
+def getCorrection(model, filterSpec):
+	code = parseFilterSpec(filterSpec)[0]
+	observations = model['observations'].get(code, [])[-observationsWindow:]
+	if not observations:
+		return 1.0
+	return max(observed / predicted for predicted, observed in observations)
+
+def estimateFootprint(model, filterSpec, instances):
+	'''
+	Estimates the peak memory (MB) of an anonymization task, corrected with the
+	peak RSS observed in previous runs of the same filter.
+	'''
+	predicted = predictFootprint(filterSpec, instances)
+	return int(predicted * getCorrection(model, filterSpec) * safetyMargin)
+
+def getHeapSize(footprint):
+	return '%dm' % max(minimumHeap, int(footprint * heapFraction))
+
+def recordObservation(model, filterSpec, instances, observed):
+	'''
+	Records the peak RSS (MB) observed for a task, refining later estimates.
+	'''
+	if observed == None or observed <= 0:
+		return
+	code = parseFilterSpec(filterSpec)[0]
+	observations = model['observations'].setdefault(code, [])
+	observations.append([predictFootprint(filterSpec, instances), observed])
+	del observations[:-observationsWindow]
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
 
+import arffgenerator
 import argparse
+import moatask
+from moatask import MoaTask
+import multiprocessing
+import os
+import streamstore
 import subprocess
+import sys
+from taskrunner import formatCmd
 from termcolor import colored
 import textwrap
 
@@ -22,38 +30,128 @@ generators = [
 ]
 instances = [10000, 100000, 1000000, 10000000]
 dryRun = False
+engine = 'native'
+jobs = 1
+validate = False
+compression = None
+# the command that executes the MOA tasks, with the options of moa.sh (e.g. the
+#  client of moa-worker.py), or None to launch their JVMs directly
+moaCommand = None
+
+# the extensions of the formats that the streams can be stored in
+compressionExtensions = {
+	'gz': '.arff.gz',
+	'zst': '.arff.zst',
+	'cols': '.cols'
+}
 
 
 def getFileName(outDir, generator, instances):
 	return outDir + '/' + generator['filePrefix'] + '-' + str(instances) + '.arff'
 
+def encodeFile(fileName):
+	'''
+	Stores a generated stream compressed or in columns (see streamstore.py),
+	removing the ARFF file. Returns the new file.
+	'''
+	target = streamstore.getStem(fileName) + compressionExtensions[compression]
+	streamstore.convert(fileName, target)
+	os.remove(fileName)
+	return target
+
+def generateNative(job):
+	'''
+	Generates the largest file of a generator natively, copying the smaller
+	ones from its prefixes (the instances of a stream do not depend on its
+	size). Returns the generated files and their number of instances.
+	'''
+	outDir, generator = job
+	sizes = sorted(instances)
+	largest = getFileName(outDir, generator, sizes[-1])
+	offsets = arffgenerator.writeArff(generator['spec'], largest, sizes[-1], sizes[:-1])
+	files = [(largest, sizes[-1])]
+	for m in sizes[:-1]:
+		fileName = getFileName(outDir, generator, m)
+		arffgenerator.copyPrefix(largest, fileName, offsets[m])
+		files.append((fileName, m))
+	if validate:
+		for fileName, m in files:
+			if arffgenerator.validateArff(generator['spec'], fileName) != m:
+				raise ValueError('%s does not have %d instances' % (fileName, m))
+	if compression != None:
+		files = [(encodeFile(fileName), m) for fileName, m in files]
+	return files
+
+def generateStreamsNatively(outDir):
+	if dryRun:
+		for generator in generators:
+			print colored('[DRY RUN]', 'red'), 'Would be generating (%s) into:' % generator['spec'], \
+					', '.join(getFileName(outDir, generator, m) for m in sorted(instances))
+		return
+	work = [(outDir, generator) for generator in generators]
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		results = pool.imap_unordered(generateNative, work)
+	else:
+		results = (generateNative(job) for job in work)
+	for files in results:
+		for fileName, m in files:
+			print colored('[GENERATED]', 'green'), fileName, '(%d instances)' % m
+
 def generateStreams(outDir):
+	if engine == 'native':
+		generateStreamsNatively(outDir)
+		return
 	for generator in generators:
 		for m in instances:
 			fileName = getFileName(outDir, generator, m)
-			cmdConfig = {
-				'stream': '-s (%s)' % generator['spec'],
-				'file': '-f %s' % fileName,
-				'inst':'-m ' + str(m)
-			}
-			cmd = './moa.sh "WriteStreamToARFFFile %(stream)s %(file)s %(inst)s"' % cmdConfig
+			task = MoaTask(task='WriteStreamToARFFFile', stream=generator['spec'], params=[('-m', str(m))],
+						outputs=[('arff', fileName)])
+			cmd = moatask.getArgv(task, launcher=moaCommand)
 
 			# build wrapper to print nice, short lines in the CLI
 			wrapper = textwrap.TextWrapper(initial_indent='    ', width=120, subsequent_indent='    ')
 			if not dryRun:
 				print colored('[RUNNING]', 'green'), 'Executing:'
-				print wrapper.fill(colored(cmd, 'cyan'))
-				subprocess.call(cmd, shell=True)
+				print wrapper.fill(colored(formatCmd(cmd), 'cyan'))
+				if subprocess.call(cmd) == 0 and compression != None:
+					print colored('[ENCODED]', 'green'), encodeFile(fileName)
 			else:
 				print colored('[DRY RUN]', 'red'), 'Would be calling:'
-				print wrapper.fill(colored(cmd, 'cyan'))
+				print wrapper.fill(colored(formatCmd(cmd), 'cyan'))
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Generates random data using MOA generators and outputs it to different ARFF files.')
 	parser.add_argument('out_dir', help='the output directory where the stream files will be stored')
 	parser.add_argument('-d', '--dry-run', action='store_true',
 						help='do not execute, just print the commands that WOULD be executed')
+	parser.add_argument('-e', '--engine', choices=['native', 'moa'], default=engine,
+						help='generate the streams natively (NumPy, without the JAR files) or with MOA\'s '+
+								'WriteStreamToARFFFile task. The native streams follow the same schema and distributions '+
+								'as the MOA generators, but not the same random sequences')
+	parser.add_argument('-j', '--jobs', type=int, default=jobs,
+						help='the number of generators that are executed in parallel (native engine)')
+	parser.add_argument('--validate', action='store_true',
+						help='check the header and values of every generated file (native engine)')
+	parser.add_argument('-c', '--compression', choices=sorted(compressionExtensions.keys()), default=None,
+						help='store the streams compressed with gzip or zstd, or in the binary columnar format, '+
+								'instead of as ARFF text (see stream-convert.py)')
+	parser.add_argument('-w', '--worker', default=None,
+						help='execute the MOA tasks on the warm JVMs of the moa-worker.py daemon listening on this Unix socket, instead of launching a JVM per stream')
 	args = parser.parse_args()
 
 	dryRun = args.dry_run
+	engine = args.engine
+	jobs = args.jobs
+	validate = args.validate
+	compression = args.compression
+	if args.worker != None:
+		engine = 'moa'
+		moaCommand = './moa-worker.py run -s %s' % args.worker
+	elif engine == 'moa' and not dryRun:
+		try:
+			moatask.checkLibraries()
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
 	generateStreams(args.out_dir)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+import argparse
+import moatask
+import os
+import Queue
+import shlex
+import shutil
+import signal
+import socket
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+from termcolor import colored
+
+# the Java source of the warm worker (launched with Java's single-file source
+#  launcher since Java 11), and where it is compiled for older Java versions
+workerSource = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker', 'MoaWorker.java')
+workerClasses = os.path.join(os.path.dirname(workerSource), 'classes')
+
+# global variables (daemon)
+workerCmd = None
+idleWorkers = Queue.Queue()
+allWorkers = []
+workersLock = threading.Lock()
+
+def compileWorker():
+	'''
+	Compiles the worker with javac, unless its class is newer than its source.
+	The class is compiled apart and then moved in place, as several workers
+	may be started at once. Returns the directory of the class.
+	'''
+	classFile = os.path.join(workerClasses, 'MoaWorker.class')
+	if os.path.isfile(classFile) and os.path.getmtime(classFile) >= os.path.getmtime(workerSource):
+		return workerClasses
+	if not os.path.isdir(workerClasses):
+		os.makedirs(workerClasses)
+	tmpDir = tempfile.mkdtemp(dir=workerClasses)
+	try:
+		classpath = moatask.getLibrary(moatask.moaJar) + ':' + moatask.getLibrary(moatask.ppsmJar)
+		try:
+			returncode = subprocess.call(['javac', '-cp', classpath, '-d', tmpDir, workerSource])
+		except OSError:
+			returncode = None
+		if returncode != 0:
+			raise ValueError(('could not compile %s with javac (a JDK is needed before Java 11, which launches it '+
+							'from its source)') % workerSource)
+		os.rename(os.path.join(tmpDir, 'MoaWorker.class'), classFile)
+	finally:
+		shutil.rmtree(tmpDir)
+	return workerClasses
+
+def getJavaWorkerCmd(heap):
+	'''
+	Returns the argv that starts a Java worker: from its source since Java 11,
+	from its compiled class before (see compileWorker).
+	'''
+	version = moatask.getJavaVersion()
+	if version == None or version >= 11:
+		return moatask.getJavaCmd(heap) + [workerSource]
+	cmd = moatask.getJavaCmd(heap)
+	cmd[cmd.index('-cp') + 1] += ':' + compileWorker()
+	return cmd + ['MoaWorker']
+
+def startWorker():
+	worker = subprocess.Popen(workerCmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+	with workersLock:
+		allWorkers.append(worker)
+	print colored('[WORKER]', 'green'), 'Started worker (pid %d)' % worker.pid
+	return worker
+
+def executeOnWorker(worker, request):
+	'''
+	Sends a task request to a worker and waits for its exit code. Returns the
+	exit code and the worker to be used from now on (a new one if it died).
+	'''
+	try:
+		worker.stdin.write(request + '\n')
+		worker.stdin.flush()
+		response = worker.stdout.readline()
+	except IOError:
+		response = ''
+	if response == '':
+		print colored('[WORKER]', 'red'), 'Worker (pid %d) died, restarting it' % worker.pid
+		worker.wait()
+		with workersLock:
+			allWorkers.remove(worker)
+		return 1, startWorker()
+	return int(response), worker
+
+class TaskHandler(SocketServer.StreamRequestHandler):
+	'''
+	Handles a client connection: a single task request line, answered with the
+	exit code of the task once a worker has executed it.
+	'''
+	def handle(self):
+		request = self.rfile.readline().rstrip('\n')
+		if request == '':
+			return
+		worker = idleWorkers.get()
+		try:
+			returncode, worker = executeOnWorker(worker, request)
+		finally:
+			idleWorkers.put(worker)
+		self.wfile.write('%d\n' % returncode)
+
+def stopServing(signum, frame):
+	raise KeyboardInterrupt()
+
+def serve(socketPath, workers):
+	if os.path.exists(socketPath):
+		os.remove(socketPath)
+	for i in range(workers):
+		idleWorkers.put(startWorker())
+	server = SocketServer.ThreadingUnixStreamServer(socketPath, TaskHandler)
+	server.daemon_threads = True
+	print colored('[SERVING]', 'green'), 'Listening for MOA tasks on %s with %d worker(s)' % (socketPath, workers)
+	signal.signal(signal.SIGTERM, stopServing)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		print colored('[STOPPING]', 'red'), 'Shutting down the workers'
+	finally:
+		server.server_close()
+		os.remove(socketPath)
+		for worker in allWorkers:
+			worker.stdin.close()
+			worker.wait()
+
+def copyTo(fileName, stream):
+	with open(fileName, 'rb') as f:
+		shutil.copyfileobj(f, stream)
+	stream.flush()
+
+def runTask(socketPath, task, silenceOutput, silenceError):
+	'''
+	Executes a task on the daemon, writing its output to stdout and stderr, as
+	moa.sh would do. Returns the exit code of the task.
+	'''
+	outFd, outFile = tempfile.mkstemp(prefix='moa-', suffix='.out')
+	errFd, errFile = tempfile.mkstemp(prefix='moa-', suffix='.err')
+	os.close(outFd)
+	os.close(errFd)
+	try:
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		client.connect(socketPath)
+		client.sendall('%s\t%s\t%s\n' % (outFile, errFile, task))
+		response = client.makefile().readline()
+		client.close()
+		if not silenceError:
+			copyTo(errFile, sys.stderr)
+		if not silenceOutput:
+			copyTo(outFile, sys.stdout)
+		return int(response) if response else 1
+	finally:
+		os.remove(outFile)
+		os.remove(errFile)
+
+def stub():
+	'''
+	A stand-in for the Java worker, speaking the same protocol, that echoes the
+	tasks instead of executing them. Useful to test the daemon without the JARs.
+	'''
+	for line in iter(sys.stdin.readline, ''):
+		outFile, errFile, task = line.rstrip('\n').split('\t', 2)
+		with open(outFile, 'wb') as out:
+			out.write('stub: %s\n' % task)
+		open(errFile, 'wb').close()
+		sys.stdout.write('0\n')
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Keeps warm JVMs that execute MOA tasks back-to-back, avoiding the JVM startup '+
+									'cost of each moa.sh call, and submits tasks to them.')
+	subparsers = parser.add_subparsers(dest='command')
+
+	serveParser = subparsers.add_parser('serve',
+						help='start the daemon and its workers. Start it from the same directory as the clients: '+
+								'the paths in the tasks are relative to it')
+	serveParser.add_argument('-s', '--socket', required=True,
+						help='the Unix socket where the daemon listens for tasks')
+	serveParser.add_argument('-n', '--workers', type=int, default=1,
+						help='the number of warm JVMs executing tasks concurrently')
+	serveParser.add_argument('-x', '--max-heap', default=None,
+						help='the maximum heap size of each JVM (Java\'s -Xmx option), e.g. 4g')
+	serveParser.add_argument('-c', '--worker-cmd', default=None,
+						help='the command that starts a worker, instead of the Java one (e.g. "./moa-worker.py stub")')
+
+	runParser = subparsers.add_parser('run', help='execute a task on the daemon, with the same output as moa.sh')
+	runParser.add_argument('-s', '--socket', required=True,
+						help='the Unix socket where the daemon listens for tasks')
+	runParser.add_argument('-e', '--silence-error', action='store_true',
+						help='silences the output that MOA writes on the stderr stream')
+	runParser.add_argument('-o', '--silence-output', action='store_true',
+						help='silences the output that MOA writes on the stdout stream')
+	runParser.add_argument('-x', '--max-heap', default=None,
+						help='accepted for compatibility with moa.sh and ignored: the heap is set by the daemon')
+	runParser.add_argument('-g', '--gc-log', default=None,
+						help='accepted for compatibility with moa.sh and ignored: the workers outlive the tasks')
+	runParser.add_argument('task', nargs='+', help='the MOA task command line')
+
+	javaParser = subparsers.add_parser('java',
+						help='run a Java worker in the foreground, reading tasks from stdin (the worker protocol, '+
+								'see worker/MoaWorker.java)')
+	javaParser.add_argument('-x', '--max-heap', default=None,
+						help='the maximum heap size of the JVM (Java\'s -Xmx option), e.g. 4g')
+
+	subparsers.add_parser('stub', help='run a stub worker that echoes the tasks (for testing)')
+	args = parser.parse_args()
+
+	if args.command == 'serve' and args.worker_cmd != None:
+		workerCmd = shlex.split(args.worker_cmd)
+	elif args.command in ('serve', 'java'):
+		try:
+			workerCmd = getJavaWorkerCmd(args.max_heap)
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
+
+	if args.command == 'serve':
+		serve(args.socket, args.workers)
+	elif args.command == 'run':
+		task = ' '.join(args.task)
+		if '\t' in task or '\n' in task:
+			print 'ERROR: a task cannot have tabs nor line breaks: they delimit the requests to the workers'
+			sys.exit(1)
+		sys.exit(runTask(args.socket, task, args.silence_output, args.silence_error))
+	elif args.command == 'java':
+		os.execvp(workerCmd[0], workerCmd)
+	else:
+		stub()
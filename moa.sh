@@ -8,6 +8,7 @@ bold=`tput bold`
 
 # script variables
 modifiers=""
+javaOpts=""
 moaJar=./lib/moa.jar
 ppsmJar=./lib/moa-ppsm.jar
 agentJar=./lib/sizeofag.jar
@@ -43,6 +44,10 @@ function usage {
   echo "    ${bold}-o|--silence-output${reset}"
   echo "        Silences the output that MOA writes on the ${bold}stdout${reset} stream."
   echo "        No information about the result of the task (report) will be shown."
+  echo "    ${bold}-x|--max-heap SIZE${reset}"
+  echo "        Sets the maximum heap size of the JVM (Java's -Xmx option), e.g. 2048m or 4g."
+  echo "    ${bold}-g|--gc-log FILE${reset}"
+  echo "        Logs the garbage collections of the JVM, with their pause times, to FILE."
   exit 1
 }
 
@@ -54,7 +59,17 @@ function checkLib {
 }
 
 function executeMoa {
-  java -cp $moaJar:$ppsmJar -javaagent:$agentJar moa.DoTask "$@" $modifiers
+  java $javaOpts -cp $moaJar:$ppsmJar -javaagent:$agentJar moa.DoTask "$@" $modifiers
+}
+
+function getGcLogOption {
+  # unified logging (-Xlog) only exists since Java 9 (versions 1.x before)
+  local version=$(java -version 2>&1 | sed -n -E '1s/.*version "(1\.)?([0-9]+).*/\2/p')
+  if [[ -n "$version" && "$version" -lt 9 ]]; then
+    echo "-Xloggc:$1"
+  else
+    echo "-Xlog:gc:file=$1"
+  fi
 }
 
 function parseOpts {
@@ -68,6 +83,14 @@ function parseOpts {
     modifiers="$modifiers -R" # -R CLI option for moa.doTask (see MOA API)
     shift
     parseOpts "$@"
+  elif [[ "$1" == "-x" || "$1" == "--max-heap" ]]; then
+    javaOpts="$javaOpts -Xmx$2"
+    shift 2
+    parseOpts "$@"
+  elif [[ "$1" == "-g" || "$1" == "--gc-log" ]]; then
+    javaOpts="$javaOpts $(getGcLogOption $2)"
+    shift 2
+    parseOpts "$@"
   else
     executeMoa "$@"
   fi
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import os
+import re
+import shlex
+import subprocess
+
+# the libraries that MOA needs, as (environment variable, default location)
+#  pairs: the same variables and locations as moa.sh
+moaJar = ('MOA_JAR', './lib/moa.jar')
+ppsmJar = ('PPSM_JAR', './lib/moa-ppsm.jar')
+agentJar = ('AGENT_JAR', './lib/sizeofag.jar')
+libraries = [moaJar, ppsmJar, agentJar]
+
+# the option of the task that names each kind of output file
+outputOptions = {
+	'report': '-r',
+	'anonymization': '-a',
+	'evaluation': '-e',
+	'throughput': '-t',
+	'arff': '-f'
+}
+
+# a MOA task: the name of the task class (e.g. "Anonymize"), the stream it
+#  reads and the privacy filter it applies (MOA specifications, or None), its
+#  other parameters, as (option, value) pairs (value None for flags), and the
+#  files it writes, as (kind, file) pairs (see outputOptions)
+MoaTask = namedtuple('MoaTask', 'task stream filterSpec params outputs')
+MoaTask.__new__.__defaults__ = (None, None, [], [])
+
+# how the JVM of a task is launched: its maximum heap size (e.g. "2048m"), the
+#  file where it logs its GC pauses, and whether the progress (stderr) and the
+#  result (stdout) of the task are silenced
+JvmOptions = namedtuple('JvmOptions', 'heap gcLog silenceError silenceOutput')
+JvmOptions.__new__.__defaults__ = (None, None, False, False)
+
+# the major version of the JVM (e.g. 8 or 11), checked once, when needed
+javaVersion = None
+
+def getJavaVersion():
+	'''
+	Returns the major version of the java command, from "java -version" (e.g.
+	"1.8.0_292" is 8, "11.0.2" is 11), or None if it cannot be told.
+	'''
+	global javaVersion
+	if javaVersion == None:
+		try:
+			output = subprocess.Popen(['java', '-version'], stdout=subprocess.PIPE,
+									stderr=subprocess.STDOUT).communicate()[0]
+		except OSError:
+			return None
+		match = re.search(r'version "(?:1\.)?(\d+)', output)
+		javaVersion = int(match.group(1)) if match else None
+	return javaVersion
+
+def getGcLogOption(gcLog):
+	'''
+	Returns the JVM option that logs the GC pauses to a file: unified logging
+	(-Xlog) since Java 9, -Xloggc before.
+	'''
+	version = getJavaVersion()
+	if version != None and version < 9:
+		return '-Xloggc:' + gcLog
+	return '-Xlog:gc:file=' + gcLog
+
+def getLibrary(library):
+	variable, default = library
+	return os.environ.get(variable) or default
+
+def checkLibraries():
+	'''
+	Raises a ValueError if a library is missing, as moa.sh checks them before
+	launching the JVM.
+	'''
+	for library in libraries:
+		if not os.path.isfile(getLibrary(library)):
+			raise ValueError('the required library at %s does not exist or is not a regular file' % getLibrary(library))
+
+def getJavaCmd(heap=None, gcLog=None):
+	'''
+	Returns the argv that starts a JVM with the libraries of MOA, before the
+	main class, as moa.sh does.
+	'''
+	cmd = ['java']
+	if heap != None:
+		cmd.append('-Xmx' + heap)
+	if gcLog != None:
+		cmd.append(getGcLogOption(gcLog))
+	return cmd + ['-cp', getLibrary(moaJar) + ':' + getLibrary(ppsmJar), '-javaagent:' + getLibrary(agentJar)]
+
+def getTaskString(task):
+	'''
+	Renders a task as the command line that moa.DoTask parses.
+	'''
+	parts = [task.task]
+	if task.stream != None:
+		parts.append('-s (%s)' % task.stream)
+	if task.filterSpec != None:
+		parts.append('-f (%s)' % task.filterSpec)
+	for option, value in task.params:
+		parts.append(option if value == None else '%s %s' % (option, value))
+	for kind, file in task.outputs:
+		parts.append('%s %s' % (outputOptions[kind], file))
+	return ' '.join(parts)
+
+def getArgv(task, jvm=JvmOptions(), launcher=None):
+	'''
+	Renders a task as the argv that executes it, without a shell: a JVM that
+	runs moa.DoTask directly or, given a launcher (a command with the options
+	of moa.sh, e.g. the client of moa-worker.py), the launcher.
+	'''
+	if launcher != None:
+		argv = shlex.split(launcher)
+		if jvm.silenceError:
+			argv.append('-e')
+		if jvm.silenceOutput:
+			argv.append('-o')
+		if jvm.heap != None:
+			argv += ['-x', jvm.heap]
+		if jvm.gcLog != None:
+			argv += ['-g', jvm.gcLog]
+		return argv + [getTaskString(task)]
+	argv = getJavaCmd(jvm.heap, jvm.gcLog) + ['moa.DoTask', getTaskString(task)]
+	# -S and -R are the options of moa.DoTask that silence stderr and stdout
+	if jvm.silenceError:
+		argv.append('-S')
+	if jvm.silenceOutput:
+		argv.append('-R')
+	return argv
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+import anonymize
+import argparse
+from collections import OrderedDict
+import copy
+import costmodel
+import itertools
+import json
+import memorymodel
+import numpy
+import os
+import runledger
+import scalability
+from termcolor import colored
+
+# global flags
+ledgerFile = 'ledger.db'
+memoryModelFile = 'memory-model.json'
+seed = 1
+
+def expandGrid(configuration):
+	'''
+	Expands a configuration (of anonymize.py or scalability.py) into its grid
+	points: a filter with a value for each parameter (except the discriminant
+	one of a scalability sweep). Each point has the tasks that it takes, as
+	dictionaries with the same stream, filter, instances and replica that the
+	scripts use as their run key.
+	'''
+	isScalability = configuration.get('isScalability', False)
+	streams = configuration['streams']
+	allInstances = configuration['options']['maximumInstances']
+	points = []
+	for privacyFilter in configuration['filters']:
+		filterName = privacyFilter['filter']
+		discriminantParameter = privacyFilter.get('discriminantParameter') if isScalability else None
+		params = [p for p in privacyFilter['params'] if p['name'] != discriminantParameter]
+		discriminantValues = [p['values'] for p in privacyFilter['params'] if p['name'] == discriminantParameter]
+		paramsNames = [p['name'] for p in params]
+		for permutation in itertools.product(*[p['values'] for p in params]):
+			point = {
+				'order': len(points),
+				'filter': privacyFilter,
+				'values': permutation,
+				'tasks': []
+			}
+			points.append(point)
+			for stream in streams:
+				for instances in allInstances:
+					if not isScalability:
+						builtFilter = filterName + ' ' + anonymize.buildFilterParams(permutation, paramsNames)
+						point['tasks'].append({'experiment': 'anonymize', 'stream': stream, 'filterSpec': builtFilter,
+											'instances': str(instances), 'replica': 0})
+						continue
+					for value in discriminantValues[0]:
+						builtFilter = filterName + ' ' + \
+								scalability.buildFilterParams(permutation, paramsNames, discriminantParameter, value)
+						for replica in range(configuration['replicas']):
+							point['tasks'].append({'experiment': 'scalability', 'stream': stream,
+												'filterSpec': builtFilter, 'instances': str(instances),
+												'replica': replica})
+	return points
+
+def estimateGrid(points, ledger, costModel, memoryModel):
+	'''
+	Estimates the runtime (seconds) and memory (MB) of every task: the elapsed
+	time of the completed runs comes from the ledger, the others from the cost
+	model. The cost of a point is the runtime of its tasks still to be run.
+	'''
+	for point in points:
+		point['cost'] = 0.0
+		for task in point['tasks']:
+			key = runledger.getRunKey(task['experiment'], task['stream'], task['filterSpec'], task['instances'],
+									task['replica'])
+			elapsed = runledger.getElapsed(ledger, key) if ledger != None else None
+			task['completed'] = elapsed != None
+			task['runtime'] = elapsed if elapsed != None else \
+					costmodel.estimateRuntime(costModel, task['filterSpec'], task['instances'])
+			task['memory'] = memorymodel.estimateFootprint(memoryModel, task['filterSpec'], task['instances'])
+			if not task['completed']:
+				point['cost'] += task['runtime']
+
+def selectByPriority(points, budget):
+	'''
+	Keeps the cheapest grid points that fit the budget (core-seconds), so
+	that as many points as possible are run.
+	'''
+	selected = []
+	spent = 0.0
+	for point in sorted(points, key=lambda p: p['cost']):
+		if spent + point['cost'] > budget:
+			break
+		selected.append(point)
+		spent += point['cost']
+	return selected
+
+def sampleLatinHypercube(filterPoints, n, random):
+	'''
+	Samples n points of the grid of a filter with a latin hypercube: the range
+	of values of each parameter is split in n strata, each of them sampled
+	once. Points sampled twice (parameters with less than n values) are only
+	kept once.
+	'''
+	dimensions = len(filterPoints[0]['values'])
+	if dimensions == 0:
+		return filterPoints[:1]
+	byValues = dict((tuple(p['values']), p) for p in filterPoints)
+	axes = [sorted(set(p['values'][d] for p in filterPoints)) for d in range(dimensions)]
+	indices = []
+	for axis in axes:
+		strata = (random.permutation(n) + random.uniform(size=n)) / n
+		indices.append((strata * len(axis)).astype(int))
+	sampled = []
+	for i in range(n):
+		values = tuple(axes[d][indices[d][i]] for d in range(dimensions))
+		point = byValues.get(values)
+		if point != None and point not in sampled:
+			sampled.append(point)
+	return sampled
+
+def selectByLatinHypercube(points, budget):
+	'''
+	Samples the same fraction of the grid of each filter with a latin
+	hypercube, the largest one (in steps of 5%) whose cost fits the budget
+	(core-seconds), with at least one point per filter.
+	'''
+	byFilter = []
+	for point in points:
+		if not byFilter or byFilter[-1][0]['filter'] is not point['filter']:
+			byFilter.append([])
+		byFilter[-1].append(point)
+	for step in range(20, 0, -1):
+		random = numpy.random.RandomState(seed)
+		selected = []
+		for filterPoints in byFilter:
+			n = max(1, int(round(len(filterPoints) * step / 20.0)))
+			selected += filterPoints if n == len(filterPoints) else sampleLatinHypercube(filterPoints, n, random)
+		if sum(p['cost'] for p in selected) <= budget:
+			break
+	return selected
+
+def getPrunedConfig(configuration, points):
+	'''
+	Returns a configuration that only has the given grid points: a filter
+	entry for each of them, with a single value for each parameter (and all
+	the values of the discriminant one), so that the scripts run the same
+	tasks, with the same run keys.
+	'''
+	pruned = copy.deepcopy(configuration)
+	pruned['filters'] = []
+	for point in points:
+		entry = copy.deepcopy(point['filter'])
+		values = iter(point['values'])
+		for param in entry['params']:
+			if param['name'] != entry.get('discriminantParameter') or not configuration.get('isScalability', False):
+				param['values'] = [next(values)]
+		pruned['filters'].append(entry)
+	return pruned
+
+def formatHours(seconds):
+	return '%.2f core-hours' % (seconds / 3600.0)
+
+def printPlan(points, jobs, verbose):
+	tasks = [t for p in points for t in p['tasks']]
+	remaining = [t for t in tasks if not t['completed']]
+	# the points of each filter, in the order of the configuration (a selection
+	#  is sorted by cost)
+	byFilter = OrderedDict()
+	for point in sorted(points, key=lambda p: p['order']):
+		byFilter.setdefault(point['filter']['filter'], []).append(point)
+	rows = []
+	for privacyFilter, group in byFilter.items():
+		filterTasks = [t for p in group for t in p['tasks']]
+		rows.append((privacyFilter, len(group), len(filterTasks), sum(p['cost'] for p in group),
+					max([t['memory'] for t in filterTasks] + [0])))
+	for privacyFilter, n, taskCount, cost, memory in rows:
+		print colored('[FILTER]', 'green'), '%s: %d point(s), %d task(s), %s to run, up to %dMB per task' \
+				% (privacyFilter, n, taskCount, formatHours(cost), memory)
+	if verbose:
+		for t in tasks:
+			print '    %s (%s) %s instances, replica %d: %.0fs, %dMB%s' % (t['stream'], t['filterSpec'],
+					t['instances'], t['replica'], t['runtime'], t['memory'], ' (completed)' if t['completed'] else '')
+	total = sum(t['runtime'] for t in remaining)
+	longest = max([t['runtime'] for t in remaining] + [0])
+	print colored('[TOTAL]', 'green'), '%d task(s), %d completed, %s to run: about %.1f hours with %d job(s)' \
+			% (len(tasks), len(tasks) - len(remaining), formatHours(total), max(total / jobs, longest) / 3600.0, jobs)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Expands a configuration of anonymize.py or scalability.py into its tasks and '+
+									'estimates their runtime and memory before launching them, from the completed runs '+
+									'of the ledger (or a model in the instances and the -b and -k parameters). With a '+
+									'budget, selects the grid points that fit it and writes them as a new configuration.')
+	parser.add_argument('config_file', help='a JSON file with the execution configuration')
+	parser.add_argument('--ledger', default=ledgerFile,
+						help='the run ledger (SQLite database) with the elapsed time of the completed runs')
+	parser.add_argument('--memory-model', default=memoryModelFile,
+						help='the memory model of anonymize.py and scalability.py, for the memory estimates')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+						help='the number of concurrent tasks, for the projected wall-clock time')
+	parser.add_argument('-B', '--budget', type=float, default=None,
+						help='the core-hours available to run the remaining tasks')
+	parser.add_argument('-s', '--strategy', choices=['priority', 'lhs'], default='priority',
+						help='how grid points are selected to fit the budget: the cheapest ones first (priority) or a '+
+								'latin hypercube sample of the parameters of each filter (lhs)')
+	parser.add_argument('--seed', type=int, default=seed,
+						help='the seed of the latin hypercube sampling')
+	parser.add_argument('-o', '--out-config', default=None,
+						help='write the selected grid points as a configuration file, to be run instead of the original')
+	parser.add_argument('-v', '--verbose', action='store_true',
+						help='print the estimates of every task')
+	args = parser.parse_args()
+	seed = args.seed
+
+	with open(args.config_file) as f:
+		configuration = json.load(f)
+	ledger = runledger.openLedger(args.ledger) if os.path.isfile(args.ledger) else None
+	costModel = costmodel.fitModel(costmodel.loadHistory(ledger)) if ledger != None else {}
+	points = expandGrid(configuration)
+	estimateGrid(points, ledger, costModel, memorymodel.loadModel(args.memory_model))
+	print colored('[PLAN]', 'green'), '%s: %d grid point(s)' % (args.config_file, len(points))
+	printPlan(points, args.jobs, args.verbose)
+
+	if args.budget != None:
+		budget = args.budget * 3600.0
+		if args.strategy == 'priority':
+			selected = selectByPriority(points, budget)
+		else:
+			selected = selectByLatinHypercube(points, budget)
+		print colored('[BUDGET]', 'green'), '%d of %d grid point(s) selected (%s strategy) for %s' \
+				% (len(selected), len(points), args.strategy, formatHours(args.budget * 3600.0))
+		printPlan(selected, args.jobs, False)
+		if sum(p['cost'] for p in selected) > budget:
+			print colored('[WARNING]', 'yellow'), 'even the smallest sample exceeds the budget'
+		points = selected
+	if args.out_config != None:
+		with open(args.out_config, 'w') as f:
+			json.dump(getPrunedConfig(configuration, points), f, indent=1)
+		print colored('[WRITTEN]', 'green'), args.out_config
@@ -3,18 +3,36 @@
 import argparse
 from collections import namedtuple
 import csv
+import experimentindex
 import matplotlib.pyplot as plotter
+import numpy
 import os
 import re
+import resultstore
+import sys
+import time
 
 # Data named tuple (data type)
 Data = namedtuple('Data', ['x', 'y', 'legend'])
 
 # useful regular expressions
 alpha = re.compile('[a-zA-Z]*')
-decimal = re.compile('\d+.\d+')
+decimal = re.compile('\d+\.\d+')
 number = re.compile('\d+')
 
+# experiment indexes already opened, by file name
+indexes = {}
+
+# bytes of CSV data parsed at once when loading a column
+blockSize = 1 << 24
+
+# seconds between two refreshes of a followed plot
+refreshInterval = 2.0
+
+# points of each followed series kept at full resolution (the most recent
+#  ones); the older ones are decimated to as many points
+followWindow = 10000
+
 # plot options for colored plots
 colorOptions = [
 # solid linestyle
@@ -87,16 +105,27 @@ def parseParams(paramsString):
 
     return params
 
-def parseParamsFromFile(file):
-    basename = os.path.basename(file.name)
-    return parseParams(basename.split('_')[0])
+def getParamsForFile(fileName, args):
+    '''
+    Returns the parameters of a data file, from the experiment index if one is
+    given (and it knows the file) or from the file name.
+    '''
+    if getattr(args, 'index', None) != None:
+        if args.index not in indexes:
+            indexes[args.index] = experimentindex.openIndex(args.index)
+        metadata = experimentindex.lookup(indexes[args.index], fileName)
+        if metadata != None:
+            return dict(metadata['params'])
+    return parseParams(os.path.basename(fileName).split('_')[0])
 
 def getLegendLabelForFile(file, args):
+    return getLegendLabel(getParamsForFile(file.name, args), args)
+
+def getLegendLabel(params, args):
     if args.parameters == None:
         return '_nolegend_'
 
     legend = ''
-    params = parseParamsFromFile(file)
     for selectedParam in args.parameters:
         if params[selectedParam] == None:
             raise NameError('You have selected a parameter that was not specified ' +
@@ -106,27 +135,236 @@ def getLegendLabelForFile(file, args):
 
     return legend
 
+def parseNumericBlock(block, columns):
+    '''
+    Parses a block of whole CSV lines of numbers into a (rows, columns) array,
+    or returns None if the block is not a complete numeric table.
+    '''
+    values = numpy.fromstring(block.replace(',', ' '), sep=' ')
+    rows = block.count('\n') + (0 if block.endswith('\n') else 1)
+    if values.size != rows * columns:
+        return None
+    return values.reshape(rows, columns)
+
+def loadColumn(file, col):
+    '''
+    Loads the selected column of a CSV file (without its header) into a NumPy
+    array. The file is parsed in blocks of whole lines, vectorized by NumPy.
+    '''
+    file.seek(0)
+    columns = len(file.readline().split(','))
+    start = file.tell()
+    chunks = []
+    while True:
+        block = file.read(blockSize)
+        if not block:
+            break
+        block = (block + file.readline()).strip() # complete the last line of the block
+        if not block:
+            continue
+        table = parseNumericBlock(block, columns)
+        if table is None:
+            # not a plain numeric table (e.g. empty or quoted fields): slow path
+            file.seek(start)
+            return numpy.loadtxt(file, delimiter=',', usecols=(col,), ndmin=1)
+        chunks.append(table[:, col])
+    return numpy.concatenate(chunks) if chunks else numpy.empty(0)
+
+def parseColumn(block, columns, col):
+    '''
+    Parses the selected column of a block of whole CSV lines, with NaN for the
+    lines whose value is missing or not a number (gaps in the plot).
+    '''
+    table = parseNumericBlock(block, columns)
+    if table is not None:
+        return table[:, col]
+    values = []
+    for row in csv.reader(block.splitlines()):
+        try:
+            values.append(float(row[col]))
+        except (ValueError, IndexError):
+            values.append(numpy.nan)
+    return numpy.array(values)
+
+def newTail(file, col):
+    '''
+    Starts following a CSV file that is still being written: the state of
+    what was read from it (the offset up to the last whole line, the rows and
+    the selected column) and the points kept of it (see compactTail).
+    '''
+    return {
+        'file': file,
+        'column': col,
+        'columns': None, # known once the header is read
+        'offset': 0,
+        'rows': 0,
+        'x': numpy.empty(0),
+        'y': numpy.empty(0),
+        'olderX': numpy.empty(0),
+        'olderY': numpy.empty(0)
+    }
+
+def compactTail(tail, window):
+    '''
+    Bounds the memory of a followed series: once it has more than twice the
+    window, the points older than the window are merged with the previously
+    decimated ones and decimated (min-max, keeping the envelope of the curve)
+    to about the window. Their gaps are not kept.
+    '''
+    if len(tail['y']) <= 2 * window:
+        return
+    split = len(tail['y']) - window
+    olderX = numpy.concatenate([tail['olderX'], tail['x'][:split]])
+    olderY = numpy.concatenate([tail['olderY'], tail['y'][:split]])
+    # the gaps (NaN) would be picked as the minimum and maximum of their bucket
+    valid = ~numpy.isnan(olderY)
+    tail['olderX'], tail['olderY'] = minMaxDecimateByX(olderX[valid], olderY[valid], window // 2)
+    tail['x'] = tail['x'][split:]
+    tail['y'] = tail['y'][split:]
+
+def readAppended(tail, window):
+    '''
+    Reads the whole lines appended to a followed file since the last call
+    (only the new bytes are read and parsed), returning the number of new
+    rows. A file truncated in the meantime (e.g. the run was restarted) is
+    read again from its start.
+    '''
+    file = tail['file']
+    if os.fstat(file.fileno()).st_size < tail['offset']:
+        tail.update(newTail(file, tail['column']))
+    file.seek(tail['offset'])
+    if tail['columns'] == None:
+        header = file.readline()
+        if not header.endswith('\n'):
+            return 0
+        tail['columns'] = len(header.split(','))
+        tail['offset'] = file.tell()
+    newRows = 0
+    while True:
+        block = file.read(blockSize)
+        # only whole lines are parsed, the last one may still be written
+        block = block[:block.rfind('\n') + 1]
+        if not block:
+            break
+        tail['offset'] += len(block)
+        file.seek(tail['offset'])
+        y = parseColumn(block.strip(), tail['columns'], tail['column'])
+        x = numpy.arange(tail['rows'] + 1, tail['rows'] + len(y) + 1) # the CSV header is row 0
+        tail['rows'] += len(y)
+        tail['x'] = numpy.concatenate([tail['x'], x])
+        tail['y'] = numpy.concatenate([tail['y'], y])
+        compactTail(tail, window)
+        newRows += len(y)
+    return newRows
+
+def getTailData(tail, legend):
+    return Data(x=numpy.concatenate([tail['olderX'], tail['x']]),
+                y=numpy.concatenate([tail['olderY'], tail['y']]), legend=legend)
+
 def selectDataFromFile(file, args):
     legendLabel = getLegendLabelForFile(file, args)
-    xValues = []
-    yValues = []
-
-    col = args.column
-    reader = csv.reader(file)
-    for i, row in enumerate(reader,0):
-        if i > 0: # skip the CSV header
-            xValues.append(i)
-            yValues.append(float(row[col]))
+    yValues = loadColumn(file, args.column)
+    xValues = numpy.arange(1, len(yValues) + 1) # the CSV header is row 0
 
     data = Data(x=xValues, y=yValues, legend=legendLabel)
     return data
 
+def getPixelWidth():
+    width, height = plotter.rcParams['figure.figsize']
+    return int(width * plotter.rcParams['figure.dpi'])
+
+def minMaxDecimate(x, y, buckets):
+    '''
+    Splits the series in buckets and keeps the minimum and maximum points of each
+    of them (and the first and last points), preserving the envelope of the curve.
+    '''
+    if buckets < 1 or len(y) <= 2 * buckets:
+        return x, y
+    size = len(y) // buckets
+    n = size * buckets
+    blocks = y[:n].reshape(buckets, size)
+    offsets = numpy.arange(buckets) * size
+    indices = [[0, len(y) - 1], blocks.argmin(axis=1) + offsets, blocks.argmax(axis=1) + offsets]
+    if n < len(y): # the remaining points that do not fill a whole bucket
+        indices.append([n + y[n:].argmin(), n + y[n:].argmax()])
+    indices = numpy.unique(numpy.concatenate(indices))
+    return x[indices], y[indices]
+
+def minMaxDecimateByX(x, y, buckets):
+    '''
+    Like minMaxDecimate, but with buckets of the same width in X (sorted), so
+    that a series whose points are already unevenly spaced (e.g. decimated
+    before) keeps the same resolution over its whole range.
+    '''
+    if buckets < 1 or len(y) <= 2 * buckets or x[-1] == x[0]:
+        return x, y
+    bucket = numpy.minimum(((x - x[0]) / (x[-1] - x[0]) * buckets).astype(int), buckets - 1)
+    order = numpy.lexsort((y, bucket)) # by bucket, then by value
+    sortedBuckets = bucket[order]
+    boundaries = sortedBuckets[1:] != sortedBuckets[:-1]
+    first = numpy.concatenate([[True], boundaries])
+    last = numpy.concatenate([boundaries, [True]])
+    indices = numpy.unique(numpy.concatenate([[0, len(y) - 1], order[first], order[last]]))
+    return x[indices], y[indices]
+
+def lttb(x, y, points):
+    '''
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last points
+    and, from each bucket in between, the point that forms the largest triangle
+    with the previously selected point and the average of the next bucket.
+    '''
+    n = len(y)
+    if points < 3 or n <= points:
+        return x, y
+    edges = numpy.linspace(1, n - 1, points - 1).astype(int)
+    indices = numpy.empty(points, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i+1]
+        nextEnd = edges[i+2] if i + 2 < len(edges) else n
+        avgX = x[end:nextEnd].mean()
+        avgY = y[end:nextEnd].mean()
+        areas = numpy.abs((x[a] - avgX) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avgY - y[a]))
+        a = start + areas.argmax()
+        indices[i+1] = a
+    return x[indices], y[indices]
+
+def downsample(data, args):
+    if args.downsample == None:
+        return data
+    points = args.points if args.points != None else getPixelWidth()
+    x = numpy.asarray(data.x, dtype=float)
+    y = numpy.asarray(data.y, dtype=float)
+    if args.downsample == 'minmax':
+        x, y = minMaxDecimate(x, y, points)
+    else:
+        x, y = lttb(x, y, points)
+    return Data(x=x, y=y, legend=data.legend)
+
+def getStoreColumn(store, args):
+    # the first two columns of the store tables are the run and the row
+    return resultstore.getColumns(store, args.table)[args.column + 2]
+
+def selectDataFromStore(store, run, args):
+    legendLabel = getLegendLabel(parseParams(run['spec']), args)
+    yValues = resultstore.selectColumn(store, args.table, run['id'], getStoreColumn(store, args))
+    xValues = range(1, len(yValues) + 1)
+    return Data(x=xValues, y=yValues, legend=legendLabel)
+
 def getDataSelection(args):
     selection = []
 
+    if args.store != None:
+        store = resultstore.openStore(args.store)
+        for run in resultstore.selectRuns(store, args.table, args.where):
+            selection.append(downsample(selectDataFromStore(store, run, args), args))
+        return selection
+
     for file in args.in_files:
         data = selectDataFromFile(file, args)
-        selection.append(data)
+        selection.append(downsample(data, args))
 
     return selection
 
@@ -167,20 +405,24 @@ def getPlotOptions(args):
         return colorOptions
 
 def getYLabel(args):
-    if args.y_label == 'infer':
-        with open(args.in_files[0].name, 'rb') as f:
-            header = f.readline().strip()
-            return header.split(',')[args.column]
+    if args.y_label == 'infer' and args.store != None:
+        return getStoreColumn(resultstore.openStore(args.store), args)
+    elif args.y_label == 'infer':
+        return inferYLabel(args.in_files[0].name, args.column)
     else:
         return args.y_label
 
-def plotWithArgs(args):
-    selection = getDataSelection(args)
+def inferYLabel(fileName, column):
+    with open(fileName, 'rb') as f:
+        header = f.readline().strip()
+        return header.split(',')[column]
+
+def renderFigure(selection, args, outFile):
     lineOptions = getPlotOptions(args)
 
     # PLOTTING BEGINS HERE!
     # prepare canvas and axes
-    figure = plotter.figure(1)
+    figure = plotter.figure()
     ax = figure.add_subplot(111)
 
     # for each data set selected previously ((x,y) values, legend...),
@@ -193,7 +435,48 @@ def plotWithArgs(args):
     labelPlot(ax, args) # axis labeling and title
     formatAxes(ax) # spines and frame options
     lgd = makeLegend(ax) # plot legend
-    exportTo(figure, args.out_file.name, lgd) # export the plot to the PDF output file
+    exportTo(figure, outFile, lgd) # export the plot to the PDF output file
+    return figure
+
+def followWithArgs(args):
+    '''
+    Plots the input files while they are being written: every refresh, the
+    rows appended to them are read and the figure is updated and exported
+    again (and redrawn, if shown), until interrupted or, if requested, until
+    no file grows for a while.
+    '''
+    tails = [newTail(file, args.column) for file in args.in_files]
+    legends = [getLegendLabelForFile(file, args) for file in args.in_files]
+    for tail in tails:
+        readAppended(tail, args.window)
+    selection = [downsample(getTailData(t, l), args) for t, l in zip(tails, legends)]
+    figure = renderFigure(selection, args, args.out_file.name)
+    ax = figure.axes[0]
+    lines = ax.get_lines()
+    if args.show:
+        plotter.show(block=False)
+    lastGrowth = time.time()
+    try:
+        while args.idle_exit == None or time.time() - lastGrowth < args.idle_exit:
+            if args.show:
+                plotter.pause(args.refresh)
+            else:
+                time.sleep(args.refresh)
+            if sum([readAppended(t, args.window) for t in tails]) == 0:
+                continue
+            lastGrowth = time.time()
+            for line, tail, legend in zip(lines, tails, legends):
+                data = downsample(getTailData(tail, legend), args)
+                line.set_data(data.x, data.y)
+            ax.relim()
+            ax.autoscale_view()
+            figure.savefig(args.out_file.name, bbox_inches='tight', bbox_extra_artists=(ax.get_legend(),))
+    except KeyboardInterrupt:
+        pass
+
+def plotWithArgs(args):
+    selection = getDataSelection(args)
+    renderFigure(selection, args, args.out_file.name)
 
     # show  the plot if necessary
     if args.show:
@@ -220,9 +503,42 @@ if __name__ == '__main__':
                         help='the selected column to be plotted')
     parser.add_argument('-o', '--out-file', type=argparse.FileType('w'), required=True,
                         help='the file where the plot will be saved to')
-    parser.add_argument('-i', '--in-files', nargs='+', type=argparse.FileType('r'), required=True,
+    parser.add_argument('-X', '--index', default=None,
+                        help='the experiment index written by anonymize.py, queried for the parameters of each '+
+                                'input file instead of parsing its file name')
+    parser.add_argument('-D', '--downsample', choices=['minmax', 'lttb'], default=None,
+                        help='downsample each data series before plotting it, keeping the shape of the curve: '+
+                                'minimum and maximum of each bucket, or Largest-Triangle-Three-Buckets')
+    parser.add_argument('-n', '--points', type=int, default=None,
+                        help='the number of buckets (minmax) or points (lttb) of the downsampled series. '+
+                                'Defaults to the width of the figure, in pixels')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('-i', '--in-files', nargs='+', type=argparse.FileType('r'),
                         help='the CSV file or files used as input data')
+    inputs.add_argument('-S', '--store', default=None,
+                        help='the results store (see resultstore.py) used as input data, instead of CSV files')
+    parser.add_argument('--table', default='evaluation', choices=resultstore.csvKinds,
+                        help='the table of the results store where the data series are selected from')
+    parser.add_argument('--where', default=None,
+                        help='an SQL predicate that selects the runs of the results store to be plotted, '+
+                                'e.g. "filter = \'ma\' AND p_k = 3"')
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help='follow the input files while MOA writes them: read the rows appended to them and '+
+                                'update (and export) the plot every --refresh seconds, until interrupted')
+    parser.add_argument('--refresh', type=float, default=refreshInterval,
+                        help='the seconds between two refreshes of a followed plot')
+    parser.add_argument('--window', type=int, default=followWindow,
+                        help='the most recent points of each followed series kept at full resolution; the older '+
+                                'ones are decimated (min-max) to as many points, so that the memory stays bounded')
+    parser.add_argument('--idle-exit', type=float, default=None,
+                        help='stop following the input files when none of them grew for this many seconds')
     args = parser.parse_args()
 
     # main procedure
-    plotWithArgs(args)
+    if args.follow:
+        if args.store != None:
+            print 'ERROR: only CSV files (-i) can be followed'
+            sys.exit(1)
+        followWithArgs(args)
+    else:
+        plotWithArgs(args)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict
+import json
+import os
+import socket
+import time
+
+# seconds between two writes of the progress file (it is always written when
+#  a task starts or finishes)
+writeInterval = 2.0
+
+# the states of a task of the sweep, in the order they are reported
+states = ['queued', 'running', 'done', 'failed']
+
+def startTracking(path, sweep, workers=None):
+	'''
+	Starts tracking the progress of a sweep (e.g. "anonymize.py
+	config/anonymize.json") into a JSON file, rewritten as its tasks run, for
+	sweep-monitor.py or any other reader. The number of concurrent workers
+	(None when they are the workers of a queue) is needed for the ETA.
+	Returns the tracker that the other functions take; they all accept None
+	(progress not tracked) and do nothing then.
+	'''
+	return {
+		'file': path,
+		'sweep': sweep,
+		'host': socket.gethostname(),
+		'pid': os.getpid(),
+		'workers': workers,
+		'started': time.time(),
+		'finished': None,
+		'written': 0.0,
+		'tasks': OrderedDict()
+	}
+
+def addTask(tracker, name, estimate, instances=None, throughputFile=None, updateRate=None):
+	'''
+	Adds a queued task, with its estimated runtime (seconds) and, to follow
+	its progress, the instances it processes and the throughput CSV file that
+	MOA extends by a row every `updateRate` instances.
+	'''
+	if tracker == None:
+		return
+	tracker['tasks'][name] = {
+		'status': 'queued',
+		'worker': None,
+		'started': None,
+		'elapsed': None,
+		'returncode': None,
+		'estimate': estimate,
+		'instances': float(instances) if instances != None else None,
+		'throughputFile': throughputFile,
+		'updateRate': updateRate,
+		'offset': 0,
+		'rows': -1, # the header is not a row
+		'samples': [] # the first and last (time, rows) observed after the first row
+	}
+	writeProgress(tracker)
+
+def getFreeSlot(tracker):
+	used = set(t['worker'] for t in tracker['tasks'].values() if t['status'] == 'running')
+	slot = 0
+	while 'slot %d' % slot in used:
+		slot += 1
+	return 'slot %d' % slot
+
+def markRunning(tracker, name, worker=None, started=None):
+	'''
+	Marks a task as running on a worker (by default, the first free slot of
+	the local pool).
+	'''
+	if tracker == None or name not in tracker['tasks']:
+		return
+	task = tracker['tasks'][name]
+	task.update(status='running', worker=worker or getFreeSlot(tracker), started=started or time.time(),
+				offset=0, rows=-1, samples=[])
+	writeProgress(tracker, force=True)
+
+def markFinished(tracker, name, returncode, elapsed):
+	if tracker == None or name not in tracker['tasks']:
+		return
+	tracker['tasks'][name].update(status='done' if returncode == 0 else 'failed', returncode=returncode,
+								elapsed=elapsed)
+	writeProgress(tracker, force=True)
+
+def syncLeases(tracker, leases):
+	'''
+	Follows the tasks that the workers of a queue run, from the current
+	leases, as (task name, worker) pairs: a task leased again (by another
+	worker) restarts, and a running task no longer leased (expired or
+	released) is queued again, unless it finished.
+	'''
+	if tracker == None:
+		return
+	leased = dict(leases)
+	for name, task in tracker['tasks'].items():
+		if name in leased and (task['status'] != 'running' or task['worker'] != leased[name]):
+			markRunning(tracker, name, leased[name])
+		elif name not in leased and task['status'] == 'running':
+			task.update(status='queued', worker=None, started=None)
+	writeProgress(tracker)
+
+def readThroughput(task, now):
+	'''
+	Counts the rows that MOA appended to the throughput file of a running task
+	since the last call (only the new bytes are read).
+	'''
+	if task['throughputFile'] == None or not os.path.isfile(task['throughputFile']):
+		return
+	with open(task['throughputFile'], 'rb') as f:
+		f.seek(task['offset'])
+		chunk = f.read()
+	if not chunk:
+		return
+	# only complete lines are counted, the last one may still be written
+	complete = chunk.rfind('\n') + 1
+	task['offset'] += complete
+	task['rows'] += chunk.count('\n', 0, complete)
+	if task['rows'] > 0:
+		task['samples'] = task['samples'][:1] + [(now, task['rows'])]
+
+def getProcessed(task):
+	if task['updateRate'] == None or task['rows'] <= 0:
+		return None
+	processed = float(task['rows'] * task['updateRate'])
+	return min(processed, task['instances']) if task['instances'] != None else processed
+
+def getRate(task, now):
+	'''
+	The instances per second of a running task, between the first and the
+	last rows of its throughput file (so that the startup of the JVM is not
+	counted) or, with a single row yet, since it started.
+	'''
+	processed = getProcessed(task)
+	if processed == None:
+		return None
+	if len(task['samples']) == 2 and task['samples'][1][0] > task['samples'][0][0]:
+		(firstTime, firstRows), (lastTime, lastRows) = task['samples']
+		return (lastRows - firstRows) * task['updateRate'] / (lastTime - firstTime)
+	return processed / max(now - task['started'], 1e-3)
+
+def getCalibration(tracker):
+	'''
+	The ratio between the elapsed and the estimated time of the tasks that
+	completed in this sweep, to correct the estimates (fitted over the history
+	of the ledger, maybe on other hosts) of the remaining ones.
+	'''
+	completed = [t for t in tracker['tasks'].values() if t['status'] == 'done' and t['estimate']]
+	estimated = sum(t['estimate'] for t in completed)
+	if estimated <= 0:
+		return 1.0
+	return sum(t['elapsed'] for t in completed) / estimated
+
+def getSnapshot(tracker):
+	'''
+	Returns the progress of the sweep as written to the progress file: the
+	tasks in each state, the running ones (worker, progress, rate and ETA),
+	the failed ones, and the ETA of the sweep.
+	'''
+	now = time.time()
+	calibration = getCalibration(tracker)
+	tasks = tracker['tasks'].values()
+	counts = dict((state, len([t for t in tasks if t['status'] == state])) for state in states)
+	running = []
+	remaining = 0.0
+	longest = 0.0
+	for name, task in tracker['tasks'].items():
+		if task['status'] == 'queued':
+			remaining += (task['estimate'] or 0.0) * calibration
+		if task['status'] != 'running':
+			continue
+		readThroughput(task, now)
+		elapsed = now - task['started']
+		processed = getProcessed(task)
+		rate = getRate(task, now)
+		if rate and task['instances'] != None:
+			eta = (task['instances'] - processed) / rate
+		else:
+			eta = max((task['estimate'] or 0.0) * calibration - elapsed, 0.0)
+		remaining += eta
+		longest = max(longest, eta)
+		running.append({'name': name, 'worker': task['worker'], 'started': task['started'], 'elapsed': elapsed,
+						'estimate': task['estimate'], 'instances': task['instances'], 'processed': processed,
+						'rate': rate, 'eta': eta})
+	spent = sum(t['elapsed'] for t in tasks if t['status'] in ('done', 'failed')) + \
+			sum(r['elapsed'] for r in running)
+	workers = tracker['workers'] or max(len(running), 1)
+	return {
+		'sweep': tracker['sweep'],
+		'host': tracker['host'],
+		'pid': tracker['pid'],
+		'workers': tracker['workers'],
+		'started': tracker['started'],
+		'updated': now,
+		'finished': tracker['finished'],
+		'counts': counts,
+		'calibration': calibration,
+		'remaining': remaining,
+		'eta': max(remaining / workers, longest) if tracker['finished'] == None else 0.0,
+		'percent': 100.0 * spent / (spent + remaining) if spent + remaining > 0 else 100.0,
+		'running': running,
+		'failed': [{'name': name, 'returncode': t['returncode'], 'elapsed': t['elapsed']}
+					for name, t in tracker['tasks'].items() if t['status'] == 'failed']
+	}
+
+def writeProgress(tracker, force=False):
+	'''
+	Rewrites the progress file (atomically, so that readers never see it half
+	written), at most every writeInterval seconds unless forced.
+	'''
+	if tracker == None or (not force and time.time() - tracker['written'] < writeInterval):
+		return
+	tmpFile = tracker['file'] + '.tmp'
+	with open(tmpFile, 'w') as f:
+		json.dump(getSnapshot(tracker), f, indent=1)
+	os.rename(tmpFile, tracker['file'])
+	tracker['written'] = time.time()
+
+def finishTracking(tracker):
+	if tracker == None:
+		return
+	tracker['finished'] = time.time()
+	writeProgress(tracker, force=True)
+
+def readProgress(path):
+	with open(path) as f:
+		return json.load(f)
+
+def formatDuration(seconds):
+	if seconds == None:
+		return '--:--:--'
+	seconds = int(round(seconds))
+	return '%02d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import argparse
+import signal
+import sys
+import time
+from taskrunner import startTask, waitTask, finishTask, killAll
+from termcolor import colored
+import workqueue
+
+def stopWorking(signum, frame):
+	raise KeyboardInterrupt()
+
+def work(queue, workerId, slots, drain):
+	'''
+	Claims tasks from the queue and executes them, at most `slots` at the same
+	time, renewing their leases while they run. With `drain`, the worker exits
+	once there is nothing left to claim; otherwise it waits for more tasks.
+	Returns the number of failed tasks.
+	'''
+	running = []
+	failed = 0
+	lastHeartbeat = time.time()
+	try:
+		while True:
+			# claim tasks for the free slots
+			claimed = False
+			while len(running) < slots:
+				task = workqueue.claim(queue, workerId)
+				if task == None:
+					break
+				claimed = True
+				running.append(startTask(task))
+			if not running and not claimed:
+				if drain and not workqueue.getCounts(queue).get('pending'):
+					break
+				time.sleep(workqueue.pollInterval)
+				continue
+
+			# report the finished tasks
+			stillRunning = []
+			for r in running:
+				returncode, maxrss = waitTask(r.reaper)
+				if returncode == None:
+					stillRunning.append(r)
+					continue
+				result = finishTask(r, returncode, maxrss)
+				if not workqueue.complete(queue, result, workerId):
+					print colored('[LOST]', 'yellow'), r.task.name, 'lease expired before completion, result discarded'
+				elif returncode != 0:
+					failed += 1
+			running = stillRunning
+
+			# renew the leases of the running tasks, abandoning the lost ones
+			if time.time() - lastHeartbeat > workqueue.leaseTime / 3.0:
+				lastHeartbeat = time.time()
+				lost = [r for r in running if not workqueue.heartbeat(queue, r.task.name, workerId)]
+				for r in lost:
+					print colored('[LOST]', 'yellow'), r.task.name, 'lease was requeued, killing the task'
+				killAll(lost)
+				running = [r for r in running if r not in lost]
+			if running:
+				time.sleep(0.5)
+	except KeyboardInterrupt:
+		print colored('[STOPPING]', 'red'), 'releasing %d running task(s)' % len(running)
+		killAll(running)
+		for r in running:
+			workqueue.release(queue, r.task.name, workerId)
+	return failed
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Executes the tasks of a work queue filled by anonymize.py or scalability.py '+
+									'(--queue). Start as many workers as desired, on one or several hosts, from the '+
+									'same (shared) directory as the coordinator: the paths in the tasks are relative to it.')
+	parser.add_argument('queue', help='the work queue (SQLite database, on storage shared by every host)')
+	parser.add_argument('-n', '--slots', type=int, default=1,
+						help='the number of tasks that this worker executes concurrently')
+	parser.add_argument('-l', '--lease', type=int, default=workqueue.leaseTime,
+						help='the seconds a task stays leased without a heartbeat, before it is requeued')
+	parser.add_argument('-i', '--id', default=None,
+						help='the identifier of the worker in the queue. Defaults to <host>:<pid>')
+	parser.add_argument('--drain', action='store_true',
+						help='exit once there are no more pending tasks, instead of waiting for new ones')
+	args = parser.parse_args()
+
+	workqueue.leaseTime = args.lease
+	workerId = args.id if args.id != None else workqueue.getWorkerId()
+	signal.signal(signal.SIGTERM, stopWorking)
+	queue = workqueue.openQueue(args.queue)
+	print colored('[WORKER]', 'green'), 'Worker %s executing tasks from %s with %d slot(s)' \
+			% (workerId, args.queue, args.slots)
+	failed = work(queue, workerId, args.slots, args.drain)
+	if failed > 0:
+		sys.exit(1)
@@ -1,35 +1,161 @@
 #! /usr/bin/env python
 
 import argparse
+import moatask
+from moatask import MoaTask
 import os
-from subprocess import call
+import Queue
+import shlex
+from subprocess import call, Popen, PIPE
+import sys
+from taskrunner import formatCmd
 from termcolor import colored
+import threading
+
+# global variables
+# the command that executes the MOA tasks, with the options of moa.sh (e.g. the
+#  client of moa-worker.py), or None to launch their JVMs directly
+moaCommand = None
+workerCmd = './moa-worker.py java'
+force = False
+
+def getOutFile(reportFile, outDir):
+	basename = os.path.splitext(os.path.basename(reportFile))[0]
+	return outDir + '/' + basename + '.txt'
+
+def isUpToDate(reportFile, outFile):
+	return os.path.isfile(outFile) and os.path.getmtime(outFile) >= os.path.getmtime(reportFile)
 
 def executeMOATask(reportFile, outDir):
-	basename = os.path.splitext(os.path.basename(reportFile.name))[0]
-	outFile = outDir + '/' + basename + '.txt'
-	cmdFormat = {
-		'report': reportFile.name,
-		'out': outFile
-	}
-	cmd = './moa.sh "ReadAnonymizationReport -r %(report)s" > %(out)s' % cmdFormat
-	print colored('[RUNNING]', 'green'), 'Executing:', cmd
-	call(cmd, shell=True)
+	outFile = getOutFile(reportFile, outDir)
+	task = MoaTask(task='ReadAnonymizationReport', params=[('-r', reportFile)])
+	cmd = moatask.getArgv(task, launcher=moaCommand)
+	print colored('[RUNNING]', 'green'), 'Executing:', formatCmd(cmd), '>', outFile
+	with open(outFile, 'wb') as out:
+		returncode = call(cmd, stdout=out)
+	if returncode != 0 and os.path.isfile(outFile):
+		# not to be taken for an up-to-date dump
+		os.remove(outFile)
+	return returncode
+
+def startWorker():
+	return Popen(shlex.split(workerCmd), stdin=PIPE, stdout=PIPE)
+
+def dumpOnWorker(worker, reportFile, outFile):
+	'''
+	Dumps a report on a warm JVM (see moa-worker.py), into a temporary file
+	that replaces the dump once complete. Returns the exit code of the task,
+	or None if the worker died.
+	'''
+	tmpFile = outFile + '.tmp'
+	errFile = outFile + '.err'
+	try:
+		worker.stdin.write('%s\t%s\tReadAnonymizationReport -r %s\n' % (tmpFile, errFile, reportFile))
+		worker.stdin.flush()
+		response = worker.stdout.readline()
+	except IOError:
+		response = ''
+	if response == '':
+		return None
+	returncode = int(response)
+	if returncode == 0:
+		os.rename(tmpFile, outFile)
+		os.remove(errFile)
+	return returncode
+
+def dumpReports(reports, outDir, failures):
+	'''
+	Dumps the reports of a queue back-to-back on a single JVM, restarting it
+	if it dies. Failed reports are appended to `failures`.
+	'''
+	worker = startWorker()
+	try:
+		while True:
+			try:
+				reportFile = reports.get_nowait()
+			except Queue.Empty:
+				break
+			outFile = getOutFile(reportFile, outDir)
+			returncode = dumpOnWorker(worker, reportFile, outFile)
+			if returncode == None:
+				print colored('[WORKER]', 'red'), 'Worker (pid %d) died, restarting it' % worker.pid
+				worker.wait()
+				worker = startWorker()
+			if returncode == 0:
+				print colored('[DUMPED]', 'green'), reportFile, '->', outFile
+			else:
+				print colored('[FAILED]', 'red'), reportFile, '(errors: %s)' % (outFile + '.err')
+				failures.append(reportFile)
+	finally:
+		worker.stdin.close()
+		worker.wait()
+
+def dumpReportsInBatches(reportFiles, outDir, jobs):
+	'''
+	Dumps the reports on `jobs` JVMs in parallel, each one executing its
+	share of them back-to-back, so that the JVM startup is paid once per JVM
+	instead of once per report. Returns the number of failed reports.
+	'''
+	reports = Queue.Queue()
+	for reportFile in reportFiles:
+		reports.put(reportFile)
+	failures = []
+	threads = [threading.Thread(target=dumpReports, args=(reports, outDir, failures))
+				for i in range(min(jobs, len(reportFiles)))]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return len(failures)
 
 def dumpReportsWithArgs(args):
-	for file in args.report_files:
-		executeMOATask(file, args.out_dir)
+	reportFiles = []
+	for reportFile in args.report_files:
+		if not force and isUpToDate(reportFile, getOutFile(reportFile, args.out_dir)):
+			print colored('[SKIPPED]', 'yellow'), 'Already dumped:', reportFile
+		else:
+			reportFiles.append(reportFile)
+	if args.batch:
+		failed = dumpReportsInBatches(reportFiles, args.out_dir, args.jobs)
+	else:
+		failed = len([f for f in reportFiles if executeMOATask(f, args.out_dir) != 0])
+	print colored('[SUMMARY]', 'green'), '%d report(s) dumped, %d skipped, %d failed' \
+			% (len(reportFiles) - failed, len(args.report_files) - len(reportFiles), failed)
+	return failed
 
 if __name__ == '__main__':
 	# argument parsing
 	parser = argparse.ArgumentParser(
 						description='Executes MOA to read anonymization reports and dump them in the'+
 									' specified directory.')
-	parser.add_argument('-r', '--report-files', nargs='+', type=argparse.FileType('r'), required=True,
+	parser.add_argument('-r', '--report-files', nargs='+', required=True,
 						help='the MOA report files to be read')
 	parser.add_argument('-o', '--out-dir', required=True,
 						help='the directory where the dumped report will be written')
+	parser.add_argument('-w', '--worker', default=None,
+						help='execute the MOA tasks on the warm JVMs of the moa-worker.py daemon listening on this Unix socket, instead of launching a JVM per report')
+	parser.add_argument('-b', '--batch', action='store_true',
+						help='dump the reports back-to-back on warm JVMs started for the batch (see moa-worker.py), '+
+								'instead of one JVM per report')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+						help='the number of JVMs that dump reports in parallel (batch mode)')
+	parser.add_argument('-c', '--worker-cmd', default=workerCmd,
+						help='the command that starts a JVM of the batch mode (e.g. "./moa-worker.py java -x 4g", '+
+								'or "./moa-worker.py stub" for testing)')
+	parser.add_argument('-f', '--force', action='store_true',
+						help='dump every report, even the ones whose dump is newer than the report')
 	args = parser.parse_args()
+	if args.worker != None:
+		moaCommand = './moa-worker.py run -s %s' % args.worker
+	elif not args.batch:
+		try:
+			moatask.checkLibraries()
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
+	workerCmd = args.worker_cmd
+	force = args.force
 
 	# main procedure
-	dumpReportsWithArgs(args)
+	if dumpReportsWithArgs(args) > 0:
+		sys.exit(1)
@@ -1,18 +1,41 @@
 #! /usr/bin/env python
 
+import anonymizationeval
 import argparse
+import glob
+import hashlib
+import json
+import mmap
+import multiprocessing
 import os
-from subprocess import call
 from termcolor import colored
 from collections import namedtuple
 import csv
+import experimentindex
 import re
 from filtermappings import getFilterName
+import resultstore
+import sqlite3
+import streamstore
+import sys
+import tempfile
 
 alpha = re.compile('[a-zA-Z]*')
-decimal = re.compile('\d+.\d+')
+decimal = re.compile('\d+\.\d+')
 number = re.compile('\d+')
 
+# reports larger than this (bytes) are memory-mapped instead of read
+mmapThreshold = 1 << 20
+
+# experiment index queried for the metadata of the reports, instead of their names
+indexFile = None
+index = None
+
+# original streams of the anonymized outputs evaluated without MOA, by stream
+#  name (None for every stream)
+originals = None
+normalizeLoss = False
+
 Param = namedtuple('Param', 'name value')
 
 def parseParams(paramsString):
@@ -29,86 +52,338 @@ def parseParams(paramsString):
 		params.append(param)
 	return params
 
-def parseParamsFromFile(file):
-    basename = os.path.basename(file.name)
+def parseParamsFromFile(path):
+    basename = os.path.basename(path)
     return parseParams(basename.split('_')[0])
 
-def parseMethodFromFile(file):
-	basename = os.path.basename(file.name)
+def parseMethodFromFile(path):
+	basename = os.path.basename(path)
 	methodCode = basename.split('_')[0].split('-')[0]
 	return getFilterName(methodCode)
 
-def parseStreamFromFile(file):
-	basename = os.path.basename(file.name)
+def parseStreamFromFile(path):
+	basename = os.path.basename(path)
 	return basename.split('_')[1].split('-')[0]
 
-def parseInstancesFromFile(file):
-	basename = os.path.splitext(file.name)[0]
+def parseInstancesFromFile(path):
+	basename = os.path.splitext(path)[0]
 	return basename.split('_')[1].split('-')[1]
 
-def parseDisclosureRiskFromFile(file):
+def parseMeasuresFromContent(content, path):
 	'''
 	Total disclosure risk:  0.957178000000
+	Total information loss: 11247.654446313676
+
+	Both measures are extracted in a single pass over the report content.
 	'''
-	file.seek(0)
-	match = re.search(r'Total\sdisclosure\srisk:\s\s(\d+.\d+)', file.read())
-	if match:
-		return match.group(1)
-	else:
-		raise NameError('No disclosure risk measure was found in file ' + file.name)
+	discRisk = None
+	infoLoss = None
+	for match in re.finditer(resultstore.measures, content):
+		if discRisk == None and match.group(1) != None:
+			discRisk = match.group(1)
+		elif infoLoss == None and match.group(2) != None:
+			infoLoss = match.group(2)
+		if discRisk != None and infoLoss != None:
+			break
+	if discRisk == None:
+		raise NameError('No disclosure risk measure was found in file ' + path)
+	if infoLoss == None:
+		raise NameError('No information loss measure was found in file ' + path)
+	return discRisk, infoLoss
 
-def parseInformationLossFromFile(file):
+def parseMeasuresFromFile(path):
+	with open(path, 'rb') as f:
+		size = os.fstat(f.fileno()).st_size
+		if size < mmapThreshold:
+			return parseMeasuresFromContent(f.read(), path)
+		content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			return parseMeasuresFromContent(content, path)
+		finally:
+			content.close()
+
+def getMetadataFromIndex(path):
+	global index
+	if indexFile == None:
+		return None
+	if index == None: # opened by each process that parses reports
+		index = experimentindex.openIndex(indexFile)
+	metadata = experimentindex.lookup(index, path)
+	if metadata == None:
+		return None
+	params = [Param(name=name, value=value) for name, value in metadata['params']]
+	return getFilterName(metadata['code']), metadata['stream'], str(metadata['instances']), params
+
+def getOriginalStream(stream, path):
+	if stream in originals:
+		return originals[stream]
+	if None in originals:
+		return originals[None]
+	raise NameError('No original stream was given for %s (stream %s)' % (path, stream))
+
+def evaluateOutput(path, stream):
 	'''
-	Total information loss: 11247.654446313676
+	Computes the measures of an anonymized output against its original stream
+	with NumPy (see anonymizationeval.py), instead of reading a MOA report.
 	'''
-	file.seek(0)
-	match = re.search(r'Total\sinformation\sloss:\s(\d+.\d+)', file.read())
-	if match:
-		return match.group(1)
+	discRisk, infoLoss, instances = anonymizationeval.evaluate(getOriginalStream(stream, path), path, normalizeLoss)
+	return repr(discRisk), repr(infoLoss)
+
+def parseReport(path):
+	metadata = getMetadataFromIndex(path)
+	if metadata != None:
+		method, stream, instances, params = metadata
+	else:
+		# the anonymized outputs are named like the reports, with another extension
+		reportPath = streamstore.getStem(path) + '.txt' if originals != None else path
+		method = parseMethodFromFile(reportPath)
+		stream = parseStreamFromFile(reportPath)
+		instances = parseInstancesFromFile(reportPath)
+		params = parseParamsFromFile(reportPath)
+	if originals != None:
+		discRisk, infoLoss = evaluateOutput(path, stream)
 	else:
-		raise NameError('No information loss measure was found in file ' + file.name)
+		discRisk, infoLoss = parseMeasuresFromFile(path)
+	return method, stream, instances, params, discRisk.replace(',','.'), infoLoss.replace(',','.')
 
-def getCSVHeader(params):
+def parseOriginals(specs):
+	'''
+	Parses the original streams given as FILE (of every output) or as
+	STREAM=FILE (of the outputs of a stream, by its name).
+	'''
+	parsed = {}
+	for spec in specs:
+		if '=' in spec:
+			stream, path = spec.split('=', 1)
+			parsed[stream] = path
+		else:
+			parsed[None] = spec
+	return parsed
+
+def getCSVHeader(paramNames):
 	paramsHeader = ''
-	for param in params:
-		paramsHeader += param.name + ','
+	for name in paramNames:
+		paramsHeader += name + ','
 	header = 'method,stream,instances,' + paramsHeader + 'disclosureRisk,informationLoss'
 	return header
 
-def getCsvLine(method, stream, instances, params, discRisk, infoLoss):
+def getCsvLine(method, stream, instances, params, discRisk, infoLoss, paramNames):
+	'''
+	Returns the CSV line of a report, with the values of its parameters in
+	the columns of the given names (empty for the ones of other filters).
+	'''
+	values = dict((param.name, param.value) for param in params)
 	line = method + ',' + stream + ',' + instances + ','
-	for param in params:
-		line += str(param.value) + ','
+	for name in paramNames:
+		line += (str(values[name]) if name in values else '') + ','
 	line += discRisk + ',' + infoLoss
 	return line
 
+def getReportPaths(args):
+	'''
+	Lazily lists the reports to read: the given report files or, for each given
+	input, the files of a directory or the files matching a glob pattern.
+	'''
+	if args.report_files != None:
+		for path in args.report_files:
+			yield path
+		return
+	for spec in args.input:
+		if os.path.isdir(spec) and not spec.rstrip('/').endswith('.cols'):
+			spec = os.path.join(spec, '*')
+		for path in sorted(glob.iglob(spec)):
+			if os.path.isfile(path) or path.rstrip('/').endswith('.cols'):
+				yield path
+
+def selectReportsFromStore(storeFile):
+	store = resultstore.openStore(storeFile)
+	for run in resultstore.selectRuns(store, 'report'):
+		discRisk, infoLoss = store.execute(
+				'SELECT disclosureRisk, informationLoss FROM reports WHERE run = ?', (run['id'],)).fetchone()
+		yield getFilterName(run['filter']), run['stream'], str(run['instances']), parseParams(run['spec']), \
+				repr(discRisk), repr(infoLoss)
+
+def parseReports(paths, jobs):
+	'''
+	Lazily parses the reports, in order, in a pool of processes if more than
+	one job is requested. The pool is shut down once the reports are consumed.
+	'''
+	if jobs <= 1:
+		for path in paths:
+			yield parseReport(path)
+		return
+	pool = multiprocessing.Pool(jobs)
+	try:
+		for report in pool.imap(parseReport, paths, chunksize=64):
+			yield report
+		pool.close()
+	except:
+		# a failed report, or the reports were not all consumed
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+def getMeasureSource():
+	'''
+	Describes how the measures are obtained: from the reports, or evaluated
+	with the given settings against the original streams as they are now
+	(their size and modification time). The reports parsed from another
+	source are parsed again.
+	'''
+	if originals == None:
+		return 'report'
+	streams = sorted((stream, path) + getFileStat(path) for stream, path in originals.items())
+	return 'evaluation %s %d %s' % (streams, anonymizationeval.windowSize, normalizeLoss)
+
+def openState(path):
+	'''
+	Opens (or creates) the state of an incremental aggregation: the size,
+	modification time, hash and parsed content of each report read.
+	'''
+	state = sqlite3.connect(path)
+	state.execute('''CREATE TABLE IF NOT EXISTS reports (
+						path TEXT PRIMARY KEY,
+						size INTEGER,
+						mtime REAL,
+						hash TEXT,
+						source TEXT,
+						report TEXT)''')
+	return state
+
+def getFileStat(path):
+	'''
+	Returns the size and modification time of a report (or of the files of a
+	columnar stream directory, in total and the latest).
+	'''
+	if not os.path.isdir(path):
+		stat = os.stat(path)
+		return stat.st_size, stat.st_mtime
+	stats = [os.stat(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+	return sum(s.st_size for s in stats), max([s.st_mtime for s in stats] + [os.stat(path).st_mtime])
+
+def getFileHash(path):
+	digest = hashlib.sha1()
+	files = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+	for fileName in files:
+		with open(fileName, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), ''):
+				digest.update(block)
+	return digest.hexdigest()
+
+def encodeReport(report):
+	method, stream, instances, params, discRisk, infoLoss = report
+	return json.dumps([method, stream, instances, [list(param) for param in params], discRisk, infoLoss])
+
+def decodeReport(encoded):
+	method, stream, instances, params, discRisk, infoLoss = json.loads(encoded)
+	return str(method), str(stream), str(instances), [Param(str(name), value) for name, value in params], \
+			str(discRisk), str(infoLoss)
+
+def readReportsIncrementally(paths, stateFile, jobs):
+	'''
+	Yields the reports of the given files, parsing only the ones that are new
+	or changed since the last call with the same state: the others are read
+	from the state. Files with a new size or modification time are hashed, so
+	that the ones only touched are not parsed again. The reports of the files
+	that no longer exist are removed from the state.
+	'''
+	state = openState(stateFile)
+	source = getMeasureSource()
+	paths = list(paths)
+	changed = []
+	for path in paths:
+		size, mtime = getFileStat(path)
+		row = state.execute('SELECT size, mtime, hash, source FROM reports WHERE path = ?', (path,)).fetchone()
+		if row != None and row[3] == source and (row[0], row[1]) == (size, mtime):
+			continue
+		fileHash = getFileHash(path)
+		if row != None and row[3] == source and row[2] == fileHash:
+			state.execute('UPDATE reports SET size = ?, mtime = ? WHERE path = ?', (size, mtime, path))
+		else:
+			changed.append((path, size, mtime, fileHash))
+	for (path, size, mtime, fileHash), report in zip(changed, parseReports([c[0] for c in changed], jobs)):
+		state.execute('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?)',
+					(path, size, mtime, fileHash, source, encodeReport(report)))
+	for (path,) in state.execute('SELECT path FROM reports').fetchall():
+		if not os.path.exists(path):
+			state.execute('DELETE FROM reports WHERE path = ?', (path,))
+	state.commit()
+	print >> sys.stderr, colored('[UPDATED]', 'green'), '%d new or changed report(s) parsed, %d unchanged' \
+			% (len(changed), len(paths) - len(changed))
+	for path in paths:
+		yield decodeReport(state.execute('SELECT report FROM reports WHERE path = ?', (path,)).fetchone()[0])
+
+def writeReports(out, reports):
+	'''
+	Writes the reports as CSV, with a column for each parameter of any of
+	them, in order of appearance. The reports are spooled to a temporary file
+	until all the parameters are known, not to be kept in memory.
+	'''
+	paramNames = []
+	spool = tempfile.TemporaryFile()
+	for report in reports:
+		for param in report[3]:
+			if param.name not in paramNames:
+				paramNames.append(param.name)
+		spool.write(encodeReport(report) + '\n')
+	spool.seek(0)
+	out.write(getCSVHeader(paramNames) + '\n')
+	for line in spool:
+		method, stream, instances, params, discRisk, infoLoss = decodeReport(line)
+		out.write(getCsvLine(method, stream, instances, params, discRisk, infoLoss, paramNames) + '\n')
+	spool.close()
+
 def readReports(args):
-	out = args.out_file
-	for i, report in enumerate(args.report_files, 0):
-		# data acquisition:
-		method = parseMethodFromFile(report)
-		stream = parseStreamFromFile(report)
-		instances = parseInstancesFromFile(report)
-		params = parseParamsFromFile(report)
-		discRisk = parseDisclosureRiskFromFile(report).replace(',','.')
-		infoLoss = parseInformationLossFromFile(report).replace(',','.')
-
-		# write to CSV:
-		if i == 0:
-			header = getCSVHeader(params)
-			out.write(header + '\n')
-		csvLine = getCsvLine(method, stream, instances, params, discRisk, infoLoss)
-		out.write(csvLine+'\n')
+	if args.store != None:
+		reports = selectReportsFromStore(args.store)
+	elif args.state != None:
+		reports = readReportsIncrementally(getReportPaths(args), args.state, args.jobs)
+	else:
+		reports = parseReports(getReportPaths(args), args.jobs)
+	writeReports(args.out_file, reports)
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(
 						description='Reads a list of MOA dumped reports, parses their content and outputs'+
 									' a CSV file with the result.')
-	parser.add_argument('-r', '--report-files', nargs='+', type=argparse.FileType('r'), required=True,
+	reports = parser.add_mutually_exclusive_group(required=True)
+	reports.add_argument('-r', '--report-files', nargs='+',
 						help='the dumped, plain-text, MOA report files to be read')
+	reports.add_argument('-i', '--input', nargs='+',
+						help='directories or glob patterns (quote them) of the report files to be read. '+
+								'The files are opened lazily, one at a time, in sorted order')
+	reports.add_argument('-s', '--store', default=None,
+						help='read the reports already ingested into a results store (see resultstore.py)')
 	parser.add_argument('-o', '--out-file', type=argparse.FileType('w'), required=True,
 						help='the CSV file to which the results will be saved')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+						help='the number of processes that parse the reports in parallel')
+	parser.add_argument('-x', '--index', default=None,
+						help='the experiment index written by anonymize.py, queried for the filter, parameters, '+
+								'stream and instances of each report instead of parsing its file name')
+	parser.add_argument('-e', '--evaluate', nargs='+', default=None, metavar='ORIGINAL',
+						help='the files are anonymized streams (in any format of stream-convert.py, with their '+
+								'header): compute their disclosure risk (distance-based record linkage) and information '+
+								'loss (SSE) against the original streams, given as FILE or as STREAM=FILE, without MOA')
+	parser.add_argument('--window', type=int, default=anonymizationeval.windowSize,
+						help='the instances linked together when evaluating (0 for the whole stream)')
+	parser.add_argument('--normalize', action='store_true',
+						help='compute the information loss on the attributes standardized with the original stream')
+	parser.add_argument('-u', '--state', default=None,
+						help='aggregate incrementally: only parse the reports that are new or changed since the last '+
+								'call with this state file (SQLite), which keeps the content of the others. The outputs '+
+								'evaluated with other settings or originals (-e) are evaluated again')
 	args = parser.parse_args()
+	indexFile = args.index
+	if args.evaluate != None:
+		originals = parseOriginals(args.evaluate)
+		for path in originals.values():
+			if not os.path.exists(path):
+				print 'ERROR: the original stream %s does not exist' % path
+				sys.exit(1)
+		anonymizationeval.windowSize = args.window
+		normalizeLoss = args.normalize
 
 	# main procedure
 	readReports(args)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import os
+import re
+import threading
+import time
+from termcolor import colored
+
+# seconds between two samples of a profiled task
+sampleInterval = 1.0
+
+# the peak resource usage of a profiled task (cpu in %, rss in MB, GC pause times in ms)
+Peaks = namedtuple('Peaks', 'cpu rss threads gcPauses gcPauseTime gcPauseMax')
+
+# the columns that the peaks add to a CSV file
+peakColumns = ['peakCpu', 'peakRss', 'peakThreads', 'gcPauses', 'gcPauseTime', 'gcPauseMax']
+
+# header of the per-task time series
+sampleColumns = ['time', 'cpu', 'rss', 'threads']
+
+# a GC pause in the unified JVM log (-Xlog:gc, Java 9 and later), e.g.
+#  [1.234s][info][gc] GC(3) Pause Young (Normal) (G1 Evacuation Pause) 24M->3M(256M) 3.456ms
+gcPause = re.compile(r'\bPause\b.*?(\d+(?:\.\d+)?)ms\s*$')
+
+# a GC pause in the log of older JVMs (-Xloggc, Java 8), in seconds, e.g.
+#  2.345: [GC (Allocation Failure)  33280K->5096K(125952K), 0.0050870 secs]
+legacyGcPause = re.compile(r'\[(?:Full )?GC\b.*?, (\d+\.\d+) secs\]')
+
+clockTicks = os.sysconf('SC_CLK_TCK')
+pageSize = os.sysconf('SC_PAGE_SIZE')
+
+def getGcLogFile(profileFile):
+	'''
+	Returns the file where the JVM of a profiled task logs its GC pauses, next
+	to the time series of the task.
+	'''
+	return os.path.splitext(profileFile)[0] + '.gc.log'
+
+def readStat(pid):
+	'''
+	Reads the parent pid, CPU ticks (user + system), threads and resident memory
+	(bytes) of a process from /proc, or returns None if it is gone.
+	'''
+	try:
+		with open('/proc/%d/stat' % pid, 'rb') as f:
+			stat = f.read()
+	except IOError:
+		return None
+	# the fields after the command name, which may contain spaces and parentheses
+	fields = stat[stat.rfind(')') + 2:].split()
+	return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21]) * pageSize
+
+def getProcessTree(pid):
+	'''
+	Returns the stats of a process and all its descendants (e.g. the JVM launched
+	by the wrapper that pipes its streams), by pid.
+	'''
+	stats = {}
+	for entry in os.listdir('/proc'):
+		if entry.isdigit():
+			stat = readStat(int(entry))
+			if stat != None:
+				stats[int(entry)] = stat
+	tree = {}
+	parents = set([pid])
+	while parents:
+		children = set()
+		for p in parents:
+			if p in stats:
+				tree[p] = stats[p]
+			children.update(c for c, stat in stats.items() if stat[0] == p and c not in tree)
+		parents = children
+	return tree
+
+def parseGcLog(gcLogFile):
+	'''
+	Returns the number, total and maximum time (ms) of the GC pauses logged by a JVM.
+	'''
+	pauses = []
+	if os.path.isfile(gcLogFile):
+		with open(gcLogFile, 'rb') as f:
+			for line in f:
+				match = re.search(gcPause, line)
+				if match:
+					pauses.append(float(match.group(1)))
+					continue
+				match = re.search(legacyGcPause, line)
+				if match:
+					pauses.append(1000 * float(match.group(1)))
+	return len(pauses), sum(pauses), max(pauses) if pauses else 0.0
+
+class Profiler(threading.Thread):
+	'''
+	Samples the CPU usage, resident memory and threads of a process tree at a
+	fixed interval, appending every sample to a CSV time series, until stopped.
+	'''
+	def __init__(self, pid, profileFile, interval):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.pid = pid
+		self.profileFile = profileFile
+		self.interval = interval
+		self.stopped = threading.Event()
+		self.peakCpu = 0.0
+		self.peakRss = 0.0
+		self.peakThreads = 0
+
+	def run(self):
+		start = time.time()
+		lastTime = start
+		lastTicks = dict((p, stat[1]) for p, stat in getProcessTree(self.pid).items())
+		with open(self.profileFile, 'w') as out:
+			out.write(','.join(sampleColumns) + '\n')
+			while not self.stopped.wait(self.interval):
+				tree = getProcessTree(self.pid)
+				if not tree:
+					break
+				now = time.time()
+				# CPU time since the last sample (all of it, for the processes started since)
+				ticks = dict((p, stat[1]) for p, stat in tree.items())
+				used = sum(t - lastTicks.get(p, 0) for p, t in ticks.items())
+				cpu = 100.0 * used / clockTicks / (now - lastTime)
+				rss = sum(stat[3] for stat in tree.values()) / 1048576.0
+				threads = sum(stat[2] for stat in tree.values())
+				lastTime, lastTicks = now, ticks
+				out.write('%.3f,%.1f,%.1f,%d\n' % (now - start, cpu, rss, threads))
+				out.flush() # the time series can be followed while the task runs
+				self.peakCpu = max(self.peakCpu, cpu)
+				self.peakRss = max(self.peakRss, rss)
+				self.peakThreads = max(self.peakThreads, threads)
+
+def startProfiler(pid, profileFile, interval=None):
+	'''
+	Starts profiling a process (and its descendants), writing the samples to
+	the given CSV file (in an existing directory). Returns None where /proc is
+	not available.
+	'''
+	if not os.path.isdir('/proc/%d' % pid):
+		print colored('[WARNING]', 'yellow'), 'cannot profile process %d: /proc is not available' % pid
+		return None
+	profiler = Profiler(pid, profileFile, interval if interval != None else sampleInterval)
+	profiler.start()
+	return profiler
+
+def stopProfiler(profiler):
+	'''
+	Stops a profiler, returning the peaks of the profiled task, including the
+	GC pauses logged by its JVM.
+	'''
+	if profiler == None:
+		return None
+	profiler.stopped.set()
+	profiler.join()
+	pauses, pauseTime, pauseMax = parseGcLog(getGcLogFile(profiler.profileFile))
+	return Peaks(cpu=profiler.peakCpu, rss=profiler.peakRss, threads=profiler.peakThreads,
+				gcPauses=pauses, gcPauseTime=pauseTime, gcPauseMax=pauseMax)
+
+def readPeaks(profileFile):
+	'''
+	Reads the peaks of a task back from its time series and GC log, or returns
+	None if the task was not profiled.
+	'''
+	if not os.path.isfile(profileFile):
+		return None
+	cpu, rss, threads = 0.0, 0.0, 0
+	with open(profileFile, 'rb') as f:
+		f.readline() # header
+		for line in f:
+			fields = line.strip().split(',')
+			if len(fields) == len(sampleColumns):
+				cpu = max(cpu, float(fields[1]))
+				rss = max(rss, float(fields[2]))
+				threads = max(threads, int(fields[3]))
+	pauses, pauseTime, pauseMax = parseGcLog(getGcLogFile(profileFile))
+	return Peaks(cpu=cpu, rss=rss, threads=threads, gcPauses=pauses, gcPauseTime=pauseTime, gcPauseMax=pauseMax)
+
+def formatPeaks(peaks):
+	'''
+	Formats the peaks of a task as the values of the peak columns of a CSV file.
+	'''
+	return '%.1f,%.1f,%d,%d,%.3f,%.3f' % peaks
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import experimentindex
+import glob
+import os
+import re
+import sqlite3
+import sys
+from termcolor import colored
+
+# kinds of CSV result files, each of them stored in its own table
+csvKinds = ['evaluation', 'throughput', 'scalability']
+
+# measures of the dumped anonymization reports (shared with report-reader.py),
+#  with a point or, in some locales, a comma as the decimal separator
+measures = re.compile(r'Total\sdisclosure\srisk:\s\s(\d+[.,]\d+)|Total\sinformation\sloss:\s(\d+[.,]\d+)')
+
+# experiment index queried for the metadata of the files, instead of their names
+index = None
+
+# metadata columns of the runs table (filter parameters are added as p_<name> columns)
+runColumns = ['kind', 'file', 'mtime', 'spec', 'filter', 'stream', 'instances']
+
+def decodeValue(value):
+	'''
+	Converts a textual value to an int or a float, if possible.
+	'''
+	try:
+		return int(value)
+	except ValueError:
+		try:
+			return float(value)
+		except ValueError:
+			return value
+
+def decodeFilterSpec(codedSpec):
+	'''
+	Decodes a coded filter specification (e.g. "dp-k3-e0.1-b100") into its filter
+	code and a list of (name, typed value) parameters.
+	'''
+	chunks = codedSpec.split('-')
+	params = []
+	for chunk in chunks[1:]:
+		match = re.match(r'([a-zA-Z]+)(.+)$', chunk)
+		params.append((match.group(1), decodeValue(match.group(2))))
+	return chunks[0], params
+
+def decodeFilename(path):
+	'''
+	Decodes the metadata of a result file from its name, which is built as
+	<coded filter>_<stream><instances> (or <stream>-<instances>).
+	'''
+	basename = os.path.splitext(os.path.basename(path))[0]
+	codedSpec, streamSpec = basename.split('_', 1)
+	match = re.match(r'(.*?)-?(\d*)$', streamSpec)
+	instances = int(match.group(2)) if match.group(2) else None
+	code, params = decodeFilterSpec(codedSpec)
+	return {'spec': codedSpec, 'filter': code, 'stream': match.group(1),
+			'instances': instances, 'params': params}
+
+def getFileMetadata(path):
+	metadata = experimentindex.lookup(index, path) if index != None else None
+	if metadata == None:
+		return decodeFilename(path)
+	params = metadata['params']
+	spec = metadata['code'] + ''.join('-%s%s' % (name, value) for name, value in params)
+	return {'spec': spec, 'filter': metadata['code'], 'stream': metadata['stream'],
+			'instances': metadata['instances'], 'params': params}
+
+def quote(name):
+	return '"%s"' % name.replace('"', '""')
+
+def sanitize(names):
+	'''
+	Turns CSV header names into unique column names.
+	'''
+	columns = []
+	for name in names:
+		column = re.sub(r'\W+', '_', name.strip()).strip('_') or 'column'
+		while column in columns or column in ('run', 'row'):
+			column += '_'
+		columns.append(column)
+	return columns
+
+def openStore(path):
+	store = sqlite3.connect(path)
+	store.execute('''CREATE TABLE IF NOT EXISTS runs (
+						id INTEGER PRIMARY KEY,
+						kind TEXT,
+						file TEXT UNIQUE,
+						mtime REAL,
+						spec TEXT,
+						filter TEXT,
+						stream TEXT,
+						instances INTEGER)''')
+	# runs are partitioned by filter and stream
+	store.execute('CREATE INDEX IF NOT EXISTS runs_partition ON runs (kind, filter, stream)')
+	for kind in csvKinds:
+		store.execute('CREATE TABLE IF NOT EXISTS %s (run INTEGER, row INTEGER)' % kind)
+		store.execute('CREATE INDEX IF NOT EXISTS %s_run ON %s (run, row)' % (kind, kind))
+	store.execute('CREATE TABLE IF NOT EXISTS reports (run INTEGER, disclosureRisk REAL, informationLoss REAL)')
+	store.execute('CREATE INDEX IF NOT EXISTS reports_run ON reports (run)')
+	store.commit()
+	return store
+
+def getColumns(store, table):
+	return [row[1] for row in store.execute('PRAGMA table_info(%s)' % table)]
+
+def ensureColumns(store, table, columns):
+	existing = getColumns(store, table)
+	for column in columns:
+		if column not in existing:
+			store.execute('ALTER TABLE %s ADD COLUMN %s NUMERIC' % (table, quote(column)))
+
+def deleteRun(store, runId):
+	for table in csvKinds + ['reports']:
+		store.execute('DELETE FROM %s WHERE run = ?' % table, (runId,))
+	store.execute('DELETE FROM runs WHERE id = ?', (runId,))
+
+def ingestRun(store, kind, path):
+	'''
+	Registers a result file as a run, returning its id, or None if the same
+	version of the file had already been ingested.
+	'''
+	mtime = os.path.getmtime(path)
+	row = store.execute('SELECT id, mtime FROM runs WHERE file = ?', (path,)).fetchone()
+	if row != None:
+		if row[1] == mtime:
+			return None
+		deleteRun(store, row[0])
+	meta = getFileMetadata(path)
+	paramColumns = ['p_' + name for name, value in meta['params']]
+	ensureColumns(store, 'runs', paramColumns)
+	columns = runColumns + paramColumns
+	values = [kind, path, mtime, meta['spec'], meta['filter'], meta['stream'], meta['instances']] \
+			+ [value for name, value in meta['params']]
+	cursor = store.execute('INSERT INTO runs (%s) VALUES (%s)' % \
+			(','.join(quote(c) for c in columns), ','.join('?' * len(columns))), values)
+	return cursor.lastrowid
+
+def ingestCsv(store, kind, path):
+	runId = ingestRun(store, kind, path)
+	if runId == None:
+		return False
+	with open(path, 'rb') as f:
+		reader = csv.reader(f)
+		# skip any output that precedes the CSV header (e.g. in scalability files)
+		header = next((row for row in reader if len(row) > 1), None)
+		if header == None:
+			return True
+		columns = sanitize(header)
+		ensureColumns(store, kind, columns)
+		sql = 'INSERT INTO %s (run, row, %s) VALUES (?, ?, %s)' % \
+				(kind, ','.join(quote(c) for c in columns), ','.join('?' * len(columns)))
+		rows = ([runId, i] + [decodeValue(v) for v in row] \
+				for i, row in enumerate(reader, 1) if len(row) == len(columns))
+		store.executemany(sql, rows)
+	return True
+
+def ingestReport(store, path):
+	runId = ingestRun(store, 'report', path)
+	if runId == None:
+		return False
+	values = {}
+	with open(path, 'rb') as f:
+		for match in re.finditer(measures, f.read()):
+			for group in (1, 2):
+				if match.group(group) != None:
+					values.setdefault(group, float(match.group(group).replace(',', '.')))
+	store.execute('INSERT INTO reports VALUES (?, ?, ?)', (runId, values.get(1), values.get(2)))
+	return True
+
+def listFiles(spec):
+	if os.path.isdir(spec):
+		spec = os.path.join(spec, '*')
+	return [path for path in sorted(glob.glob(spec)) if os.path.isfile(path)]
+
+def ingest(store, kind, specs):
+	ingested = 0
+	skipped = 0
+	for spec in specs:
+		for path in listFiles(spec):
+			if kind == 'report':
+				done = ingestReport(store, path)
+			else:
+				done = ingestCsv(store, kind, path)
+			if done:
+				ingested += 1
+			else:
+				skipped += 1
+	store.commit()
+	print colored('[INGESTED]', 'green'), '%s: %d file(s), %d unchanged' % (kind, ingested, skipped)
+
+def selectRuns(store, kind, where=None):
+	'''
+	Selects the runs of a kind, optionally filtered by an SQL predicate over the
+	runs columns (e.g. "filter = 'ma' AND stream = 'RandomRBFGenerator' AND p_k = 3").
+	Returns a list of dictionaries, sorted by file.
+	'''
+	sql = 'SELECT * FROM runs WHERE kind = ?'
+	if where != None:
+		sql += ' AND (%s)' % where
+	cursor = store.execute(sql + ' ORDER BY file', (kind,))
+	names = [d[0] for d in cursor.description]
+	return [dict(zip(names, row)) for row in cursor]
+
+def selectColumn(store, kind, runId, column):
+	'''
+	Selects the values of a column of a run, ordered by row.
+	'''
+	sql = 'SELECT %s FROM %s WHERE run = ? ORDER BY row' % (quote(column), kind)
+	return [row[0] for row in store.execute(sql, (runId,))]
+
+def query(store, sql, out):
+	cursor = store.execute(sql)
+	writer = csv.writer(out, lineterminator='\n')
+	writer.writerow([d[0] for d in cursor.description])
+	writer.writerows(cursor)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Consolidates the evaluation, throughput, scalability and report results into a '+
+									'single SQLite store, with one typed column per filter parameter and measure.')
+	parser.add_argument('store', help='the SQLite database file of the store')
+	subparsers = parser.add_subparsers(dest='command')
+
+	ingestParser = subparsers.add_parser('ingest',
+						help='ingest result files (directories or glob patterns). Unchanged files are skipped')
+	ingestParser.add_argument('-e', '--evaluation', nargs='+', default=[],
+						help='evaluation CSV files')
+	ingestParser.add_argument('-t', '--throughput', nargs='+', default=[],
+						help='throughput CSV files')
+	ingestParser.add_argument('-s', '--scalability', nargs='+', default=[],
+						help='scalability CSV files')
+	ingestParser.add_argument('-r', '--reports', nargs='+', default=[],
+						help='dumped, plain-text, MOA report files')
+	ingestParser.add_argument('-x', '--index', default=None,
+						help='the experiment index written by anonymize.py and scalability.py, queried for the '+
+								'metadata of each file instead of parsing its name')
+
+	queryParser = subparsers.add_parser('query', help='run an SQL query and output the result as CSV')
+	queryParser.add_argument('sql', help='the SQL query, e.g. "SELECT * FROM runs WHERE filter = \'ma\'"')
+	args = parser.parse_args()
+
+	store = openStore(args.store)
+	if args.command == 'ingest':
+		if args.index != None:
+			index = experimentindex.openIndex(args.index)
+		for kind in csvKinds:
+			if getattr(args, kind):
+				ingest(store, kind, getattr(args, kind))
+		if args.reports:
+			ingest(store, 'report', args.reports)
+	else:
+		query(store, args.sql, sys.stdout)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import moatask
+import os
+import sqlite3
+import time
+
+# cached checksums of the libraries (they are only computed once per execution)
+jarChecksums = None
+
+def getFileChecksum(path):
+	if not os.path.isfile(path):
+		return 'missing'
+	sha = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+def getJarChecksums():
+	global jarChecksums
+	if jarChecksums == None:
+		jarChecksums = [getFileChecksum(moatask.getLibrary(l)) for l in moatask.libraries]
+	return jarChecksums
+
+def getRunKey(experiment, stream, filterSpec, instances, replica=0):
+	'''
+	Content-addressed key of a run: it only changes when the kind of experiment,
+	the stream, the (fully expanded) filter, the instances, the replica or the
+	libraries do.
+	'''
+	spec = [experiment, stream, ' '.join(filterSpec.split()), str(instances), str(replica)] + getJarChecksums()
+	return hashlib.sha1('\n'.join(spec)).hexdigest()
+
+def openLedger(path):
+	ledger = sqlite3.connect(path)
+	ledger.execute('''CREATE TABLE IF NOT EXISTS runs (
+						key TEXT PRIMARY KEY,
+						stream TEXT,
+						filter TEXT,
+						instances TEXT,
+						replica INTEGER,
+						outputs TEXT,
+						status TEXT,
+						returncode INTEGER,
+						started REAL,
+						finished REAL)''')
+	ledger.commit()
+	return ledger
+
+def isValidOutput(path):
+	'''
+	An output is valid if it exists and is not empty. CSV files must also have
+	a data row after the header and be completely written (end with a newline).
+	'''
+	if not os.path.isfile(path) or os.path.getsize(path) == 0:
+		return False
+	if path.endswith('.csv'):
+		with open(path, 'rb') as f:
+			header = f.readline()
+			row = f.readline()
+			f.seek(-1, os.SEEK_END)
+			return len(header) > 0 and len(row) > 0 and f.read(1) == b'\n'
+	return True
+
+def isCompleted(ledger, key):
+	row = ledger.execute('SELECT status, outputs FROM runs WHERE key = ?', (key,)).fetchone()
+	if row == None or row[0] != 'done':
+		return False
+	return all(isValidOutput(path) for path in json.loads(row[1]))
+
+def markStarted(ledger, key, stream, filterSpec, instances, replica, outputs, started=None):
+	ledger.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, NULL)',
+				(key, stream, filterSpec, str(instances), replica, json.dumps(outputs), 'running',
+				started or time.time()))
+	ledger.commit()
+
+def markFinished(ledger, key, returncode):
+	status = 'done' if returncode == 0 else 'failed'
+	ledger.execute('UPDATE runs SET status = ?, returncode = ?, finished = ? WHERE key = ?',
+				(status, returncode, time.time(), key))
+	ledger.commit()
+
+def getElapsed(ledger, key):
+	'''
+	Returns the seconds that a completed run took, or None if it did not complete.
+	'''
+	row = ledger.execute('SELECT finished - started FROM runs WHERE key = ? AND status = ?',
+						(key, 'done')).fetchone()
+	return row[0] if row != None else None
+
+def forgetOutput(ledger, path):
+	'''
+	Invalidates every run that wrote to the given output (e.g. when it is about
+	to be truncated), so that those runs are executed again.
+	'''
+	for key, outputs in ledger.execute('SELECT key, outputs FROM runs').fetchall():
+		if path in json.loads(outputs):
+			ledger.execute('DELETE FROM runs WHERE key = ?', (key,))
+	ledger.commit()
@@ -1,28 +1,72 @@
 #!/usr/bin/env python
 
 import argparse
+import costmodel
+import experimentindex
 from filtermappings import getFilterCode
 import itertools
 import json
+import measurestats
+import memorymodel
+import moatask
+from moatask import MoaTask, JvmOptions
 import os
+import progress
 import re
-from subprocess import call
+import resourceprofiler
+import runledger
+import streamstore
 import sys
+import taskrunner
+from taskrunner import Task
 from termcolor import colored
 import textwrap
+import time
+import workqueue
 
 # global flags
 dryRun = False
+memoryBudget = None
+memoryModelFile = 'memory-model.json'
+ledgerFile = 'ledger.db'
+indexFile = 'index.db'
+force = False
+profile = False
+queueFile = None
+jobs = 1
+cpuSets = None
+adaptive = False
+minReplicas = 3
+maxReplicas = None
+relativeWidth = 0.05
+confidence = 0.95
+measure = 'elapsed'
+# the command that executes the MOA tasks, with the options of moa.sh (e.g. the
+#  client of moa-worker.py), or None to launch their JVMs directly
+moaCommand = None
 
-def getCodedFilterSpec(filterSpec, discriminantParameter, paramValue):
-	# print '(', filterSpec, ')', discriminantParameter, paramValue
+# global variables
+memoryModel = None
+ledger = None
+index = None
+costModel = None
+tracker = None
+sweepSeries = []
+plannedRuns = {}
+
+def getFilterSpecWithout(filterSpec, discriminantParameter):
 	filterComponents = filterSpec.split(' ')
-	filterName = filterComponents[0]
 	for i in range(len(filterComponents)):
 		if filterComponents[i] == ('-'+discriminantParameter):
 			del filterComponents[i+1]
 			del filterComponents[i]
 			break
+	return ' '.join(filterComponents)
+
+def getCodedFilterSpec(filterSpec, discriminantParameter, paramValue):
+	# print '(', filterSpec, ')', discriminantParameter, paramValue
+	filterComponents = getFilterSpecWithout(filterSpec, discriminantParameter).split(' ')
+	filterName = filterComponents[0]
 	filterParams = ''.join(filterComponents[1:len(filterComponents)])
 	return getFilterCode(filterName) + filterParams
 
@@ -34,53 +78,220 @@ def getBaseFilename(stream, filterSpec, discriminantParameter, paramValue):
 def getFile(outDir, baseFilename, extension):
 	return outDir + '/' + baseFilename + '.' + extension
 
-def getTaskOptions(instances):
-	return '-z -m %s' % instances
+def getRunName(baseFilename, discriminantParameter, paramValue, replica):
+	return '%s-%s%s-r%d' % (baseFilename, discriminantParameter, paramValue, replica)
 
-def cliCall(cmd):
+def getCaptureFile(options, runName):
+	# the output of every run, in a subdirectory of the scalability files
+	return getFile(os.path.join(options['scalabilityDirectory'], 'runs'), runName, 'out')
+
+def getProfileFile(options, runName):
+	# the time series of every run, in a subdirectory of the scalability files
+	return getFile(os.path.join(options['scalabilityDirectory'], 'profiles'), runName, 'csv')
+
+def getTaskParams(instances):
+	return [('-z', None), ('-m', instances)]
+
+def printCall(cmd):
 	# build wrapper to print nice, short lines in the CLI
 	wrapper = textwrap.TextWrapper(
 											initial_indent='    ', width=120, subsequent_indent='    ')
-	# check whether or not to actually execute the tasks
-	if not dryRun:
-		print colored('[RUNNING]', 'green'), 'Executing:'
-		print wrapper.fill(colored(cmd, 'cyan'))
-		call(cmd, shell=True) # execute the command call
-	else:
-		print colored('[DRY RUN]', 'red'), 'Would be calling:'
-		print wrapper.fill(colored(cmd, 'cyan'))
-
-def buildBaseCmd(stream, instances, filterSpec):
-	cmdFormat = {
-		'stream': '-s (%s)' % stream,
-		'filter': '-f (%s)' % filterSpec,
-		'task': getTaskOptions(instances)
-	}
-	return './moa.sh -e "Anonymize %(stream)s %(filter)s %(task)s"' % cmdFormat
-
-def executeExperiment(stream, instances, filterSpec,
-										  discriminantParameter, paramValue, isFirst, options):
-	# build the command line call
-	cmd = buildBaseCmd(stream, instances, filterSpec)
-
-	# add the necessary redirection for scalability experiment execution
-	scalabilityFile = getFile(options['scalabilityDirectory'], \
-									getBaseFilename(stream,filterSpec,discriminantParameter,paramValue), \
-									'csv')
-	cmdFormat = {
-		'head': discriminantParameter,
-		'value': paramValue,
-		'file': scalabilityFile
-	}
-	if isFirst:
-		# change the CSV header and CSV record that MOA outputs as summary
-		cmd += ' | sed "s/csvhead/%(head)s/;s/csv/%(value)s/" > %(file)s' % cmdFormat
-	else:
-		# only grep the CSV record and change it
-		cmd += ' | grep csv, | sed "s/csv/%(value)s/" >> %(file)s' % cmdFormat
+	print colored('[DRY RUN]', 'red'), 'Would be calling:'
+	print wrapper.fill(colored(taskrunner.formatCmd(cmd), 'cyan'))
+
+def getHeapSize(filterSpec, instances):
+	if memoryBudget == None:
+		return None
+	footprint = memorymodel.estimateFootprint(memoryModel, filterSpec, instances)
+	if footprint > memoryBudget:
+		print colored('[WARNING]', 'yellow'), 'estimated %dMB, over the %dMB memory budget' \
+				% (footprint, memoryBudget)
+		footprint = memoryBudget
+	return memorymodel.getHeapSize(footprint)
+
+def buildBaseCmd(stream, instances, filterSpec, runName, profileFile=None):
+	# the compressed (or columnar) streams are decoded into FIFOs read by MOA
+	stream, feeds = streamstore.getStreamFeeds(stream, runName)
+	task = MoaTask(task='Anonymize', stream=stream, filterSpec=filterSpec, params=getTaskParams(instances))
+	jvm = JvmOptions(heap=getHeapSize(filterSpec, instances),
+					gcLog=resourceprofiler.getGcLogFile(profileFile) if profileFile != None else None,
+					silenceError=True)
+	return streamstore.getPipedArgv(moatask.getArgv(task, jvm, moaCommand), feeds)
 
-	# perform the CLI call
-	cliCall(cmd)
+def parseCapture(captureFile):
+	'''
+	Extracts the CSV summary that MOA outputs (a "csvhead,..." header and a
+	"csv,..." record) from the captured output of a run, returning the header
+	and record fields, or (None, None) if the run did not output them.
+	'''
+	header = None
+	record = None
+	if os.path.isfile(captureFile):
+		with open(captureFile, 'rb') as f:
+			for line in f:
+				if line.startswith('csvhead,'):
+					header = line.strip().split(',')[1:]
+				elif line.startswith('csv,'):
+					record = line.strip().split(',')[1:]
+	return header, record
+
+def planRun(point, replica):
+	'''
+	Adds a replica to a point of the sweep, returning the task that executes
+	it, or None if the ledger records it as completed (resuming a sweep).
+	'''
+	runName = getRunName(point['baseFilename'], point['discriminantParameter'], point['value'], replica)
+	captureFile = getCaptureFile(point['options'], runName)
+	profileFile = getProfileFile(point['options'], runName) if profile else None
+	point['replicas'].append((captureFile, profileFile))
+
+	# skip the replicas that were already completed (their output was captured)
+	runKey = runledger.getRunKey('scalability', point['stream'], point['filterSpec'], point['instances'], replica)
+	if not force and runledger.isCompleted(ledger, runKey):
+		print colored('[SKIPPED]', 'yellow'), 'Already completed: replica %d of (%s)' % (replica, point['filterSpec'])
+		return None
+
+	cmd = buildBaseCmd(point['stream'], point['instances'], point['filterSpec'], runName, profileFile)
+	memory = None
+	if memoryBudget != None:
+		memory = memorymodel.estimateFootprint(memoryModel, point['filterSpec'], point['instances'])
+	plannedRuns[runName] = (point, replica, runKey, captureFile)
+	if tracker != None:
+		progress.addTask(tracker, runName, costmodel.estimateRuntime(costModel, point['filterSpec'], point['instances']),
+						point['instances'])
+	return Task(name=runName, cmd=cmd, logFile=captureFile, memory=memory, profileFile=profileFile)
+
+def getMeasurement(point, replica):
+	'''
+	Returns the measure of a completed replica: its elapsed time, from the
+	ledger, or the value of a column of its captured CSV record.
+	'''
+	if measure == 'elapsed':
+		runKey = runledger.getRunKey('scalability', point['stream'], point['filterSpec'], point['instances'], replica)
+		return runledger.getElapsed(ledger, runKey)
+	header, record = parseCapture(point['replicas'][replica][0])
+	if header == None or record == None or measure not in header:
+		return None
+	try:
+		return float(record[header.index(measure)])
+	except (ValueError, IndexError):
+		return None
+
+def isPreciseEnough(measurements):
+	width = measurestats.getRelativeWidth(measurements, confidence)
+	return width != None and width <= relativeWidth
+
+def extendPoint(point):
+	'''
+	In adaptive mode, adds replicas to a point whose replicas have all finished
+	until one has to be executed (returned as a single-task list) or the
+	confidence interval of the measure is narrow enough, or the maximum number
+	of replicas is reached (an empty list is returned).
+	'''
+	while True:
+		measurements = [m for m in (getMeasurement(point, i) for i in range(len(point['replicas']))) if m != None]
+		count = len(point['replicas'])
+		if count >= minReplicas and isPreciseEnough(measurements):
+			print colored('[ADAPTIVE]', 'green'), '%s = %s: %d replica(s), %s within +-%.1f%%' \
+					% (point['discriminantParameter'], point['value'], count, measure,
+						100 * measurestats.getRelativeWidth(measurements, confidence))
+			return []
+		if count >= point['maxReplicas']:
+			width = measurestats.getRelativeWidth(measurements, confidence)
+			print colored('[ADAPTIVE]', 'yellow'), '%s = %s: stopped at the maximum of %d replica(s), %s within +-%s%%' \
+					% (point['discriminantParameter'], point['value'], count, measure,
+						'%.1f' % (100 * width) if width != None else '?')
+			return []
+		task = planRun(point, count)
+		if task != None:
+			point['pending'] += 1
+			return [task]
+
+def recordResult(result):
+	point, replica, runKey, captureFile = plannedRuns[result.task.name]
+	# keep track of the run in the ledger, so that an interrupted sweep resumes here
+	runledger.markStarted(ledger, runKey, point['stream'], point['filterSpec'], point['instances'], replica,
+						[captureFile], started=time.time() - result.elapsed)
+	runledger.markFinished(ledger, runKey, result.returncode)
+	progress.markFinished(tracker, result.task.name, result.returncode, result.elapsed)
+	# refine the memory model with the peak memory observed for the run (on the
+	#  worker daemon, the measured process is its client, not the JVM)
+	if result.returncode == 0 and result.maxrss != None and moaCommand == None:
+		memorymodel.recordObservation(memoryModel, point['filterSpec'], point['instances'], result.maxrss)
+	point['pending'] -= 1
+	if adaptive and point['pending'] == 0:
+		return extendPoint(point)
+	return []
+
+def assembleSeries(series):
+	'''
+	Writes a scalability file from the captured outputs of its runs, in the
+	order of the sweep (discriminant values, then replicas), replacing the
+	previous file atomically.
+	'''
+	discriminantParameter = series['discriminantParameter']
+	header = None
+	rows = []
+	for point in series['points']:
+		for replica, (captureFile, profileFile) in enumerate(point['replicas']):
+			runHeader, record = parseCapture(captureFile)
+			if record == None:
+				print colored('[WARNING]', 'yellow'), 'no CSV record in', captureFile
+				continue
+			header = header or runHeader
+			row = [point['value']] + record
+			if profile:
+				peaks = resourceprofiler.readPeaks(profileFile)
+				# a run without peaks still needs an empty cell per peak column
+				row.append(resourceprofiler.formatPeaks(peaks) if peaks != None else
+						','.join([''] * len(resourceprofiler.peakColumns)))
+			# the wall-clock time of the run, as recorded by the ledger
+			runKey = runledger.getRunKey('scalability', point['stream'], point['filterSpec'], point['instances'], replica)
+			elapsed = runledger.getElapsed(ledger, runKey)
+			row.append('%.3f' % elapsed if elapsed != None else '')
+			rows.append(','.join(row))
+	if header == None:
+		print colored('[WARNING]', 'yellow'), 'no run of %s output a CSV summary' % series['file']
+		return
+	columns = [discriminantParameter] + header + (resourceprofiler.peakColumns if profile else []) + ['elapsed']
+	tmpFile = series['file'] + '.tmp'
+	with open(tmpFile, 'wb') as f:
+		f.write(','.join(columns) + '\n')
+		for row in rows:
+			f.write(row + '\n')
+	os.rename(tmpFile, series['file'])
+	print colored('[ASSEMBLED]', 'green'), '%s (%d record(s))' % (series['file'], len(rows))
+
+def trackStart(running):
+	# the runs pinned to CPUs are shown on them, the others on a slot of the pool
+	progress.markRunning(tracker, running.task.name, 'CPUs ' + running.cpus if running.cpus else None)
+
+def executeRuns(tasks):
+	'''
+	Executes the planned runs (on the local pool or on the workers of the
+	queue) and assembles the scalability files. Returns the number of failures.
+	'''
+	if dryRun:
+		for task in tasks:
+			printCall(task.cmd)
+		return 0
+	if queueFile != None:
+		queue = workqueue.openQueue(queueFile)
+		workqueue.enqueue(queue, tasks)
+		print colored('[QUEUE]', 'green'), 'Queued %d run(s) in %s, waiting for the workers' % (len(tasks), queueFile)
+		results = workqueue.waitForTasks(queue, tasks, onFinish=recordResult,
+										onPoll=lambda leases: progress.syncLeases(tracker, leases))
+	else:
+		print colored('[POOL]', 'green'), 'Executing %d run(s) with %d worker(s)%s%s' \
+				% (len(tasks), jobs, ' pinned to CPUs ' + ', '.join(cpuSets) if cpuSets else '',
+					', memory budget: %dMB' % memoryBudget if memoryBudget != None else '')
+		results = taskrunner.runTasks(tasks, jobs, memoryBudget, onFinish=recordResult, cpuSets=cpuSets,
+									onStart=trackStart, onPoll=lambda: progress.writeProgress(tracker))
+	progress.finishTracking(tracker)
+	taskrunner.printSummary(results)
+	for series in sweepSeries:
+		assembleSeries(series)
+	return len([r for r in results if r.returncode != 0])
 
 def buildFilterParams(paramsPermutation, paramsNames, discriminantParameter, value):
 	params = ''
@@ -94,6 +305,7 @@ def processWithConfig(configuration):
 	streams = configuration['streams']
 	options = configuration['options']
 	replicas = configuration['replicas']
+	tasks = []
 
 	# for each filter in the configuration
 	for privacyFilter in filters:
@@ -123,20 +335,49 @@ def processWithConfig(configuration):
 				# for each number of instances
 				for instances in options['maximumInstances']:
 					# discriminate over a parameter (all executions go to the same CSV file)
-					first = True
+					series = None
 					for value in discriminantValues:
 						# generate filter specification
 						filterParams = buildFilterParams(
 														permutation, paramsNames, discriminantParameter, value)
 						builtFilter = filterName + ' ' + filterParams
-						for i in range(0, replicas): # for the specified number of replicas
-							# print stream, instances, '(', builtFilter, ')', discriminantParameter, value, first
-							executeExperiment(
-									stream, str(instances), builtFilter, \
-									discriminantParameter, str(value), first, options)
-							# not the first one anymore!
-							if first:
-								first = False
+						baseFilename = getBaseFilename(stream, builtFilter, discriminantParameter, str(value))
+						if series == None:
+							series = {
+								'file': getFile(options['scalabilityDirectory'], baseFilename, 'csv'),
+								'discriminantParameter': discriminantParameter,
+								'points': []
+							}
+							sweepSeries.append(series)
+							# index the metadata of the file (all the replicas of every discriminant value)
+							if not dryRun:
+								experimentindex.registerOutput(index, series['file'], 'scalability',
+										getFilterSpecWithout(builtFilter, discriminantParameter), stream, str(instances))
+						point = {
+							'stream': stream,
+							'instances': str(instances),
+							'filterSpec': builtFilter,
+							'discriminantParameter': discriminantParameter,
+							'value': str(value),
+							'baseFilename': baseFilename,
+							'options': options,
+							'replicas': [],
+							'pending': 0,
+							'maxReplicas': maxReplicas if maxReplicas != None else replicas
+						}
+						series['points'].append(point)
+						# plan the replicas: all of them, or the minimum ones in adaptive mode
+						initial = min(minReplicas, point['maxReplicas']) if adaptive else replicas
+						for i in range(0, initial):
+							task = planRun(point, i)
+							if task != None:
+								point['pending'] += 1
+								tasks.append(task)
+						if adaptive and point['pending'] == 0 and not dryRun:
+							tasks.extend(extendPoint(point))
+	if not dryRun:
+		index.commit()
+	return tasks
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Test scalability of MOA-PPSM filters.')
@@ -144,10 +385,100 @@ if __name__ == '__main__':
 						help='a JSON file with the execution configuration')
 	parser.add_argument('-d', '--dry-run', action='store_true',
 						help='do not execute, just print the commands that WOULD be executed')
+	parser.add_argument('-M', '--memory-budget', type=int, default=None,
+						help='the total memory (MB) that concurrent runs may use. Runs are admitted according to '+
+								'their estimated footprint and each JVM heap (-Xmx) is sized after it, up to this budget')
+	parser.add_argument('--memory-model', default=memoryModelFile,
+						help='the file where the peak memory observed for each task is kept to refine the estimates')
+	parser.add_argument('-w', '--worker', default=None,
+						help='execute the MOA tasks on the warm JVMs of the moa-worker.py daemon listening on this Unix socket, instead of launching a JVM per run')
+	parser.add_argument('-j', '--jobs', type=int, default=jobs,
+						help='the maximum number of runs (JVMs) executed concurrently')
+	parser.add_argument('--pin-cpus', action='store_true',
+						help='pin each concurrent run to its own, disjoint, set of CPUs (with taskset), so that the '+
+								'runs do not contaminate the timings of each other')
+	parser.add_argument('-a', '--adaptive', action='store_true',
+						help='execute replicas of each point of the sweep only until the confidence interval of the '+
+								'measure is narrow enough (see --ci-width), instead of the configured number of replicas')
+	parser.add_argument('--min-replicas', type=int, default=minReplicas,
+						help='the minimum number of replicas of each point, in adaptive mode')
+	parser.add_argument('--max-replicas', type=int, default=None,
+						help='the maximum number of replicas of each point, in adaptive mode. Defaults to the '+
+								'configured number of replicas')
+	parser.add_argument('--ci-width', type=float, default=relativeWidth,
+						help='the target half-width of the confidence interval, relative to the mean of the measure '+
+								'(e.g. 0.05 for +-5%%), in adaptive mode')
+	parser.add_argument('--confidence', type=float, default=confidence, choices=measurestats.confidenceLevels,
+						help='the confidence level of the interval, in adaptive mode')
+	parser.add_argument('--measure', default=measure,
+						help='the measure whose precision is targeted, in adaptive mode: "elapsed" (the wall-clock '+
+								'time of each run) or the name of a column of the scalability CSV files')
+	parser.add_argument('-q', '--queue', default=None,
+						help='act as a coordinator: queue the runs in this work queue (SQLite database, on storage '+
+								'shared by the hosts) and wait for queue-worker.py workers to execute them')
+	parser.add_argument('-P', '--profile', action='store_true',
+						help='sample the CPU, resident memory and threads of every run (and log its GC pauses) into a '+
+								'time series under <scalabilityDirectory>/profiles/, and add the peaks as columns of '+
+								'the scalability CSV files. Not with -w')
+	parser.add_argument('--profile-interval', type=float, default=resourceprofiler.sampleInterval,
+						help='the seconds between two samples of a profiled run')
+	parser.add_argument('--index', default=indexFile,
+						help='the experiment index (SQLite database) where the metadata of every output file is recorded')
+	parser.add_argument('--ledger', default=ledgerFile,
+						help='the run ledger (SQLite database) used to skip the replicas that were already completed')
+	parser.add_argument('-f', '--force', action='store_true',
+						help='execute every replica, even if the ledger records it as completed')
+	parser.add_argument('--progress', default=None,
+						help='write the progress of the sweep (the runs in each state, the running ones and the ETA) '+
+								'to this JSON file, to follow it with sweep-monitor.py')
 	args = parser.parse_args()
 
 	# check if a dried run was requested
 	dryRun = args.dry_run
+	memoryBudget = args.memory_budget
+	memoryModelFile = args.memory_model
+	memoryModel = memorymodel.loadModel(memoryModelFile)
+	force = args.force
+	profile = args.profile
+	queueFile = args.queue
+	jobs = args.jobs
+	if args.pin_cpus:
+		try:
+			cpuSets = taskrunner.getCpuSets(jobs)
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
+	adaptive = args.adaptive
+	minReplicas = args.min_replicas
+	maxReplicas = args.max_replicas
+	relativeWidth = args.ci_width
+	confidence = args.confidence
+	measure = args.measure
+	if adaptive and queueFile != None:
+		print 'ERROR: the adaptive mode needs the measure of each replica before the next one: it cannot queue them'
+		sys.exit(1)
+	if profile and args.worker != None:
+		print 'ERROR: the tasks of the worker daemon (-w) cannot be profiled (-P): the profiled process would be its '+\
+				'client, not the JVM'
+		sys.exit(1)
+	resourceprofiler.sampleInterval = args.profile_interval
+	if args.worker != None:
+		moaCommand = './moa-worker.py run -s %s' % args.worker
+	elif not dryRun:
+		try:
+			moatask.checkLibraries()
+		except ValueError as e:
+			print 'ERROR: %s' % e
+			sys.exit(1)
+	# a dry run reads the ledger, to report the runs it would skip, but never creates it
+	ledger = runledger.openLedger(args.ledger if not dryRun or os.path.isfile(args.ledger) else ':memory:')
+	if not dryRun:
+		index = experimentindex.openIndex(args.index)
+	if args.progress != None and not dryRun:
+		costModel = costmodel.fitModel(costmodel.loadHistory(ledger))
+		# the workers of a queue are not known in advance
+		tracker = progress.startTracking(args.progress, 'scalability.py ' + args.config_file,
+										jobs if queueFile == None else None)
 
 	# execute with the config file given!
 	with open(args.config_file, 'rb') as configFile:
@@ -156,4 +487,9 @@ if __name__ == '__main__':
 			print 'ERROR: the configuration given is not a scalability experiment config file'
 			sys.exit(1)
 		else:
-			processWithConfig(configuration=config)
+			tasks = processWithConfig(configuration=config)
+			failed = executeRuns(tasks)
+			if not dryRun:
+				memorymodel.saveModel(memoryModel, memoryModelFile)
+			if failed > 0:
+				sys.exit(1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import measurestats
+import numpy
+
+# the complexity models of a measure (e.g. the runtime) in the size x (e.g.
+#  the buffer size -b): a fixed cost plus a cost linear in a term of x. The
+#  power law (a * x^b) is fitted as a line in log-log space
+terms = {
+	'linear': lambda x: x,
+	'n log n': lambda x: x * numpy.log(x),
+	'quadratic': lambda x: x ** 2
+}
+modelNames = ['linear', 'n log n', 'quadratic', 'power law']
+
+# a fitted model: its name, its two coefficients (the fixed cost and the cost
+#  per term; for the power law, the log of the factor and the exponent), the
+#  residual sum of squares and R^2 (of the measure, in all the models), and
+#  what its confidence band needs: the residual variance (of the fitted line),
+#  the inverse of X'X and the degrees of freedom
+Fit = namedtuple('Fit', 'model coefficients rss r2 variance inverse degrees')
+
+def getDesign(model, x):
+	'''
+	The design matrix of a model (a column of ones and one of its term).
+	'''
+	term = numpy.log(x) if model == 'power law' else terms[model](x)
+	return numpy.column_stack([numpy.ones(len(x)), term])
+
+def evaluate(fit, x):
+	line = getDesign(fit.model, x).dot(fit.coefficients)
+	return numpy.exp(line) if fit.model == 'power law' else line
+
+def fitModel(model, x, y):
+	'''
+	Fits a model by least squares, or returns None if it cannot be fitted
+	(the power law and n log n need positive sizes, the power law positive
+	measures, and every model three points of two sizes at least).
+	'''
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	if len(x) < 3 or len(numpy.unique(x)) < 2:
+		return None
+	if model in ('n log n', 'power law') and (x <= 0).any():
+		return None
+	if model == 'power law' and (y <= 0).any():
+		return None
+	design = getDesign(model, x)
+	target = numpy.log(y) if model == 'power law' else y
+	coefficients = numpy.linalg.lstsq(design, target, rcond=None)[0]
+	degrees = len(x) - 2
+	variance = ((target - design.dot(coefficients)) ** 2).sum() / degrees
+	inverse = numpy.linalg.pinv(design.T.dot(design))
+	fit = Fit(model=model, coefficients=coefficients, rss=None, r2=None, variance=variance, inverse=inverse,
+			degrees=degrees)
+	rss = ((y - evaluate(fit, x)) ** 2).sum()
+	total = ((y - y.mean()) ** 2).sum()
+	return fit._replace(rss=rss, r2=1 - rss / total if total > 0 else 1.0)
+
+def isPlausible(fit, sizes):
+	'''
+	Whether a fit can describe a cost: growing with the size (a positive cost
+	per term, or exponent for the power law) and positive at all the sizes.
+	'''
+	return fit.coefficients[1] > 0 and (evaluate(fit, numpy.asarray(sizes, dtype=float)) > 0).all()
+
+def fitModels(x, y, sizes=[]):
+	'''
+	Fits every model that can be fitted and is plausible over the measured
+	sizes and the given ones (e.g. those to predict), best first: they all
+	have two coefficients, so the best is the one with the lowest residual
+	sum of squares (in the scale of the measure).
+	'''
+	fits = [fitModel(model, x, y) for model in modelNames]
+	sizes = list(x) + list(sizes)
+	return sorted([f for f in fits if f != None and isPlausible(f, sizes)], key=lambda f: f.rss)
+
+def predict(fit, x, confidence):
+	'''
+	Predicts the measure at the sizes x with the confidence band of the
+	fitted curve: returns the predictions and the lower and upper bounds.
+	'''
+	x = numpy.asarray(x, dtype=float)
+	design = getDesign(fit.model, x)
+	line = design.dot(fit.coefficients)
+	halfWidth = measurestats.getTValue(fit.degrees, confidence) * \
+			numpy.sqrt(fit.variance * (design.dot(fit.inverse) * design).sum(axis=1))
+	if fit.model == 'power law':
+		return numpy.exp(line), numpy.exp(line - halfWidth), numpy.exp(line + halfWidth)
+	return line, line - halfWidth, line + halfWidth
+
+def describe(fit):
+	a, b = fit.coefficients
+	if fit.model == 'power law':
+		return 'y = %.4g * x^%.3f' % (numpy.exp(a), b)
+	return 'y = %.4g + %.4g * %s' % (a, b, {'linear': 'x', 'n log n': 'x log x', 'quadratic': 'x^2'}[fit.model])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import argparse
+import errno
+import multiprocessing
+import os
+import shutil
+import streamstore
+import sys
+from termcolor import colored
+
+# extensions of the formats that streams can be encoded to
+extensions = {
+	'gz': '.arff.gz',
+	'zst': '.arff.zst',
+	'cols': '.cols',
+	'arff': '.arff'
+}
+keep = False
+
+def encodeFile(job):
+	'''
+	Converts a stream to another format, next to it, removing the original
+	unless it has to be kept. Returns the converted file.
+	'''
+	fileName, extension = job
+	target = streamstore.getStem(fileName) + extension
+	streamstore.convert(fileName, target)
+	if not keep:
+		if os.path.isdir(fileName):
+			shutil.rmtree(fileName)
+		else:
+			os.remove(fileName)
+	return fileName, target
+
+def encodeFiles(fileNames, extension, jobs):
+	work = [(fileName, extension) for fileName in fileNames if not fileName.endswith(extension)]
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		results = pool.imap_unordered(encodeFile, work)
+	else:
+		results = (encodeFile(job) for job in work)
+	for fileName, target in results:
+		print colored('[CONVERTED]', 'green'), fileName, '->', target
+
+def cat(fileName):
+	try:
+		streamstore.decode(fileName, sys.stdout)
+		sys.stdout.flush()
+	except IOError as e:
+		# the reader (e.g. MOA, through a FIFO) stopped before the end of the stream
+		if e.errno != errno.EPIPE:
+			raise
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Converts ARFF streams between plain text, gzip (.arff.gz), zstd (.arff.zst) and '+
+									'a binary columnar format (.cols directories, one memory-mappable file per '+
+									'attribute), and decodes them for MOA. The format of a stream is given by its extension.')
+	subparsers = parser.add_subparsers(dest='command')
+
+	convertParser = subparsers.add_parser('convert', help='convert a stream into another file')
+	convertParser.add_argument('source', help='the stream to convert (may be a FIFO written by MOA)')
+	convertParser.add_argument('target', help='the converted stream')
+
+	encodeParser = subparsers.add_parser('encode', help='convert streams to a format, next to them')
+	encodeParser.add_argument('files', nargs='+', help='the streams to convert')
+	encodeParser.add_argument('-f', '--format', choices=sorted(extensions.keys()), required=True,
+						help='the format of the converted streams')
+	encodeParser.add_argument('-j', '--jobs', type=int, default=1,
+						help='the number of streams that are converted in parallel')
+	encodeParser.add_argument('-k', '--keep', action='store_true',
+						help='keep the original streams (they are removed once converted, by default)')
+
+	catParser = subparsers.add_parser('cat', help='write a stream as ARFF text to the standard output')
+	catParser.add_argument('source', help='the stream to decode')
+
+	pipeParser = subparsers.add_parser('pipe',
+						help='execute a command that reads (or writes) streams through FIFOs, decoding (or encoding) '+
+								'them meanwhile')
+	pipeParser.add_argument('--feed', nargs=2, action='append', default=[], metavar=('STREAM', 'FIFO'),
+						help='decode a stream into a FIFO read by the command')
+	pipeParser.add_argument('--sink', nargs=2, action='append', default=[], metavar=('FIFO', 'STREAM'),
+						help='encode what the command writes into a FIFO as a stream')
+	pipeParser.add_argument('cmd', nargs=argparse.REMAINDER, help='the command (after --), executed without a shell')
+	args = parser.parse_args()
+
+	try:
+		if args.command == 'convert':
+			streamstore.convert(args.source, args.target)
+		elif args.command == 'encode':
+			keep = args.keep
+			encodeFiles(args.files, extensions[args.format], args.jobs)
+		elif args.command == 'pipe':
+			cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+			if not cmd:
+				parser.error('no command to execute')
+			sys.exit(streamstore.runPiped(cmd, args.feed, args.sink))
+		else:
+			cat(args.source)
+	except (ValueError, ImportError) as e:
+		print >> sys.stderr, 'ERROR: %s' % e
+		sys.exit(1)
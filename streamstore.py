@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+
+from arffgenerator import getNominalValues, formatChunk
+import csv
+import errno
+import gzip
+import io
+import json
+import numpy
+import os
+import re
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+from taskrunner import ensureDir
+import tempfile
+import threading
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# instances parsed (and written) at once when converting between formats
+chunkSize = 1 << 16
+
+# compression level of the zstd streams (gzip uses its default, 9)
+zstdLevel = 3
+
+# the storage formats of a stream, by the extension of its file
+formats = [('.arff.gz', 'gzip'), ('.arff.zst', 'zstd'), ('.cols', 'columnar'), ('.arff', 'arff')]
+
+# the script that runs the commands that read (or write) stored streams
+#  through FIFOs (see getPipedArgv)
+convertCommand = './stream-convert.py'
+
+# the directory of the FIFOs between MOA and the decoders. They are local to
+#  a host, like both of their ends
+fifoDir = tempfile.gettempdir()
+
+# the file of an ArffFileStream in a MOA stream specification
+streamFileOption = re.compile(r'(-f\s+)([^\s()]+)')
+
+attributeLine = re.compile(r'''^@attribute\s+('(?:[^'\\]|\\.)*'|"[^"]*"|\S+)\s+(.*?)\s*$''', re.I)
+
+def getFormat(path):
+	for extension, name in formats:
+		if path.endswith(extension):
+			return name
+	raise ValueError('Unknown stream format (expected %s): %s' % (', '.join(e for e, f in formats), path))
+
+def isEncoded(path):
+	'''
+	Whether a stream file has to be decoded before MOA can read it.
+	'''
+	return any(path.endswith(e) for e, f in formats if f != 'arff')
+
+def getStem(path):
+	for extension, name in formats:
+		if path.endswith(extension):
+			return path[:-len(extension)]
+	return path
+
+def openText(path, mode='rb'):
+	'''
+	Opens an ARFF stream stored as text, compressed or not, for reading ('rb')
+	or writing ('wb').
+	'''
+	format = getFormat(path)
+	if format == 'gzip':
+		return gzip.open(path, mode)
+	if format == 'zstd':
+		if zstandard == None:
+			raise ImportError('The zstandard module is required for %s (pip install zstandard)' % path)
+		f = open(path, mode)
+		if mode.startswith('r'):
+			return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+		return zstandard.ZstdCompressor(level=zstdLevel).stream_writer(f)
+	if format == 'columnar':
+		raise ValueError('%s is a columnar stream, not a text one' % path)
+	return open(path, mode)
+
+def readHeader(f):
+	'''
+	Reads the header of an ARFF stream, up to its @data line. Returns the text
+	of the header and its attributes, as (name, type) pairs.
+	'''
+	lines = []
+	attributes = []
+	for line in f:
+		lines.append(line)
+		match = attributeLine.match(line.strip())
+		if match:
+			attributes.append((match.group(1), match.group(2)))
+		elif line.strip().lower().startswith('@data'):
+			return ''.join(lines), attributes
+	raise ValueError('The stream has no @data section')
+
+def getColumnTypes(attributes):
+	'''
+	Returns the NumPy type of the column of every attribute: doubles for the
+	numeric ones and value indices for the nominal ones (-1 when missing).
+	'''
+	types = []
+	for name, kind in attributes:
+		if kind.startswith('{'):
+			types.append('int8' if len(getNominalValues(kind)) < 1 << 7 else 'int32')
+		elif kind.lower() in ('numeric', 'real', 'integer'):
+			types.append('float64')
+		else:
+			raise ValueError('Attribute %s (%s) cannot be stored in columns' % (name, kind))
+	return types
+
+def readChunks(f, attributes):
+	'''
+	Parses the data lines of an ARFF stream, yielding its instances in chunks
+	of one column (array) per attribute.
+	'''
+	indices = []
+	for name, kind in attributes:
+		if kind.startswith('{'):
+			index = dict((v, i) for i, v in enumerate(getNominalValues(kind)))
+			index['?'] = -1
+			indices.append(index)
+		else:
+			indices.append(None)
+	types = getColumnTypes(attributes)
+	lines = []
+	for line in f:
+		line = line.strip()
+		if not line or line.startswith('%'):
+			continue
+		if line.startswith('{'):
+			raise ValueError('Sparse instances cannot be stored in columns')
+		lines.append(line)
+		if len(lines) == chunkSize:
+			yield parseLines(lines, indices, types)
+			lines = []
+	if lines:
+		yield parseLines(lines, indices, types)
+
+def parseLines(lines, indices, types):
+	rows = list(csv.reader(lines, quotechar="'", escapechar='\\', skipinitialspace=True))
+	for number, row in enumerate(rows):
+		if len(row) != len(types):
+			raise ValueError('Instance with %d values instead of %d: %s' % (len(row), len(types), lines[number]))
+	columns = []
+	for i, values in enumerate(zip(*rows)):
+		if indices[i] == None:
+			column = numpy.array(values)
+			column[column == '?'] = 'nan'
+			columns.append(column.astype(types[i]))
+		else:
+			try:
+				columns.append(numpy.array([indices[i][v] for v in values], dtype=types[i]))
+			except KeyError as e:
+				raise ValueError('Invalid value of attribute %d: %s' % (i + 1, e.args[0]))
+	return columns
+
+def writeColumnar(path, header, attributes, chunks):
+	'''
+	Writes a stream in the columnar format: a directory with its ARFF header,
+	a raw (memory-mappable) file per attribute and a JSON description of them.
+	The directory is replaced at once, when complete.
+	'''
+	types = getColumnTypes(attributes)
+	tmp = path.rstrip('/') + '.tmp'
+	if os.path.exists(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	with open(os.path.join(tmp, 'header.arff'), 'wb') as f:
+		f.write(header)
+	files = [open(os.path.join(tmp, '%d.bin' % i), 'wb') for i in range(len(attributes))]
+	rows = 0
+	for columns in chunks:
+		for f, column in zip(files, columns):
+			f.write(column.tobytes())
+		rows += len(columns[0])
+	for f in files:
+		f.close()
+	with open(os.path.join(tmp, 'columns.json'), 'w') as f:
+		json.dump({
+			'rows': rows,
+			'columns': [{'name': name, 'type': kind, 'dtype': dtype, 'file': '%d.bin' % i}
+						for i, ((name, kind), dtype) in enumerate(zip(attributes, types))]
+		}, f, indent=1)
+	if os.path.exists(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+def loadColumnar(path):
+	'''
+	Opens a columnar stream, returning its header, its attributes and one
+	read-only memory-mapped array per attribute.
+	'''
+	with open(os.path.join(path, 'columns.json')) as f:
+		description = json.load(f)
+	with open(os.path.join(path, 'header.arff'), 'rb') as f:
+		header = f.read()
+	attributes = [(str(c['name']), str(c['type'])) for c in description['columns']]
+	columns = []
+	for c in description['columns']:
+		if description['rows'] == 0:
+			columns.append(numpy.empty(0, dtype=c['dtype']))
+		else:
+			columns.append(numpy.memmap(os.path.join(path, c['file']), dtype=c['dtype'], mode='r',
+										shape=(description['rows'],)))
+	return header, attributes, columns
+
+def iterateStream(path):
+	'''
+	Returns the header, the attributes and an iterator over the chunks (one
+	array per attribute) of a stream, in any format.
+	'''
+	if getFormat(path) == 'columnar':
+		header, attributes, columns = loadColumnar(path)
+		rows = len(columns[0]) if columns else 0
+		chunks = ([c[i:i+chunkSize] for c in columns] for i in xrange(0, rows, chunkSize))
+		return header, attributes, chunks
+	f = openText(path)
+	header, attributes = readHeader(f)
+	return header, attributes, readChunks(f, attributes)
+
+def formatColumns(attributes, columns):
+	blocks = [c.reshape(-1, 1) if c.dtype.kind == 'f' else c for c in columns]
+	return formatChunk(attributes, blocks)
+
+def copyText(source, target):
+	while True:
+		block = source.read(1 << 20)
+		if not block:
+			break
+		target.write(block)
+
+def decode(path, out):
+	'''
+	Writes a stream, in any format, as ARFF text into a file object (e.g. the
+	standard output or a FIFO read by MOA).
+	'''
+	if getFormat(path) == 'columnar':
+		header, attributes, chunks = iterateStream(path)
+		# MOA (and Weka) leave a blank line after @data
+		out.write(header + '\n')
+		for columns in chunks:
+			out.write(formatColumns(attributes, columns))
+	else:
+		f = openText(path)
+		try:
+			copyText(f, out)
+		finally:
+			f.close()
+
+def convert(sourcePath, targetPath):
+	'''
+	Converts a stream between any two formats. Text is (de)compressed as it
+	is, without parsing it; the columnar format keeps the numbers as doubles,
+	which are written back with 6 decimals, like Weka does.
+	'''
+	if getFormat(targetPath) == 'columnar':
+		header, attributes, chunks = iterateStream(sourcePath)
+		writeColumnar(targetPath, header, attributes, chunks)
+		return
+	# write next to the target and rename, not to leave truncated streams behind
+	tmp = getStem(targetPath) + '.tmp' + targetPath[len(getStem(targetPath)):]
+	out = openText(tmp, 'wb')
+	try:
+		decode(sourcePath, out)
+	finally:
+		out.close()
+	os.rename(tmp, targetPath)
+
+def getPipedArgv(argv, feeds=[], sinks=[]):
+	'''
+	Wraps a command (argv) so that it reads encoded streams and writes encoded
+	outputs through FIFOs, without decoded copies on disk (see runPiped).
+	`feeds` are the (stream, FIFO) pairs that are decoded into the FIFOs read
+	by the command, and `sinks` the (FIFO, stream) pairs that encode what the
+	command writes.
+	'''
+	if not feeds and not sinks:
+		return argv
+	wrapper = shlex.split(convertCommand) + ['pipe']
+	for stream, fifo in feeds:
+		wrapper += ['--feed', stream, fifo]
+	for fifo, stream in sinks:
+		wrapper += ['--sink', fifo, stream]
+	return wrapper + ['--'] + argv
+
+def feedFifo(stream, fifo):
+	try:
+		with open(fifo, 'wb') as out:
+			decode(stream, out)
+	except IOError as e:
+		# the command (e.g. MOA) stopped reading before the end of the stream
+		if e.errno != errno.EPIPE:
+			raise
+
+def unblockFifo(fifo, flags):
+	'''
+	Opens and closes the other end of a FIFO, so that a thread still waiting
+	to open it (for a command that never will) goes on.
+	'''
+	try:
+		os.close(os.open(fifo, flags | os.O_NONBLOCK))
+	except OSError:
+		pass
+
+def startPipeThread(target, args, fifo, flags, failures):
+	'''
+	Starts a thread that decodes (or encodes) a stream through a FIFO. If it
+	fails, the other end of the FIFO is unblocked, so that the command goes
+	on (and fails) instead of waiting for it forever.
+	'''
+	def run():
+		try:
+			target(*args)
+		except Exception as e:
+			print >> sys.stderr, 'ERROR: %s' % e
+			failures.append(e)
+			unblockFifo(fifo, flags)
+	thread = threading.Thread(target=run)
+	thread.daemon = True
+	thread.start()
+	return thread
+
+def runPiped(argv, feeds=[], sinks=[]):
+	'''
+	Executes a command while decoding its feeds and encoding its sinks in
+	threads, through FIFOs. The decoders are not needed once the command is
+	done (it may not have read them to the end); the encoders are waited for
+	and, if the command (or a thread) failed, their incomplete outputs are
+	removed. Returns the exit code of the command, or 1 if a thread failed.
+	'''
+	fifos = [f for s, f in feeds] + [f for f, s in sinks]
+	for fifo in fifos:
+		if os.path.exists(fifo):
+			os.remove(fifo)
+		os.mkfifo(fifo)
+	for fifo, stream in sinks:
+		ensureDir(os.path.dirname(stream))
+	failures = []
+	threads = [startPipeThread(feedFifo, (stream, fifo), fifo, os.O_WRONLY, failures) for stream, fifo in feeds]
+	threads += [startPipeThread(convert, (fifo, stream), fifo, os.O_RDONLY, failures) for fifo, stream in sinks]
+	process = subprocess.Popen(argv)
+	# forward a termination to the command, not to leave it orphaned
+	signal.signal(signal.SIGTERM, lambda signum, frame: process.terminate())
+	try:
+		returncode = process.wait()
+		for stream, fifo in feeds:
+			unblockFifo(fifo, os.O_RDONLY)
+		for fifo, stream in sinks:
+			unblockFifo(fifo, os.O_WRONLY)
+		for thread in threads:
+			thread.join()
+		if returncode == 0 and failures:
+			returncode = 1
+		if returncode != 0:
+			for fifo, stream in sinks:
+				if os.path.isdir(stream):
+					shutil.rmtree(stream)
+				elif os.path.exists(stream):
+					os.remove(stream)
+	finally:
+		for fifo in fifos:
+			if os.path.exists(fifo):
+				os.remove(fifo)
+	return returncode
+
+def getFifo(name):
+	'''
+	The FIFO of a task, named after the host and the process that builds the
+	task too: two sweeps (or coordinators) may run the same task on a host.
+	'''
+	return os.path.join(fifoDir, 'moa-%s-%d-%s.arff' % (socket.gethostname(), os.getpid(),
+						re.sub(r'[^\w.-]', '_', name)))
+
+def getStreamFeeds(stream, name):
+	'''
+	Replaces the encoded files read by a MOA stream specification (e.g.
+	"ArffFileStream -f census.arff.gz -c 0") with FIFOs, named after the task.
+	Returns the new specification and the (file, FIFO) pairs to decode.
+	'''
+	feeds = []
+	def replace(match):
+		if not isEncoded(match.group(2)):
+			return match.group(0)
+		fifo = getFifo('%s.in%d' % (name, len(feeds)))
+		feeds.append((match.group(2), fifo))
+		return match.group(1) + fifo
+	return streamFileOption.sub(replace, stream), feeds
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import argparse
+import curses
+import os
+import progress
+import socket
+import sys
+import time
+from termcolor import colored
+
+# global flags
+refreshInterval = 1.0
+# seconds without an update after which a sweep that did not finish is stale
+staleTime = 30.0
+
+def isAlive(snapshot):
+	'''
+	Whether the process that writes the progress file still runs (it can only
+	be checked on its host).
+	'''
+	if snapshot['host'] != socket.gethostname():
+		return True
+	try:
+		os.kill(snapshot['pid'], 0)
+	except OSError:
+		return False
+	return True
+
+def getState(snapshot):
+	if snapshot['finished'] != None:
+		return 'finished'
+	if not isAlive(snapshot):
+		return 'stopped'
+	if time.time() - snapshot['updated'] > staleTime:
+		return 'stale'
+	return 'running'
+
+def formatRate(rate):
+	return '%.0f inst/s' % rate if rate != None else '-'
+
+def formatProcessed(task):
+	if task['processed'] == None:
+		return '-'
+	if task['instances'] == None:
+		return '%d' % task['processed']
+	return '%d/%d' % (task['processed'], task['instances'])
+
+def getLines(snapshot):
+	'''
+	Renders a snapshot of the progress file as lines of text, with the style
+	(a color, or None) of each of them.
+	'''
+	state = getState(snapshot)
+	counts = snapshot['counts']
+	lines = []
+	lines.append(('%s (%s:%d): %s, updated %s ago' % (snapshot['sweep'], snapshot['host'], snapshot['pid'], state,
+					progress.formatDuration(time.time() - snapshot['updated'])),
+				'green' if state in ('running', 'finished') else 'red'))
+	elapsed = (snapshot['finished'] or snapshot['updated']) - snapshot['started']
+	eta = snapshot['eta'] if state == 'running' else None
+	finish = ' (at %s)' % time.strftime('%H:%M', time.localtime(snapshot['updated'] + eta)) if eta != None else ''
+	workers = '%d worker(s)' % snapshot['workers'] if snapshot['workers'] else 'queue workers'
+	lines.append(('elapsed %s, ETA %s%s, %s, runtimes %.2fx the estimates' % (progress.formatDuration(elapsed),
+					progress.formatDuration(eta), finish, workers, snapshot['calibration']), None))
+	width = 50
+	done = int(round(width * snapshot['percent'] / 100.0))
+	lines.append(('[%s%s] %5.1f%%' % ('#' * done, '.' * (width - done), snapshot['percent']), None))
+	lines.append(('   '.join('%s %d' % (s, counts.get(s, 0)) for s in progress.states),
+				'red' if counts.get('failed') else None))
+	lines.append(('', None))
+	lines.append(('%-14s %-44s %9s %17s %13s %9s' % ('WORKER', 'TASK', 'ELAPSED', 'INSTANCES', 'RATE', 'ETA'),
+				'cyan'))
+	for task in sorted(snapshot['running'], key=lambda t: t['worker']):
+		lines.append(('%-14s %-44s %9s %17s %13s %9s' % (task['worker'][:14], task['name'][:44],
+						progress.formatDuration(task['elapsed']), formatProcessed(task), formatRate(task['rate']),
+						progress.formatDuration(task['eta'])), None))
+	if snapshot['failed']:
+		lines.append(('', None))
+		lines.append(('FAILED', 'red'))
+		for task in snapshot['failed']:
+			lines.append(('%-60s exit code %d' % (task['name'], task['returncode']), 'red'))
+	return lines
+
+def printSnapshot(snapshot):
+	for line, color in getLines(snapshot):
+		print colored(line, color) if color != None else line
+
+def drawDashboard(screen, progressFile):
+	curses.curs_set(0)
+	curses.use_default_colors()
+	styles = {None: curses.A_NORMAL}
+	for i, (name, color) in enumerate([('green', curses.COLOR_GREEN), ('red', curses.COLOR_RED),
+										('cyan', curses.COLOR_CYAN)], 1):
+		curses.init_pair(i, color, -1)
+		styles[name] = curses.color_pair(i)
+	screen.timeout(int(refreshInterval * 1000))
+	while True:
+		screen.erase()
+		height, width = screen.getmaxyx()
+		try:
+			lines = getLines(progress.readProgress(progressFile))
+		except (IOError, ValueError) as e:
+			lines = [('cannot read %s: %s' % (progressFile, e), 'red')]
+		lines.append(('', None))
+		lines.append(('press q to quit', None))
+		for y, (line, style) in enumerate(lines[:height]):
+			screen.addnstr(y, 0, line, width - 1, styles[style])
+		screen.refresh()
+		if screen.getch() in (ord('q'), ord('Q')):
+			return
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+						description='Shows a live dashboard of a sweep of anonymize.py or scalability.py, from the '+
+									'progress file they write (--progress): the tasks queued, running, done and '+
+									'failed, the task of each worker with its throughput, and the ETA.')
+	parser.add_argument('progress_file', help='the progress file (JSON) of the sweep')
+	parser.add_argument('-i', '--interval', type=float, default=refreshInterval,
+						help='the seconds between two refreshes of the dashboard')
+	parser.add_argument('-1', '--once', action='store_true',
+						help='print the progress once, as text, and exit (the default when not on a terminal)')
+	args = parser.parse_args()
+	refreshInterval = args.interval
+
+	if not os.path.isfile(args.progress_file):
+		print 'ERROR: the progress file %s does not exist' % args.progress_file
+		sys.exit(1)
+	if args.once or not sys.stdout.isatty():
+		printSnapshot(progress.readProgress(args.progress_file))
+	else:
+		try:
+			curses.wrapper(drawDashboard, args.progress_file)
+		except KeyboardInterrupt:
+			pass
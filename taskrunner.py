@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+from collections import deque, namedtuple
+import errno
+import multiprocessing
+import os
+import pipes
+import resourceprofiler
+from subprocess import Popen, STDOUT
+import threading
+import time
+from termcolor import colored
+
+# a task to be executed by the runner: its command (an argv list, executed
+#  directly, or a shell command), the file where its output (both stdout and
+#  stderr) is logged, its estimated memory (MB), the file where its resource
+#  usage is sampled (if profiled) and the shell that runs a shell command
+#  (/bin/sh by default)
+Task = namedtuple('Task', 'name cmd logFile memory profileFile executable')
+Task.__new__.__defaults__ = (None, None, None)
+
+# the outcome of an executed task (maxrss is the peak resident memory, in MB,
+#  and peaks the resourceprofiler.Peaks of a profiled task)
+Result = namedtuple('Result', 'task returncode elapsed maxrss peaks')
+
+# a task that is currently being executed (on a set of CPUs, if pinned), and
+#  the Reaper that waits for its process
+Running = namedtuple('Running', 'task process log start profiler cpus reaper')
+
+# seconds to wait between checks of the running tasks
+pollInterval = 0.5
+
+def ensureDir(path):
+	'''
+	Creates a directory (and its parents) unless it exists, even if another
+	process (e.g. a worker of the same queue) creates it at the same time.
+	'''
+	if not path:
+		return
+	try:
+		os.makedirs(path)
+	except OSError as e:
+		if e.errno != errno.EEXIST or not os.path.isdir(path):
+			raise
+
+def getCpuSets(workers):
+	'''
+	Splits the CPUs of the host into disjoint sets (e.g. "0-3"), one for each
+	worker, so that concurrent tasks do not compete for the same CPUs.
+	'''
+	cpus = multiprocessing.cpu_count()
+	size = cpus // workers
+	if size == 0:
+		raise ValueError('cannot pin %d workers to disjoint sets of the %d CPUs' % (workers, cpus))
+	return ['%d-%d' % (i * size, (i + 1) * size - 1) for i in range(workers)]
+
+def isShellCmd(cmd):
+	return isinstance(cmd, basestring)
+
+def formatCmd(cmd):
+	'''
+	Returns a command as it would be typed in a shell, to be printed.
+	'''
+	if isShellCmd(cmd):
+		return cmd
+	return ' '.join(pipes.quote(arg) for arg in cmd)
+
+def pinCmd(cmd, cpus):
+	if isShellCmd(cmd):
+		return 'taskset -c %s %s' % (cpus, cmd)
+	return ['taskset', '-c', cpus] + cmd
+
+def startTask(task, cpus=None):
+	log = None
+	if task.logFile != None:
+		ensureDir(os.path.dirname(task.logFile))
+		log = open(task.logFile, 'w')
+	if task.profileFile != None:
+		# where the profile and the GC log of the JVM are written
+		ensureDir(os.path.dirname(task.profileFile))
+	cmd = task.cmd if cpus == None else pinCmd(task.cmd, cpus)
+	shell = isShellCmd(cmd)
+	process = Popen(cmd, shell=shell, executable=task.executable if shell else None, stdout=log, stderr=STDOUT)
+	print colored('[STARTED]', 'green'), task.name, '(pid %d%s)' % (process.pid, ', CPUs ' + cpus if cpus else '')
+	start = time.time()
+	profiler = None
+	if task.profileFile != None:
+		profiler = resourceprofiler.startProfiler(process.pid, task.profileFile)
+	return Running(task=task, process=process, log=log, start=start, profiler=profiler, cpus=cpus,
+				reaper=startReaper(process))
+
+def decodeStatus(status):
+	if os.WIFSIGNALED(status):
+		return -os.WTERMSIG(status)
+	return os.WEXITSTATUS(status)
+
+class Reaper(threading.Thread):
+	'''
+	Waits for a process in the background, recording when it ends (not when
+	the running tasks happen to be checked), its exit code and its peak
+	resident memory in MB (including the JVM forked by a wrapper, if any).
+	'''
+	def __init__(self, process):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.process = process
+		self.end = None
+		self.maxrss = None
+
+	def run(self):
+		pid, status, usage = os.wait4(self.process.pid, 0)
+		self.end = time.time()
+		self.maxrss = usage.ru_maxrss / 1024.0 # ru_maxrss is in KB
+		self.process.returncode = decodeStatus(status)
+
+def startReaper(process):
+	reaper = Reaper(process)
+	reaper.start()
+	return reaper
+
+def waitTask(reaper, timeout=0):
+	'''
+	Waits up to `timeout` seconds (forever if None) for the process of a
+	reaper to end, returning its exit code and its peak resident memory in
+	MB, or (None, None) if the process has not finished yet.
+	'''
+	if timeout == None:
+		# an endless join can't be interrupted (Ctrl-C), unlike timed ones
+		while reaper.is_alive():
+			reaper.join(pollInterval)
+	elif timeout > 0:
+		reaper.join(timeout)
+	if reaper.is_alive():
+		return None, None
+	return reaper.process.returncode, reaper.maxrss
+
+def finishTask(running, returncode, maxrss):
+	if running.log != None:
+		running.log.close()
+	elapsed = running.reaper.end - running.start
+	peaks = resourceprofiler.stopProfiler(running.profiler)
+	if returncode == 0:
+		print colored('[DONE]', 'green'), running.task.name, '(%.1fs, %dMB)' % (elapsed, maxrss)
+		if peaks != None:
+			print colored('[PROFILED]', 'green'), running.task.name, \
+					'(peak %.0f%% CPU, %.0fMB, %d threads, %d GC pauses for %.0fms)' \
+					% (peaks.cpu, peaks.rss, peaks.threads, peaks.gcPauses, peaks.gcPauseTime)
+	else:
+		print colored('[FAILED]', 'red'), running.task.name, \
+				'(exit code %d, log: %s)' % (returncode, running.task.logFile)
+	return Result(task=running.task, returncode=returncode, elapsed=elapsed, maxrss=maxrss, peaks=peaks)
+
+def killAll(running):
+	for r in running:
+		if r.reaper.is_alive():
+			r.process.terminate()
+		waitTask(r.reaper, None)
+		if r.log != None:
+			r.log.close()
+		resourceprofiler.stopProfiler(r.profiler)
+
+def runAndMeasure(cmd, executable=None, profileFile=None, onPoll=None):
+	'''
+	Executes a command (argv or shell, see Task) in the foreground, returning
+	its exit code, its peak resident memory in MB and, if a profile file is
+	given (where its resource usage is sampled), its resourceprofiler.Peaks.
+	The `onPoll` callback, if any, is called every pollInterval seconds while
+	the command runs.
+	'''
+	if profileFile != None:
+		ensureDir(os.path.dirname(profileFile))
+	shell = isShellCmd(cmd)
+	process = Popen(cmd, shell=shell, executable=executable if shell else None)
+	reaper = startReaper(process)
+	profiler = None
+	if profileFile != None:
+		profiler = resourceprofiler.startProfiler(process.pid, profileFile)
+	try:
+		if onPoll == None:
+			returncode, maxrss = waitTask(reaper, None)
+		else:
+			returncode, maxrss = waitTask(reaper)
+			while returncode == None:
+				onPoll()
+				returncode, maxrss = waitTask(reaper, pollInterval)
+	finally:
+		peaks = resourceprofiler.stopProfiler(profiler)
+	return returncode, maxrss, peaks
+
+def nextAdmissible(pending, running, memoryBudget):
+	'''
+	Picks (and removes) the first pending task whose estimated memory fits in
+	what is left of the memory budget, or None if no task fits. A task that
+	does not fit the whole budget is still admitted when nothing else runs.
+	'''
+	if memoryBudget == None:
+		return pending.popleft()
+	used = sum(r.task.memory or 0 for r in running)
+	for i, task in enumerate(pending):
+		if used + (task.memory or 0) <= memoryBudget:
+			del pending[i]
+			return task
+	if not running:
+		task = pending.popleft()
+		print colored('[WARNING]', 'yellow'), task.name, \
+				'needs %dMB, over the %dMB memory budget' % (task.memory, memoryBudget)
+		return task
+	return None
+
+def runTasks(tasks, workers, memoryBudget=None, onFinish=None, cpuSets=None, onStart=None, onPoll=None):
+	'''
+	Executes the given tasks, never running more than `workers` of them at the
+	same time and, if a memory budget (MB) is given, only admitting tasks while
+	the sum of their estimated memory stays under it. The `onFinish` callback
+	is called with the result of each task as soon as it finishes, and may
+	return more tasks to execute. If CPU sets are given (see getCpuSets), each
+	task is pinned to one that no other running task uses. The `onStart`
+	callback is called with each Running task, and `onPoll` after every check
+	of the running tasks. Returns the list of results, in order of completion.
+	'''
+	pending = deque(tasks)
+	running = []
+	results = []
+	try:
+		while pending or running:
+			# fill the free slots of the pool
+			while pending and len(running) < workers:
+				task = nextAdmissible(pending, running, memoryBudget)
+				if task == None:
+					break
+				cpus = None
+				if cpuSets != None:
+					used = set(r.cpus for r in running)
+					cpus = next(c for c in cpuSets if c not in used)
+				running.append(startTask(task, cpus))
+				if onStart != None:
+					onStart(running[-1])
+			# collect the finished tasks
+			stillRunning = []
+			for r in running:
+				returncode, maxrss = waitTask(r.reaper)
+				if returncode == None:
+					stillRunning.append(r)
+				else:
+					result = finishTask(r, returncode, maxrss)
+					results.append(result)
+					if onFinish != None:
+						pending.extend(onFinish(result) or [])
+			running = stillRunning
+			if onPoll != None:
+				onPoll()
+			if running:
+				time.sleep(pollInterval)
+	except KeyboardInterrupt:
+		print colored('[ABORTING]', 'red'), 'killing %d running task(s)' % len(running)
+		killAll(running)
+		raise
+	return results
+
+def printSummary(results):
+	failed = [r for r in results if r.returncode != 0]
+	elapsed = sum(r.elapsed for r in results)
+	print ''
+	print colored('[SUMMARY]', 'green'), '%d task(s) executed, %d succeeded, %d failed (%.1fs of task time)' \
+			% (len(results), len(results) - len(failed), len(failed), elapsed)
+	for r in failed:
+		print '   ', colored('exit code %d' % r.returncode, 'red'), r.task.name, '->', r.task.logFile
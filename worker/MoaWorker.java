@@ -0,0 +1,52 @@
+import java.io.BufferedReader;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+
+import moa.options.ClassOption;
+import moa.tasks.StandardTaskMonitor;
+import moa.tasks.Task;
+
+/**
+ * Warm MOA worker: executes moa.DoTask-like tasks back-to-back in the same JVM,
+ * so that the JVM startup, class loading and JIT warm-up are only paid once.
+ *
+ * Tasks are read from stdin, one per line, as three tab-separated fields: the
+ * file where the task stdout is written, the file where its stderr is written
+ * and the task command line (e.g. "Anonymize -s (...) -f (...) -m 1000").
+ * After each task, its exit code (0 on success, 1 on failure) is written as a
+ * line to stdout. The worker exits when stdin is closed.
+ */
+public class MoaWorker {
+
+	public static void main(String[] args) throws IOException {
+		PrintStream protocol = System.out;
+		PrintStream stderr = System.err;
+		BufferedReader in = new BufferedReader(new InputStreamReader(System.in));
+		String line;
+		while ((line = in.readLine()) != null) {
+			String[] request = line.split("\t", 3);
+			PrintStream out = new PrintStream(new FileOutputStream(request[0]), true);
+			PrintStream err = new PrintStream(new FileOutputStream(request[1]), true);
+			int status = 0;
+			System.setOut(out);
+			System.setErr(err);
+			try {
+				Task task = (Task) ClassOption.cliStringToObject(request[2], Task.class, null);
+				Object result = task.doTask(new StandardTaskMonitor(), null);
+				out.println(result);
+			} catch (Throwable t) {
+				t.printStackTrace(err);
+				status = 1;
+			} finally {
+				System.setOut(protocol);
+				System.setErr(stderr);
+				out.close();
+				err.close();
+			}
+			protocol.println(status);
+			protocol.flush();
+		}
+	}
+}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from taskrunner import Task, Result
+from termcolor import colored
+
+# seconds a claimed task stays leased to its worker without a heartbeat
+leaseTime = 60
+
+# times a task is leased before it is failed, when its workers keep vanishing
+maxAttempts = 3
+
+# seconds between two checks of the queue (coordinator and idle workers)
+pollInterval = 2.0
+
+# columns of the tasks table that describe the Task to execute
+taskColumns = ['name', 'cmd', 'logFile', 'memory', 'profileFile', 'executable']
+
+def getWorkerId():
+	return '%s:%d' % (socket.gethostname(), os.getpid())
+
+def encodeTask(task):
+	# the command is stored as JSON: an argv list or a shell command string
+	return list(task._replace(cmd=json.dumps(task.cmd)))
+
+def decodeTask(row):
+	task = Task(*row)
+	cmd = json.loads(task.cmd)
+	if isinstance(cmd, list):
+		return task._replace(cmd=[arg.encode('utf-8') for arg in cmd])
+	return task._replace(cmd=cmd.encode('utf-8'))
+
+def openQueue(path):
+	'''
+	Opens (or creates) a work queue. The queue is a SQLite database that can be
+	kept on storage shared by several hosts, as long as it supports file locks.
+	'''
+	queue = sqlite3.connect(path, timeout=120, isolation_level=None)
+	queue.execute('''CREATE TABLE IF NOT EXISTS tasks (
+						position INTEGER PRIMARY KEY,
+						name TEXT UNIQUE,
+						cmd TEXT,
+						logFile TEXT,
+						memory REAL,
+						profileFile TEXT,
+						executable TEXT,
+						status TEXT,
+						worker TEXT,
+						expires REAL,
+						attempts INTEGER,
+						returncode INTEGER,
+						elapsed REAL,
+						maxrss REAL,
+						collected INTEGER)''')
+	queue.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status)')
+	return queue
+
+def transaction(queue):
+	# take the write lock up front, so that two workers never claim the same task
+	queue.execute('BEGIN IMMEDIATE')
+
+def enqueue(queue, tasks):
+	'''
+	Adds tasks to the queue, in order. Tasks that were already finished are
+	queued again; the ones still pending or leased (e.g. by the workers of an
+	interrupted coordinator) are left as they are.
+	'''
+	transaction(queue)
+	try:
+		for task in tasks:
+			row = queue.execute('SELECT status FROM tasks WHERE name = ?', (task.name,)).fetchone()
+			if row != None and row[0] in ('pending', 'leased'):
+				continue
+			queue.execute('DELETE FROM tasks WHERE name = ?', (task.name,))
+			queue.execute('INSERT INTO tasks (%s, status, attempts, collected) VALUES (%s, ?, 0, 0)' \
+					% (','.join(taskColumns), ','.join('?' * len(taskColumns))),
+					encodeTask(task) + ['pending'])
+		queue.execute('COMMIT')
+	except:
+		queue.execute('ROLLBACK')
+		raise
+
+def requeueExpired(queue):
+	'''
+	Releases the leases that were not renewed in time (their worker died or
+	lost its connection to the queue), failing the tasks leased too many times.
+	Must be called within a transaction.
+	'''
+	now = time.time()
+	expired = queue.execute('SELECT name, worker, attempts FROM tasks WHERE status = ? AND expires < ?',
+							('leased', now)).fetchall()
+	for name, worker, attempts in expired:
+		if attempts >= maxAttempts:
+			print colored('[EXPIRED]', 'red'), name, '(leased %d times, last by %s): failed' % (attempts, worker)
+			queue.execute('UPDATE tasks SET status = ?, returncode = ? WHERE name = ?', ('failed', -1, name))
+		else:
+			print colored('[EXPIRED]', 'yellow'), name, '(leased by %s): requeued' % worker
+			queue.execute('UPDATE tasks SET status = ?, worker = NULL, expires = NULL WHERE name = ?',
+						('pending', name))
+
+def claim(queue, workerId):
+	'''
+	Leases the first pending task to a worker, returning it, or None if no
+	task can be claimed now.
+	'''
+	transaction(queue)
+	try:
+		requeueExpired(queue)
+		row = queue.execute('SELECT %s FROM tasks WHERE status = ? ORDER BY position LIMIT 1' \
+							% ','.join(taskColumns), ('pending',)).fetchone()
+		if row != None:
+			queue.execute('UPDATE tasks SET status = ?, worker = ?, expires = ?, attempts = attempts + 1 WHERE name = ?',
+						('leased', workerId, time.time() + leaseTime, row[0]))
+		queue.execute('COMMIT')
+	except:
+		queue.execute('ROLLBACK')
+		raise
+	return decodeTask(row) if row != None else None
+
+def heartbeat(queue, name, workerId):
+	'''
+	Renews the lease of a task. Returns False if the worker no longer holds it
+	(it expired and was requeued), in which case the task must be abandoned.
+	'''
+	cursor = queue.execute('UPDATE tasks SET expires = ? WHERE name = ? AND worker = ? AND status = ?',
+						(time.time() + leaseTime, name, workerId, 'leased'))
+	return cursor.rowcount == 1
+
+def release(queue, name, workerId):
+	'''
+	Gives a leased task back to the queue (e.g. when its worker is stopped).
+	'''
+	queue.execute('UPDATE tasks SET status = ?, worker = NULL, expires = NULL, attempts = attempts - 1 '+
+				'WHERE name = ? AND worker = ? AND status = ?', ('pending', name, workerId, 'leased'))
+
+def complete(queue, result, workerId):
+	'''
+	Records the result of a leased task. Returns False if the worker no longer
+	held the lease, in which case the result is discarded.
+	'''
+	status = 'done' if result.returncode == 0 else 'failed'
+	cursor = queue.execute('UPDATE tasks SET status = ?, returncode = ?, elapsed = ?, maxrss = ?, expires = NULL '+
+						'WHERE name = ? AND worker = ? AND status = ?',
+						(status, result.returncode, result.elapsed, result.maxrss, result.task.name, workerId, 'leased'))
+	return cursor.rowcount == 1
+
+def getLeases(queue):
+	'''
+	Returns the leased tasks, as (task name, worker) pairs.
+	'''
+	return queue.execute('SELECT name, worker FROM tasks WHERE status = ?', ('leased',)).fetchall()
+
+def getCounts(queue):
+	return dict(queue.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+def collect(queue, names):
+	'''
+	Returns the results of the given tasks that finished since the last call,
+	marking them as collected.
+	'''
+	transaction(queue)
+	try:
+		rows = queue.execute('SELECT %s, returncode, elapsed, maxrss FROM tasks WHERE collected = 0 AND status IN (?, ?)' \
+							% ','.join(taskColumns), ('done', 'failed')).fetchall()
+		results = []
+		for row in rows:
+			if row[0] in names:
+				task = decodeTask(row[:len(taskColumns)])
+				returncode, elapsed, maxrss = row[len(taskColumns):]
+				results.append(Result(task=task, returncode=returncode, elapsed=elapsed or 0.0,
+									maxrss=maxrss or 0.0, peaks=None))
+				queue.execute('UPDATE tasks SET collected = 1 WHERE name = ?', (task.name,))
+		queue.execute('COMMIT')
+	except:
+		queue.execute('ROLLBACK')
+		raise
+	return results
+
+def waitForTasks(queue, tasks, onFinish=None, onPoll=None):
+	'''
+	Waits until the workers have executed the given (already queued) tasks,
+	calling `onFinish` with the result of each of them as soon as it is
+	collected, and `onPoll` with the current leases (see getLeases) after
+	every check of the queue. Returns the list of results, in order of
+	collection.
+	'''
+	names = set(task.name for task in tasks)
+	results = []
+	lastCounts = None
+	while len(results) < len(names):
+		for result in collect(queue, names):
+			if result.returncode == 0:
+				print colored('[DONE]', 'green'), result.task.name, '(%.1fs, %dMB)' % (result.elapsed, result.maxrss)
+			else:
+				print colored('[FAILED]', 'red'), result.task.name, \
+						'(exit code %d, log: %s)' % (result.returncode, result.task.logFile)
+			results.append(result)
+			if onFinish != None:
+				onFinish(result)
+		counts = getCounts(queue)
+		if counts != lastCounts:
+			print colored('[QUEUE]', 'green'), ', '.join('%d %s' % (n, s) for s, n in sorted(counts.items()))
+			lastCounts = counts
+		if onPoll != None:
+			onPoll(getLeases(queue))
+		if len(results) < len(names):
+			time.sleep(pollInterval)
+	return results